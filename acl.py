@@ -0,0 +1,155 @@
+"""
+Access-control index for apps.
+
+Every app-scoped request needs to know which apps a user may see. Instead of
+loading the user and scanning `app_shares` on each request, the visible app
+set for a user (owned apps + shares + role grants) is computed once and cached
+in process.
+
+Cached sets are tagged with a global ACL version stored in MongoDB
+(`database.bump_acl_version`). Sharing, ownership and role changes bump the
+version, which clears this process's cache immediately; other processes pick
+up the new version within ACL_VERSION_CHECK_SECONDS.
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+
+import database as db
+
+# How often the shared ACL version is re-read (seconds)
+ACL_VERSION_CHECK_SECONDS = float(os.environ.get('ACL_VERSION_CHECK_SECONDS', '2'))
+
+# Maximum number of users whose access sets are kept in memory
+ACL_CACHE_SIZE = int(os.environ.get('ACL_CACHE_SIZE', '1000'))
+
+_lock = threading.Lock()
+_cache = OrderedDict()  # username -> access entry
+_version = None
+_version_checked_at = 0.0
+
+def _current_version():
+    """Return the ACL version, re-reading it from the database when the check interval has passed"""
+    global _version, _version_checked_at
+
+    now = time.monotonic()
+    with _lock:
+        if _version is not None and now - _version_checked_at < ACL_VERSION_CHECK_SECONDS:
+            return _version
+
+    version = db.get_acl_version()
+    with _lock:
+        if version != _version:
+            _cache.clear()
+            _version = version
+        _version_checked_at = now
+        return _version
+
+def _load_access(username):
+    """
+    Compute the access entry for a user from the database
+
+    Returns:
+        dict: {'role': str or None, 'all_apps': bool, 'app_ids': frozenset}
+    """
+    user = db.users_collection.find_one({'username': username}, {'_id': 0, 'role': 1})
+    if not user:
+        return {'role': None, 'all_apps': False, 'app_ids': frozenset()}
+
+    role = user.get('role')
+    if role == 'admin':
+        return {'role': role, 'all_apps': True, 'app_ids': frozenset()}
+
+    # Apps shared with the user
+    app_ids = {
+        share['app_id']
+        for share in db.app_shares_collection.find({'username': username}, {'_id': 0, 'app_id': 1})
+    }
+
+    # Developers also see the apps they own
+    if role == 'developer':
+        app_ids.update(
+            app['id']
+            for app in db.apps_collection.find({'owner': username}, {'_id': 0, 'id': 1})
+        )
+
+    return {'role': role, 'all_apps': False, 'app_ids': frozenset(app_ids)}
+
+def get_access(username):
+    """
+    Get the cached access entry for a user
+
+    Args:
+        username (str): The username
+
+    Returns:
+        dict: {'role': str or None, 'all_apps': bool, 'app_ids': frozenset}
+    """
+    version = _current_version()
+
+    with _lock:
+        entry = _cache.get(username)
+        if entry is not None:
+            _cache.move_to_end(username)
+            return entry
+
+    entry = _load_access(username)
+
+    with _lock:
+        # Don't cache an entry computed while the version changed underneath it
+        if version == _version:
+            _cache[username] = entry
+            _cache.move_to_end(username)
+            while len(_cache) > ACL_CACHE_SIZE:
+                _cache.popitem(last=False)
+
+    return entry
+
+def visible_app_ids(username):
+    """
+    Get the ids of the apps a user sees in app listings
+
+    Args:
+        username (str): The username
+
+    Returns:
+        frozenset or None: App ids, or None if the user can see every app (admins)
+    """
+    entry = get_access(username)
+    if entry['all_apps']:
+        return None
+    return entry['app_ids']
+
+def can_access(username, app_ids):
+    """
+    Check access to several apps at once
+
+    Admins and developers may open any app; testers only apps shared with them.
+
+    Args:
+        username (str): The username
+        app_ids (list): App ids to check
+
+    Returns:
+        dict: Maps each app id to True or False
+    """
+    entry = get_access(username)
+    if entry['role'] in ('admin', 'developer'):
+        return {app_id: True for app_id in app_ids}
+    return {app_id: app_id in entry['app_ids'] for app_id in app_ids}
+
+def invalidate(version=None):
+    """
+    Drop all cached access entries in this process
+
+    Args:
+        version (int, optional): The new ACL version, if known
+    """
+    global _version, _version_checked_at
+
+    with _lock:
+        _cache.clear()
+        _version = version
+        _version_checked_at = time.monotonic() if version is not None else 0.0
@@ -22,25 +22,21 @@ def add_release_notes_to_apps():
                 
                 # Generate default release notes
                 release_notes = f"Initial release of {app_name} {app_version}."
-                app['release_notes'] = release_notes
-                
                 # Update app in database
-                db.save_app(app)
+                db.update_app(app_id, {'release_notes': release_notes})
                 updated_count += 1
                 print(f"Added release notes to {app_name} (v{app_version})")
             
             # Also check all versions for release notes
-            versions = app.get('versions', [])
+            versions = db.get_all_app_versions(app.get('id'))
             for version in versions:
                 if not version.get('release_notes'):
                     version_num = version.get('version', 'Unknown')
                     
                     # Generate default release notes for this version
-                    version['release_notes'] = f"Update to version {version_num}."
+                    db.update_app_version(version['id'], {'release_notes': f"Update to version {version_num}."})
             
-            # Save the app with updated versions
             if versions:
-                db.save_app(app)
                 print(f"Updated {len(versions)} version(s) for {app.get('name')}")
         
         print(f"\nUpdate complete. Added release notes to {updated_count} apps.")
@@ -46,26 +46,25 @@ def add_test_release_note():
 Thank you for using {app_name}! Please report any issues to our support team."""
 
         # Update the app with the test release notes
-        app['release_notes'] = test_release_notes
-        db.save_app(app)
+        db.update_app(app_id, {'release_notes': test_release_notes})
         
         # Also add test release notes to the first version if available
-        versions = app.get('versions', [])
+        versions = db.get_all_app_versions(app.get('id'))
         if versions:
-            version = versions[0]
+            version = versions[-1]
             version_num = version.get('version', 'Unknown')
             
             # Create a different release note for the version
             version_date = datetime.now().strftime("%b %d")
-            version['release_notes'] = f"""Version {version_num} ({version_date})
+            version_notes = f"""Version {version_num} ({version_date})
             
 - Initial version release
 - Core functionality implemented
 - Basic user interface
 - Essential features only"""
             
-            # Save the app with updated version
-            db.save_app(app)
+            # Save the updated version
+            db.update_app_version(version['id'], {'release_notes': version_notes})
             print(f"Updated release notes for version {version_num}")
         
         print(f"\nSuccessfully added test release notes to {app_name}")
@@ -1,7 +1,6 @@
 import os
 import logging
 import threading
-import time
 from flask import Flask, render_template, session, g, redirect, url_for
 from dotenv import load_dotenv
 
@@ -14,100 +13,122 @@ from routes.app_routes import app_bp
 from routes.build_routes import build_bp
 from routes.api_routes import api_bp
 from routes.notification_routes import notification_bp
-from models import check_abandoned_builds
+import models  # Registers the job handlers
 import database as db
+import jobs
+import schema
 
-# Create Flask app
-app = Flask(__name__)
-app.secret_key = os.environ.get('SECRET_KEY', 'development-key')
-app.config['MAX_CONTENT_LENGTH'] = 500 * 1024 * 1024  # 500 MB max upload size
-
-# Register blueprints
-app.register_blueprint(auth_bp)
-app.register_blueprint(app_bp)
-app.register_blueprint(build_bp)
-app.register_blueprint(api_bp)
-app.register_blueprint(notification_bp, url_prefix='/api')
-
-# Root route redirects to app index
-@app.route('/')
-def index():
-    return redirect(url_for('app.index'))
-
-# Template filter for formatting dates
-@app.template_filter('format_date')
-def format_date(date_string):
+# Background work this process runs, comma separated: 'scheduler' (queues
+# periodic jobs and recovers jobs of crashed workers) and 'jobs' (job workers).
+# Empty by default: web processes and serverless functions only serve
+# requests, and worker.py runs the background work.
+BACKGROUND_ROLES = [role.strip() for role in os.environ.get('BACKGROUND_ROLES', '').split(',') if role.strip()]
+
+_background_started = set()
+_background_lock = threading.Lock()
+
+def start_background_work(roles=None):
     """
-    Format ISO date strings to DD-MMM-YYYY format
-    Example: 2023-04-15T10:30:00 -> 15-Apr-2023
+    Start background work in this process, each role at most once
+    
+    Args:
+        roles (list, optional): 'scheduler' and/or 'jobs' (defaults to BACKGROUND_ROLES)
     """
-    if not date_string:
-        return "N/A"
-    try:
-        # Parse the ISO format date
-        if 'T' in date_string:
-            date_part = date_string.split('T')[0]
-        else:
-            date_part = date_string
-            
-        # Parse the date part
-        year, month, day = map(int, date_part.split('-'))
-        
-        # Format to DD-MMM-YYYY
-        months = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
-        return f"{day:02d}-{months[month-1]}-{year}"
-    except Exception as e:
-        logging.warning(f"Error formatting date '{date_string}': {str(e)}")
-        return date_string
-
-# Global request handler
-@app.before_request
-def load_logged_in_user():
-    username = session.get('username')
-    if username is None:
-        g.user = None
-        g.unread_notifications = 0
-    else:
-        g.user = db.get_user(username)
-        g.unread_notifications = db.get_unread_notification_count(username)
-
-# Error handlers
-@app.errorhandler(404)
-def page_not_found(e):
-    return render_template('404.html'), 404
-
-@app.errorhandler(500)
-def server_error(e):
-    return render_template('500.html'), 500
-
-# Background tasks
-def background_tasks():
-    """Run background tasks periodically"""
-    while True:
-        try:
-            check_abandoned_builds()
-        except Exception as e:
-            logging.error(f"Error in background task: {str(e)}")
-        
-        # Sleep for 5 minutes
-        time.sleep(300)
-
-# Initialize database and start background tasks
-def initialize_app():
-    # Initialize database
-    db.initialize_db()
+    roles = BACKGROUND_ROLES if roles is None else roles
     
-    # Start background tasks in a separate thread
-    bg_thread = threading.Thread(target=background_tasks)
-    bg_thread.daemon = True
-    bg_thread.start()
+    with _background_lock:
+        if 'scheduler' in roles and 'scheduler' not in _background_started:
+            jobs.start_scheduler()
+            _background_started.add('scheduler')
+        
+        if 'jobs' in roles and 'jobs' not in _background_started:
+            # Start workers for queued jobs (uploads, builds, notifications, sweeps)
+            jobs.start_workers()
+            _background_started.add('jobs')
     
-    logging.info("App initialized successfully")
+    if roles:
+        logging.info(f"Background work started: {', '.join(sorted(_background_started))}")
+
+def create_app(background_roles=None):
+    """
+    Create the Flask app
 
-# Initialize when the app starts
-initialize_app()
+    Creating the app doesn't touch MongoDB: the connection opens on the first
+    query and default data is created on the first request. Indexes are
+    created by migrate.py.
+
+    Args:
+        background_roles (list, optional): Background work to start (defaults to BACKGROUND_ROLES)
+
+    Returns:
+        Flask: The app
+    """
+    app = Flask(__name__)
+    app.secret_key = os.environ.get('SECRET_KEY', 'development-key')
+    app.config['MAX_CONTENT_LENGTH'] = 500 * 1024 * 1024  # 500 MB max upload size
+
+    # Stored UTC datetimes are sent as ISO 8601 strings (e.g. 2024-04-15T10:30:00Z)
+    app.json.default = schema.json_default
+
+    # Register blueprints
+    app.register_blueprint(auth_bp)
+    app.register_blueprint(app_bp)
+    app.register_blueprint(build_bp)
+    app.register_blueprint(api_bp)
+    app.register_blueprint(notification_bp, url_prefix='/api')
+
+    # Root route redirects to app index
+    @app.route('/')
+    def index():
+        return redirect(url_for('app.index'))
+
+    # Template filter for formatting dates
+    @app.template_filter('format_date')
+    def format_date(value):
+        """
+        Format a stored UTC datetime (or a legacy ISO date string) to DD-MMM-YYYY format
+        Example: 2023-04-15T10:30:00 -> 15-Apr-2023
+        """
+        if not value:
+            return "N/A"
+        dt = schema.parse_timestamp(value)
+        if dt is None:
+            logging.warning(f"Error formatting date '{value}'")
+            return value
+        return dt.strftime('%d-%b-%Y')
+
+    # Global request handler
+    @app.before_request
+    def load_logged_in_user():
+        # Default data is created by the first request of each process
+        db.bootstrap()
+
+        username = session.get('username')
+        if username is None:
+            g.user = None
+            g.unread_notifications = 0
+        else:
+            g.user = db.get_user(username)
+            g.unread_notifications = db.get_unread_notification_count(username)
+
+    # Error handlers
+    @app.errorhandler(404)
+    def page_not_found(e):
+        return render_template('404.html'), 404
+
+    @app.errorhandler(500)
+    def server_error(e):
+        return render_template('500.html'), 500
+
+    start_background_work(background_roles)
+    return app
+
+app = create_app()
 
 # Main entry point
 if __name__ == '__main__':
+    # The development server runs all background work in the same process
+    start_background_work(['scheduler', 'jobs'])
+
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug='true', ssl_context=('cert.pem', 'key.pem')) 
\ No newline at end of file
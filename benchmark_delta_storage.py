@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# Benchmark for delta storage of successive app versions
+#
+# Builds synthetic version histories (assets that rarely change, an executable
+# and Info.plist that change every version), splits each IPA into ZIP segments
+# the way database.store_file_as_delta does and compares the bytes stored with
+# whole-file storage. Every IPA is reassembled from its segments and checked
+# byte for byte. No database is needed.
+#
+# Usage:
+#   python3 ./benchmark_delta_storage.py [--apps 50] [--versions 10] [--assets 20] [--asset-kb 512]
+
+import argparse
+import hashlib
+import io
+import plistlib
+import random
+import sys
+import zipfile
+
+from utils.zip_delta import split_zip, iter_segment, MIN_DELTA_MEMBER_SIZE
+
+def random_bytes(rng, size):
+    """Incompressible bytes, like compiled code and compressed assets"""
+    return rng.getrandbits(size * 8).to_bytes(size, 'little')
+
+def build_ipa(app_index, version, assets, executable_kb):
+    """Build one synthetic IPA in memory"""
+    info = {
+        'CFBundleIdentifier': f'com.example.delta{app_index}',
+        'CFBundleShortVersionString': f'1.{version}',
+        'CFBundleVersion': str(version),
+        'CFBundleName': f'Delta {app_index}'
+    }
+    # The executable changes with every version
+    executable = random_bytes(random.Random(f'{app_index}:{version}'), executable_kb * 1024)
+
+    ipa = io.BytesIO()
+    with zipfile.ZipFile(ipa, 'w', zipfile.ZIP_DEFLATED) as archive:
+        prefix = f'Payload/Delta{app_index}.app/'
+        archive.writestr(prefix + 'Info.plist', plistlib.dumps(info))
+        archive.writestr(prefix + f'Delta{app_index}', executable)
+        for name, content in sorted(assets.items()):
+            archive.writestr(prefix + name, content)
+    return ipa.getvalue()
+
+def build_history(app_index, versions, asset_count, asset_kb, executable_kb):
+    """
+    Build the IPAs of one app's version history
+
+    Returns:
+        list: IPA contents, oldest first
+    """
+    rng = random.Random(app_index)
+    assets = {f'Assets/asset{i}.bin': random_bytes(rng, asset_kb * 1024) for i in range(asset_count)}
+
+    history = []
+    for version in range(versions):
+        if version:
+            # A few assets change between releases
+            for name in rng.sample(sorted(assets), max(1, asset_count // 10)):
+                assets[name] = random_bytes(rng, asset_kb * 1024)
+        history.append(build_ipa(app_index, version, assets, executable_kb))
+    return history
+
+def store_delta(ipa, blobs, min_member_size):
+    """
+    Split an IPA and add its segments to the blob map
+
+    Returns:
+        tuple: (layout, bytes stored inline in the file document)
+    """
+    fileobj = io.BytesIO(ipa)
+    layout = []
+    inline_bytes = 0
+    for kind, offset, length in split_zip(fileobj, min_member_size):
+        segment = b''.join(iter_segment(fileobj, offset, length))
+        if kind == 'raw' and length < min_member_size:
+            layout.append(('raw', segment))
+            inline_bytes += length
+            continue
+        sha256 = hashlib.sha256(segment).hexdigest()
+        blobs.setdefault(sha256, segment)
+        layout.append(('blob', sha256))
+    return layout, inline_bytes
+
+def reassemble(layout, blobs):
+    """Rebuild an IPA from its layout"""
+    return b''.join(value if kind == 'raw' else blobs[value] for kind, value in layout)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark delta storage of app version histories')
+    parser.add_argument('--apps', type=int, default=50, help='Number of synthetic version histories')
+    parser.add_argument('--versions', type=int, default=10, help='Versions per app')
+    parser.add_argument('--assets', type=int, default=20, help='Asset files per app')
+    parser.add_argument('--asset-kb', type=int, default=512, help='Size of each asset')
+    parser.add_argument('--executable-kb', type=int, default=4096, help='Size of the executable')
+    parser.add_argument('--min-member-kb', type=int, default=MIN_DELTA_MEMBER_SIZE // 1024,
+                        help='Smallest ZIP member stored as its own blob')
+    args = parser.parse_args()
+
+    try:
+        min_member_size = args.min_member_kb * 1024
+        full_bytes = 0
+        whole_file_blobs = {}
+        blobs = {}
+        inline_bytes = 0
+        ipas = 0
+
+        for app_index in range(args.apps):
+            for ipa in build_history(app_index, args.versions, args.assets, args.asset_kb, args.executable_kb):
+                full_bytes += len(ipa)
+                whole_file_blobs.setdefault(hashlib.sha256(ipa).hexdigest(), len(ipa))
+
+                layout, inline = store_delta(ipa, blobs, min_member_size)
+                inline_bytes += inline
+                if reassemble(layout, blobs) != ipa:
+                    raise ValueError(f"IPA of app {app_index} did not reassemble byte for byte")
+                ipas += 1
+
+        whole_file_bytes = sum(whole_file_blobs.values())
+        delta_bytes = sum(len(segment) for segment in blobs.values()) + inline_bytes
+
+        mb = 1024 * 1024
+        print(f"IPAs: {ipas} ({args.apps} apps x {args.versions} versions), all reassembled byte for byte")
+        print(f"Logical size: {full_bytes / mb:.1f} MB")
+        print(f"Whole-file storage: {whole_file_bytes / mb:.1f} MB")
+        print(f"Delta storage: {delta_bytes / mb:.1f} MB ({len(blobs)} blobs, {inline_bytes / mb:.2f} MB inline)")
+        print(f"Saved: {(whole_file_bytes - delta_bytes) / mb:.1f} MB ({100 * (1 - delta_bytes / whole_file_bytes):.1f}%)")
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        sys.exit(1)
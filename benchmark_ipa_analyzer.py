@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# Benchmark for the IPA analyzer process pool
+#
+# Builds synthetic IPAs (large Info.plist, PNG icons, padding payload) and
+# extracts their app info concurrently, first with threads in this process
+# and then with the process pool at increasing sizes, printing IPAs/second.
+# No database is needed.
+#
+# Usage:
+#   python3 ./benchmark_ipa_analyzer.py [--ipas 32] [--plist-keys 20000] [--payload-mb 8]
+
+import argparse
+import io
+import os
+import plistlib
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from utils import ipa_analyzer
+from utils.file_utils import extract_app_info
+
+def build_ipa(path, index, plist_keys, payload_mb):
+    """Write a synthetic IPA to path"""
+    icon = io.BytesIO()
+    Image.new('RGB', (1024, 1024), (index % 256, 80, 160)).save(icon, 'PNG')
+
+    info = {
+        'CFBundleIdentifier': f'com.example.bench{index}',
+        'CFBundleShortVersionString': '1.0',
+        'CFBundleVersion': str(index),
+        'CFBundleName': f'Bench {index}',
+        'CFBundleIcons': {'CFBundlePrimaryIcon': {'CFBundleIconFiles': ['AppIcon60x60']}},
+        'BenchmarkPadding': {f'key{i}': f'value {i} for app {index}' for i in range(plist_keys)}
+    }
+
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as ipa:
+        ipa.writestr(f'Payload/Bench{index}.app/Info.plist', plistlib.dumps(info))
+        ipa.writestr(f'Payload/Bench{index}.app/AppIcon60x60@2x.png', icon.getvalue())
+        ipa.writestr(f'Payload/Bench{index}.app/Bench{index}', os.urandom(payload_mb * 1024 * 1024))
+
+def run_threads(paths, workers):
+    """Extract in this process with a thread pool; returns seconds taken"""
+    def extract(path):
+        with open(path, 'rb') as ipa_file:
+            return extract_app_info(ipa_file, os.path.basename(path))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(extract, paths))
+    elapsed = time.perf_counter() - start
+    assert all(r['bundle_id'] != 'unknown' for r in results)
+    return elapsed
+
+def run_processes(paths, processes):
+    """Extract with a process pool of the given size; returns seconds taken"""
+    ipa_analyzer.shutdown()
+    executor = ipa_analyzer.get_executor(processes)
+    # Start the workers before timing
+    list(executor.map(abs, range(processes)))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(paths)) as pool:
+        results = list(pool.map(lambda path: ipa_analyzer.analyze_ipa(path, os.path.basename(path)), paths))
+    elapsed = time.perf_counter() - start
+    assert all(r['bundle_id'] != 'unknown' for r in results)
+    return elapsed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark concurrent IPA analysis')
+    parser.add_argument('--ipas', type=int, default=32, help='Number of IPAs ingested concurrently')
+    parser.add_argument('--plist-keys', type=int, default=20000, help='Extra keys in each Info.plist')
+    parser.add_argument('--payload-mb', type=int, default=8, help='Size of the padding binary in each IPA')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='ipa-bench-')
+    try:
+        print(f"Building {args.ipas} IPAs in {workdir}...")
+        paths = []
+        for i in range(args.ipas):
+            path = os.path.join(workdir, f'bench{i}.ipa')
+            build_ipa(path, i, args.plist_keys, args.payload_mb)
+            paths.append(path)
+
+        cores = os.cpu_count() or 1
+        print(f"CPU cores: {cores}")
+        print(f"{'mode':<12} {'workers':>7} {'seconds':>8} {'IPAs/s':>8}")
+
+        elapsed = run_threads(paths, args.ipas)
+        print(f"{'threads':<12} {args.ipas:>7} {elapsed:>8.2f} {args.ipas / elapsed:>8.1f}")
+
+        sizes = sorted({1, 2, 4, 8, 16, cores} & set(range(1, cores + 1)))
+        for processes in sizes:
+            elapsed = run_processes(paths, processes)
+            print(f"{'processes':<12} {processes:>7} {elapsed:>8.2f} {args.ipas / elapsed:>8.1f}")
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        sys.exit(1)
+    finally:
+        ipa_analyzer.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
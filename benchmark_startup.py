@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# Benchmark for app cold starts
+#
+# Imports the app in fresh Python processes, the way a serverless function or
+# a new gunicorn worker starts, and reports how long creating the app takes.
+# With --first-request each process also serves one request (this bootstraps
+# default data, so MongoDB must be reachable); with --eager it also creates the
+# indexes the way the app used to on every start. --slowest lists the modules
+# that take longest to import (from python -X importtime).
+#
+# Usage:
+#   python3 ./benchmark_startup.py [--runs 10] [--first-request] [--eager] [--slowest 15]
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+# Runs in the child process; prints the seconds spent in each phase
+CHILD_SCRIPT = """
+import sys, time
+started = time.perf_counter()
+import app
+print('import', time.perf_counter() - started)
+if '--eager' in sys.argv:
+    phase = time.perf_counter()
+    app.db.create_indexes()
+    print('indexes', time.perf_counter() - phase)
+if '--first-request' in sys.argv:
+    phase = time.perf_counter()
+    app.app.test_client().get('/login')
+    print('first request', time.perf_counter() - phase)
+print('total', time.perf_counter() - started)
+"""
+
+def child_env():
+    """Environment for the child processes: no background work"""
+    env = dict(os.environ)
+    env['BACKGROUND_ROLES'] = ''
+    return env
+
+def run_once(flags):
+    """
+    Start the app in a fresh process
+
+    Returns:
+        dict: Phase name -> seconds
+    """
+    result = subprocess.run([sys.executable, '-c', CHILD_SCRIPT] + flags,
+                            capture_output=True, text=True, env=child_env(),
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'child failed')
+
+    timings = {}
+    for line in result.stdout.splitlines():
+        phase, _, seconds = line.rpartition(' ')
+        try:
+            timings[phase] = float(seconds)
+        except ValueError:
+            continue
+    return timings
+
+def slowest_imports(count):
+    """
+    Import the app once with -X importtime
+
+    Returns:
+        list: (cumulative microseconds, module) for the slowest imports
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'],
+                            capture_output=True, text=True, env=child_env(),
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module = line[len('import time:'):].split('|')
+        imports.append((int(cumulative), module.rstrip()))
+    return sorted(imports, reverse=True)[:count]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark app cold starts')
+    parser.add_argument('--runs', type=int, default=10, help='Number of fresh processes')
+    parser.add_argument('--first-request', action='store_true', help='Also serve one request (needs MongoDB)')
+    parser.add_argument('--eager', action='store_true', help='Also create the indexes (needs MongoDB)')
+    parser.add_argument('--slowest', type=int, default=0, help='List the N slowest imports')
+    args = parser.parse_args()
+
+    flags = []
+    if args.eager:
+        flags.append('--eager')
+    if args.first_request:
+        flags.append('--first-request')
+
+    try:
+        runs = [run_once(flags) for _ in range(args.runs)]
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        sys.exit(1)
+
+    print(f"Cold starts over {args.runs} processes:")
+    for phase in runs[0]:
+        values = [run[phase] * 1000 for run in runs]
+        print(f"  {phase:<14} min {min(values):8.1f} ms   median {statistics.median(values):8.1f} ms   max {max(values):8.1f} ms")
+
+    if args.slowest:
+        print("\nSlowest imports (cumulative):")
+        for cumulative, module in slowest_imports(args.slowest):
+            print(f"  {cumulative / 1000:8.1f} ms  {module}")
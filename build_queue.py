@@ -0,0 +1,144 @@
+"""
+Build queue with concurrency limits.
+
+New GitHub builds are saved with status 'queued' and only start (clone, fork,
+push, dispatch) once a build slot is free, so a burst of builds doesn't hit
+GitHub all at once. At most BUILD_MAX_CONCURRENT builds run at a time, and at
+most BUILD_MAX_PER_USER for a single user.
+
+Free slots are handed out round-robin across users: the user whose last build
+started longest ago goes first, and takes their oldest queued build. Someone
+queueing 30 builds therefore doesn't hold up a colleague's single build.
+
+dispatch_builds() runs when a build is queued or finishes, and periodically
+from the job scheduler in case a trigger was missed. A lock in the meta
+collection keeps two processes from handing out the same slot.
+"""
+
+import os
+import heapq
+import uuid
+import logging
+from datetime import datetime
+
+import database as db
+import jobs
+from schema import parse_timestamp
+
+# Builds running at the same time, across all users and per user
+BUILD_MAX_CONCURRENT = int(os.environ.get('BUILD_MAX_CONCURRENT', '4'))
+BUILD_MAX_PER_USER = int(os.environ.get('BUILD_MAX_PER_USER', '2'))
+
+def fair_order(queued, last_dispatch):
+    """
+    Order queued builds the way they will be started
+
+    Users take turns, starting with the user whose last build started
+    longest ago (users who never built go first); each turn takes the user's
+    oldest queued build.
+
+    Args:
+        queued (list): Queued builds with id, user and start_time, oldest first
+        last_dispatch (dict): Username -> time their last build started
+
+    Returns:
+        list: The queued builds in start order
+    """
+    per_user = {}
+    for build in queued:
+        per_user.setdefault(build.get('user'), []).append(build)
+
+    # (turn, time of the user's last start, queue time of their oldest build,
+    # tie-breaker, user); every user's first turn is 0, later turns count up
+    turns = [
+        (0, last_dispatch.get(user) or datetime.min, parse_timestamp(builds[0].get('start_time')) or datetime.min, index, user)
+        for index, (user, builds) in enumerate(per_user.items())
+    ]
+    heapq.heapify(turns)
+
+    ordered = []
+    turn = 0
+    while turns:
+        _, _, _, index, user = heapq.heappop(turns)
+        builds = per_user[user]
+        ordered.append(builds.pop(0))
+        if builds:
+            turn += 1
+            heapq.heappush(turns, (turn, datetime.max, datetime.max, index, user))
+    return ordered
+
+def dispatch_builds():
+    """
+    Start queued builds while build slots are free
+
+    Returns:
+        list: IDs of the builds started
+    """
+    owner = str(uuid.uuid4())
+    if not db.acquire_lock('build_dispatch', owner):
+        # Another process is dispatching right now
+        return []
+
+    started = []
+    try:
+        queued = db.get_queued_builds()
+        if not queued:
+            return started
+
+        running = db.count_running_builds_by_user()
+        total = sum(running.values())
+        last_dispatch = db.get_last_build_dispatches({build.get('user') for build in queued})
+
+        for build in fair_order(queued, last_dispatch):
+            if total >= BUILD_MAX_CONCURRENT:
+                break
+            user = build.get('user')
+            if running.get(user, 0) >= BUILD_MAX_PER_USER:
+                continue
+
+            now = db.utc_now()
+            dispatched = db.update_build(
+                build['id'],
+                set={'status': 'in_progress', 'dispatched_at': now, 'start_time': now},
+                push={'log': "Build slot available, starting build..."},
+                expect_status='queued'
+            )
+            if not dispatched:
+                # Cancelled in the meantime
+                continue
+
+            jobs.enqueue('run_build', {'build_id': build['id']}, dedup_key=build['id'], created_by=user,
+                         max_attempts=1, priority=jobs.PRIORITY_HIGH)
+            running[user] = running.get(user, 0) + 1
+            total += 1
+            started.append(build['id'])
+    finally:
+        db.release_lock('build_dispatch', owner)
+
+    if started:
+        logging.info(f"Started {len(started)} queued builds")
+    return started
+
+def get_queue_position(build_id):
+    """
+    Get a queued build's place in the start order
+
+    Args:
+        build_id (str): The build ID
+
+    Returns:
+        dict or None: position (1 starts next), queued (total) and the
+                      concurrency limits, or None if the build isn't queued
+    """
+    queued = db.get_queued_builds()
+    if not any(build['id'] == build_id for build in queued):
+        return None
+
+    last_dispatch = db.get_last_build_dispatches({build.get('user') for build in queued})
+    ordered = [build['id'] for build in fair_order(queued, last_dispatch)]
+    return {
+        'position': ordered.index(build_id) + 1,
+        'queued': len(ordered),
+        'max_concurrent': BUILD_MAX_CONCURRENT,
+        'max_per_user': BUILD_MAX_PER_USER
+    }
@@ -0,0 +1,276 @@
+"""
+MongoDB connections.
+
+Metadata queries and blob I/O go through separate clients, so multi-megabyte
+blob reads and writes can't take every pooled connection away from the small,
+latency-sensitive lookups that serve pages. Both are configured per deployment
+through environment variables (pool sizes, timeouts, wire compression), and
+read-heavy listings can opt into secondary reads with listing().
+
+Clients are created with connect=False, so importing this module doesn't touch
+the network. Every client reports how long operations waited for a pooled
+connection; get_pool_stats() returns the numbers for this process.
+"""
+
+import os
+import time
+import logging
+import threading
+import importlib.util
+from collections import deque
+from pymongo import MongoClient, monitoring
+from pymongo.read_preferences import Primary, PrimaryPreferred, Secondary, SecondaryPreferred, Nearest
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+MONGO_URI = os.environ.get('MONGO_URI', 'mongodb://localhost:27017/')
+DB_NAME = os.environ.get('DB_NAME', 'app_distribution')
+
+def _env_int(name, default=None):
+    value = os.environ.get(name, '')
+    return int(value) if value else default
+
+# Metadata pool. Empty values keep the defaults below, or the driver's where
+# none is given; 0 is passed to the driver as is (a max pool size of 0 means no limit)
+MONGO_MAX_POOL_SIZE = _env_int('MONGO_MAX_POOL_SIZE', 100)
+MONGO_MIN_POOL_SIZE = _env_int('MONGO_MIN_POOL_SIZE', 0)
+MONGO_MAX_IDLE_TIME_MS = _env_int('MONGO_MAX_IDLE_TIME_MS')
+MONGO_WAIT_QUEUE_TIMEOUT_MS = _env_int('MONGO_WAIT_QUEUE_TIMEOUT_MS')
+MONGO_CONNECT_TIMEOUT_MS = _env_int('MONGO_CONNECT_TIMEOUT_MS', 10000)
+MONGO_SERVER_SELECTION_TIMEOUT_MS = _env_int('MONGO_SERVER_SELECTION_TIMEOUT_MS', 10000)
+MONGO_SOCKET_TIMEOUT_MS = _env_int('MONGO_SOCKET_TIMEOUT_MS')
+
+# Blob pool: fewer connections, and a longer socket timeout for large transfers
+# (an empty timeout uses MONGO_SOCKET_TIMEOUT_MS)
+MONGO_BLOB_MAX_POOL_SIZE = _env_int('MONGO_BLOB_MAX_POOL_SIZE', 20)
+MONGO_BLOB_SOCKET_TIMEOUT_MS = _env_int('MONGO_BLOB_SOCKET_TIMEOUT_MS')
+
+# Wire compression, in order of preference (e.g. "zstd,snappy,zlib").
+# zstd needs the zstandard package and snappy needs python-snappy.
+MONGO_COMPRESSORS = os.environ.get('MONGO_COMPRESSORS', '')
+
+# Read preference of listing queries (primary, primaryPreferred, secondary,
+# secondaryPreferred or nearest) and how stale a secondary may be (seconds,
+# at least 90; empty for no limit)
+MONGO_LISTING_READ_PREFERENCE = os.environ.get('MONGO_LISTING_READ_PREFERENCE', 'primary')
+MONGO_LISTING_MAX_STALENESS_SECONDS = _env_int('MONGO_LISTING_MAX_STALENESS_SECONDS', -1)
+
+# Number of recent pool waits kept per client for percentiles
+POOL_WAIT_SAMPLES = 1000
+
+# Modules the compressors need (zlib is built in)
+_COMPRESSOR_MODULES = {'zstd': 'zstandard', 'snappy': 'snappy', 'zlib': 'zlib'}
+
+_READ_PREFERENCES = {
+    'primary': lambda staleness: Primary(),
+    'primaryPreferred': lambda staleness: PrimaryPreferred(max_staleness=staleness),
+    'secondary': lambda staleness: Secondary(max_staleness=staleness),
+    'secondaryPreferred': lambda staleness: SecondaryPreferred(max_staleness=staleness),
+    'nearest': lambda staleness: Nearest(max_staleness=staleness)
+}
+
+_pool_stats = {}  # client name -> stats
+_stats_lock = threading.Lock()
+_checkout_started = threading.local()
+
+def _new_stats():
+    return {
+        'checkouts': 0,
+        'checkout_failures': 0,
+        'checkout_timeouts': 0,
+        'wait_ms_total': 0.0,
+        'wait_ms_max': 0.0,
+        'recent_waits_ms': deque(maxlen=POOL_WAIT_SAMPLES),
+        'checked_out': 0,
+        'connections_created': 0,
+        'connections_closed': 0,
+        'pool_clears': 0
+    }
+
+class PoolWaitListener(monitoring.ConnectionPoolListener):
+    """Records how long checkouts from a client's pools wait for a connection"""
+
+    def __init__(self, name):
+        self.name = name
+        with _stats_lock:
+            _pool_stats.setdefault(name, _new_stats())
+
+    def _update(self, **changes):
+        with _stats_lock:
+            stats = _pool_stats[self.name]
+            for key, value in changes.items():
+                stats[key] += value
+
+    def _wait_ms(self, address):
+        # A checkout starts and ends on the same thread
+        started = getattr(_checkout_started, 'times', {}).pop((self.name, address), None)
+        return (time.perf_counter() - started) * 1000 if started is not None else 0.0
+
+    def connection_check_out_started(self, event):
+        if not hasattr(_checkout_started, 'times'):
+            _checkout_started.times = {}
+        _checkout_started.times[(self.name, event.address)] = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        wait_ms = self._wait_ms(event.address)
+        with _stats_lock:
+            stats = _pool_stats[self.name]
+            stats['checkouts'] += 1
+            stats['checked_out'] += 1
+            stats['wait_ms_total'] += wait_ms
+            stats['wait_ms_max'] = max(stats['wait_ms_max'], wait_ms)
+            stats['recent_waits_ms'].append(wait_ms)
+
+    def connection_check_out_failed(self, event):
+        self._wait_ms(event.address)
+        self._update(checkout_failures=1, checkout_timeouts=1 if event.reason == 'timeout' else 0)
+
+    def connection_checked_in(self, event):
+        self._update(checked_out=-1)
+
+    def connection_created(self, event):
+        self._update(connections_created=1)
+
+    def connection_closed(self, event):
+        self._update(connections_closed=1)
+
+    def pool_cleared(self, event):
+        self._update(pool_clears=1)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+def get_compressors():
+    """
+    Get the configured compressors whose libraries are installed
+
+    Returns:
+        list: Compressor names, in order of preference
+    """
+    compressors = []
+    for name in [c.strip() for c in MONGO_COMPRESSORS.split(',') if c.strip()]:
+        module = _COMPRESSOR_MODULES.get(name)
+        if module is None:
+            logging.warning(f"Unknown MongoDB compressor '{name}' ignored")
+        elif importlib.util.find_spec(module) is None:
+            logging.warning(f"MongoDB compressor '{name}' needs the {module} package, ignored")
+        else:
+            compressors.append(name)
+    return compressors
+
+def _client_options(max_pool_size, socket_timeout_ms):
+    options = {
+        'maxPoolSize': max_pool_size,
+        'minPoolSize': MONGO_MIN_POOL_SIZE,
+        'maxIdleTimeMS': MONGO_MAX_IDLE_TIME_MS,
+        'waitQueueTimeoutMS': MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        'connectTimeoutMS': MONGO_CONNECT_TIMEOUT_MS,
+        'serverSelectionTimeoutMS': MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        'socketTimeoutMS': socket_timeout_ms
+    }
+    # Unset options keep the driver (or connection string) defaults
+    options = {key: value for key, value in options.items() if value is not None}
+
+    compressors = get_compressors()
+    if compressors:
+        options['compressors'] = ','.join(compressors)
+    return options
+
+def create_client(name, max_pool_size=None, socket_timeout_ms=None):
+    """
+    Create a lazily connecting client with pool wait metrics
+
+    Args:
+        name (str): Name the client's pool stats are reported under
+        max_pool_size (int, optional): Connections per server (defaults to MONGO_MAX_POOL_SIZE)
+        socket_timeout_ms (int, optional): Socket timeout (defaults to MONGO_SOCKET_TIMEOUT_MS)
+
+    Returns:
+        MongoClient: The client
+    """
+    options = _client_options(
+        MONGO_MAX_POOL_SIZE if max_pool_size is None else max_pool_size,
+        MONGO_SOCKET_TIMEOUT_MS if socket_timeout_ms is None else socket_timeout_ms
+    )
+    return MongoClient(MONGO_URI, connect=False, event_listeners=[PoolWaitListener(name)], **options)
+
+def get_listing_read_preference():
+    """Read preference for listing queries, from MONGO_LISTING_READ_PREFERENCE"""
+    factory = _READ_PREFERENCES.get(MONGO_LISTING_READ_PREFERENCE)
+    if factory is None:
+        logging.warning(f"Unknown read preference '{MONGO_LISTING_READ_PREFERENCE}', using primary")
+        return Primary()
+    return factory(MONGO_LISTING_MAX_STALENESS_SECONDS)
+
+def listing(collection):
+    """
+    Get a handle on a collection for read-heavy listings
+
+    Listings use MONGO_LISTING_READ_PREFERENCE, so they can be served by
+    secondaries. Their results may lag writes by the replication delay; reads
+    that must see a write just made (e.g. before updating a document) should
+    use the plain collection.
+
+    Args:
+        collection (Collection): A metadata collection
+
+    Returns:
+        Collection: The same collection with the listing read preference
+    """
+    return collection.with_options(read_preference=LISTING_READ_PREFERENCE)
+
+def get_pool_stats():
+    """
+    Get connection pool metrics for this process
+
+    Returns:
+        dict: Client name -> checkouts, failures and timeouts, average, p50,
+              p95 and max wait (ms), connections checked out, created and
+              closed, and pool clears
+    """
+    report = {}
+    with _stats_lock:
+        for name, stats in _pool_stats.items():
+            waits = sorted(stats['recent_waits_ms'])
+            checkouts = stats['checkouts']
+            report[name] = {
+                'checkouts': checkouts,
+                'checkout_failures': stats['checkout_failures'],
+                'checkout_timeouts': stats['checkout_timeouts'],
+                'wait_ms_avg': round(stats['wait_ms_total'] / checkouts, 3) if checkouts else 0.0,
+                'wait_ms_p50': round(waits[len(waits) // 2], 3) if waits else 0.0,
+                'wait_ms_p95': round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 3) if waits else 0.0,
+                'wait_ms_max': round(stats['wait_ms_max'], 3),
+                'checked_out': stats['checked_out'],
+                'connections_created': stats['connections_created'],
+                'connections_closed': stats['connections_closed'],
+                'pool_clears': stats['pool_clears']
+            }
+    return report
+
+def reset_pool_stats():
+    """Reset the pool metrics of this process (e.g. between benchmark runs)"""
+    with _stats_lock:
+        for name in _pool_stats:
+            _pool_stats[name] = _new_stats()
+
+LISTING_READ_PREFERENCE = get_listing_read_preference()
+
+# Small metadata lookups and updates
+client = create_client('metadata')
+# Blob contents (blobs, blob_chunks)
+blob_client = create_client('blob', MONGO_BLOB_MAX_POOL_SIZE, MONGO_BLOB_SOCKET_TIMEOUT_MS)
+
+db = client[DB_NAME]
+blob_db = blob_client[DB_NAME]
@@ -1,20 +1,43 @@
 import os
-from pymongo import MongoClient
+import gzip
+import json
+import base64
+import hashlib
+import re
+import logging
+import zipfile
+from pymongo import ReplaceOne, ReturnDocument
+from pymongo.errors import OperationFailure, DuplicateKeyError
 from dotenv import load_dotenv
 from werkzeug.security import generate_password_hash
 import uuid
-from datetime import datetime
+import threading
+from datetime import datetime, timedelta
+
+import connection
+from connection import listing
+from schema import utc_now, to_document, json_default
+from utils.zip_delta import split_zip, iter_segment, MIN_DELTA_MEMBER_SIZE
 
 # Load environment variables
 load_dotenv()
 
-# MongoDB connection
-MONGO_URI = os.environ.get('MONGO_URI', 'mongodb://localhost:27017/')
-DB_NAME = os.environ.get('DB_NAME', 'app_distribution')
+# Notification retention
+# Read notifications are expired by a TTL index once they are older than
+# NOTIFICATION_RETENTION_DAYS (0 disables expiry). When NOTIFICATION_ARCHIVE_DIR
+# is set, expired notifications are first written to compressed JSONL files and
+# the TTL index only acts as a backstop after the extra grace period.
+NOTIFICATION_RETENTION_DAYS = int(os.environ.get('NOTIFICATION_RETENTION_DAYS', '30'))
+NOTIFICATION_ARCHIVE_DIR = os.environ.get('NOTIFICATION_ARCHIVE_DIR', '')
+NOTIFICATION_ARCHIVE_GRACE_DAYS = int(os.environ.get('NOTIFICATION_ARCHIVE_GRACE_DAYS', '7'))
+
+# Finished (completed or failed) jobs are removed by a TTL index after this
+# many days (0 keeps them forever)
+JOB_RETENTION_DAYS = int(os.environ.get('JOB_RETENTION_DAYS', '7'))
 
-# Connect to MongoDB
-client = MongoClient(MONGO_URI)
-db = client[DB_NAME]
+# MongoDB clients (see connection.py): metadata and blob I/O use separate pools
+client = connection.client
+db = connection.db
 
 # Collections
 users_collection = db['users']
@@ -24,29 +47,171 @@ app_shares_collection = db['app_shares']  # New collection for tracking app shar
 files_collection = db['files']  # New collection for storing IPA files
 comments_collection = db['comments']  # New collection for app version comments
 notifications_collection = db['notifications']  # New collection for user notifications
+comment_summaries_collection = db['comment_summaries']  # Per-version comment counters
+meta_collection = db['meta']  # Small bookkeeping documents (e.g. ACL version)
+manifests_collection = db['manifests']  # Rendered OTA install manifests
+blobs_collection = connection.blob_db['blobs']  # File contents keyed by sha256, shared between files
+blob_chunks_collection = connection.blob_db['blob_chunks']  # Contents of blobs written as a stream
+jobs_collection = db['jobs']  # Background jobs (see jobs.py)
+provisioning_profiles_collection = db['provisioning_profiles']  # Embedded profiles of uploaded IPAs
+app_versions_collection = db['app_versions']  # Upload history of each app, one document per version
+
+# Read-heavy listings may be served by secondaries (see connection.listing)
+apps_listing = listing(apps_collection)
+app_versions_listing = listing(app_versions_collection)
+builds_listing = listing(builds_collection)
+comments_listing = listing(comments_collection)
+
+# Size of each blob_chunks document written by save_file_stream
+BLOB_CHUNK_SIZE = 1024 * 1024
+
+_bootstrapped = False
+_bootstrap_lock = threading.Lock()
 
 def initialize_db():
-    """Initialize database with default data if empty"""
-    # Create indexes for better performance
+    """Create indexes and default data (run by migrate.py and the maintenance scripts)"""
+    create_indexes()
+    ensure_default_admin()
+
+def bootstrap():
+    """
+    Prepare the database for serving requests, once per process
+    
+    Only creates default data; indexes are created by migrate.py at deploy
+    time, so cold starts don't pay for index builds.
+    """
+    global _bootstrapped
+    
+    if _bootstrapped:
+        return
+    with _bootstrap_lock:
+        if not _bootstrapped:
+            ensure_default_admin()
+            _bootstrapped = True
+
+def create_indexes():
+    """Create or update all indexes"""
     users_collection.create_index('username', unique=True)
     apps_collection.create_index('id', unique=True)
+    # Full-text search over app metadata, plus lowercase copies for prefix (type-ahead) matching
+    ensure_app_search_index()
+    apps_collection.create_index('name_lower')
+    apps_collection.create_index('bundle_id_lower')
+    apps_collection.create_index('owner')
+    # Manifests used to be cached per Host header; the cache is rebuilt on demand
+    if 'app_id_1_variant_1_host_1' in manifests_collection.index_information():
+        manifests_collection.drop_index('app_id_1_variant_1_host_1')
+        manifests_collection.delete_many({})
+    manifests_collection.create_index([('app_id', 1), ('variant', 1)], unique=True)
     builds_collection.create_index('id', unique=True)
+    builds_collection.create_index([('status', 1), ('start_time', 1)])  # Finds abandoned builds and the build queue
+    builds_collection.create_index([('user', 1), ('dispatched_at', -1)])  # Last build started per user (fair queue)
+    builds_collection.create_index([('fork_info.owner', 1), ('fork_info.repo', 1)])  # Fork garbage collection
     app_shares_collection.create_index([('app_id', 1), ('username', 1)], unique=True)  # Composite index
     files_collection.create_index('file_id', unique=True)  # Index for file storage
-    comments_collection.create_index([('app_id', 1), ('version', 1)])  # Index for comments by app version
+    files_collection.create_index('build_id')
+    blobs_collection.create_index('sha256', unique=True)
+    blob_chunks_collection.create_index([('blob_id', 1), ('n', 1)], unique=True)
+    jobs_collection.create_index('id', unique=True)
+    # Serves claim_next_job (highest priority, then oldest) and the expired lease sweep
+    jobs_collection.create_index([('status', 1), ('priority', -1), ('run_after', 1)])
+    jobs_collection.create_index([('status', 1), ('lease_expires_at', 1)])
+    ensure_job_ttl_index()  # TTL index for removing finished jobs
+    jobs_collection.create_index('dedup_key', unique=True, partialFilterExpression={'dedup_key': {'$exists': True}})
+    provisioning_profiles_collection.create_index('file_id', unique=True)
+    provisioning_profiles_collection.create_index([('file_id', 1), ('devices', 1)])
+    provisioning_profiles_collection.create_index('app_id')
+    # Version history pages, newest first
+    app_versions_collection.create_index([('app_id', 1), ('upload_date', -1)])
+    app_versions_collection.create_index(
+        [('app_id', 1), ('file_id', 1)],
+        unique=True,
+        partialFilterExpression={'file_id': {'$type': 'string'}}
+    )
+    app_versions_collection.create_index([('release_notes', 'text')], name='app_version_search_text')
+    comments_collection.create_index('id', unique=True)  # Index for comment lookups and deletes
+    # Threads per version (parent_id null) and their replies, both ordered by time
+    comments_collection.create_index([('app_id', 1), ('version', 1), ('parent_id', 1), ('timestamp', -1)])
+    comment_summaries_collection.create_index([('app_id', 1), ('version', 1)], unique=True)
     notifications_collection.create_index('username')  # Index for notifications by username
-    notifications_collection.create_index([('username', 1), ('read', 1)])  # Index for unread notifications
-    
-    # Create default admin user if no users exist
-    if users_collection.count_documents({}) == 0:
+    # Serves unread counts (prefix) and keyset-paginated listings sorted by timestamp
+    notifications_collection.create_index([('username', 1), ('read', 1), ('timestamp', -1), ('id', -1)])
+    ensure_notification_ttl_index()  # TTL index for expiring read notifications
+
+def ensure_default_admin():
+    """Create the default admin user if no users exist"""
+    if users_collection.count_documents({}, limit=1) == 0:
         default_admin = {
             'username': 'admin',
             'password': generate_password_hash('admin123'),
             'role': 'admin'
         }
-        users_collection.insert_one(default_admin)
+        try:
+            users_collection.insert_one(default_admin)
+        except DuplicateKeyError:
+            # Another process created it first
+            return
         print("Created default admin user (username: admin, password: admin123)")
 
+def ensure_app_search_index():
+    """
+    Create the text index used by search_apps
+    
+    Older databases have a version of this index that also covered the
+    embedded `versions` array; it is rebuilt in that case.
+    """
+    keys = [('name', 'text'), ('bundle_id', 'text'), ('release_notes', 'text')]
+    options = {'name': 'app_search_text', 'weights': {'name': 10, 'bundle_id': 5, 'release_notes': 1}}
+    try:
+        apps_collection.create_index(keys, **options)
+    except OperationFailure:
+        apps_collection.drop_index('app_search_text')
+        apps_collection.create_index(keys, **options)
+
+def ensure_job_ttl_index():
+    """Create or update the TTL index that removes finished jobs"""
+    if JOB_RETENTION_DAYS <= 0:
+        return
+    
+    expire_after = JOB_RETENTION_DAYS * 86400
+    try:
+        jobs_collection.create_index('finished_at', name='finished_at_ttl', expireAfterSeconds=expire_after)
+    except OperationFailure:
+        # The index already exists with a different retention, adjust it in place
+        db.command('collMod', jobs_collection.name, index={
+            'keyPattern': {'finished_at': 1},
+            'expireAfterSeconds': expire_after
+        })
+
+def ensure_notification_ttl_index():
+    """
+    Create or update the TTL index that expires read notifications
+    
+    The index is built on `read_at`, which is only set once a notification is
+    marked as read, so unread notifications are never expired.
+    """
+    if NOTIFICATION_RETENTION_DAYS <= 0:
+        return
+    
+    expire_days = NOTIFICATION_RETENTION_DAYS
+    if NOTIFICATION_ARCHIVE_DIR:
+        # Leave time for archive_expired_notifications to copy documents out first
+        expire_days += NOTIFICATION_ARCHIVE_GRACE_DAYS
+    expire_after = expire_days * 86400
+    
+    try:
+        notifications_collection.create_index(
+            'read_at',
+            name='read_at_ttl',
+            expireAfterSeconds=expire_after
+        )
+    except OperationFailure:
+        # The index already exists with a different retention, adjust it in place
+        db.command('collMod', notifications_collection.name, index={
+            'keyPattern': {'read_at': 1},
+            'expireAfterSeconds': expire_after
+        })
+
 # User operations
 def get_users():
     """Get all users"""
@@ -64,6 +229,9 @@ def save_user(user_data):
         {'$set': user_data},
         upsert=True
     )
+    
+    # Role changes alter which apps the user can see
+    bump_acl_version()
 
 def update_user_password(username, new_password_hash):
     """Update a user's password"""
@@ -125,6 +293,7 @@ def delete_user(username):
     
     # Remove any app shares for this user
     app_shares_collection.delete_many({'username': username})
+    bump_acl_version()
     
     # Delete all notifications for this user
     delete_user_notifications(username)
@@ -132,7 +301,7 @@ def delete_user(username):
 # App operations
 def get_apps():
     """Get all apps"""
-    return list(apps_collection.find({}, {'_id': 0}))
+    return list(apps_listing.find({}, {'_id': 0}))
 
 def get_apps_for_user(username):
     """
@@ -141,44 +310,191 @@ def get_apps_for_user(username):
     - Developers get their own apps plus shared apps
     - Testers get only shared apps
     """
-    user = get_user(username)
-    if not user:
-        return []
+    return list(apps_listing.find(_app_access_filter(username), {'_id': 0}))
+
+def _app_access_filter(username):
+    """
+    Build the query filter selecting the apps a user can see in listings
+    
+    The visible app set comes from the cached access-control index in acl.py.
+    
+    Args:
+        username (str): The username
         
-    # Admins see all apps
-    if user.get('role') == 'admin':
-        return get_apps()
+    Returns:
+        dict: MongoDB filter (empty for admins, who see all apps)
+    """
+    # Import here to avoid circular imports
+    from acl import visible_app_ids
+    
+    app_ids = visible_app_ids(username)
+    if app_ids is None:
+        # Admins see all apps
+        return {}
+    return {'id': {'$in': list(app_ids)}}
+
+def _app_search_fields(app_data):
+    """Lowercase copies of the fields used for prefix search"""
+    return {
+        'name_lower': (app_data.get('name') or '').lower(),
+        'bundle_id_lower': (app_data.get('bundle_id') or '').lower()
+    }
+
+def search_apps(username, query, limit=20, projection=None):
+    """
+    Search the apps a user has access to
+    
+    Full-text matches on name, bundle id and release notes come first,
+    ranked by relevance, followed by apps matched through the release notes
+    of earlier versions. Remaining slots are filled with apps whose name or
+    bundle id starts with the query, which covers partial words typed in a
+    search box. Access control is applied inside both queries.
+    
+    Args:
+        username (str): The searching user
+        query (str): Search text
+        limit (int): Maximum number of results
+        projection (dict, optional): Fields to return, defaults to the whole app
         
-    # Get apps shared with the user
-    shared_app_ids = [
-        share['app_id'] 
-        for share in app_shares_collection.find({'username': username}, {'_id': 0, 'app_id': 1})
-    ]
+    Returns:
+        list: Matching apps, best match first
+    """
+    term = (query or '').strip()
+    if not term or limit <= 0:
+        return []
     
-    # For developers, also include apps they own
-    if user.get('role') == 'developer':
-        return list(apps_collection.find({
-            '$or': [
-                {'id': {'$in': shared_app_ids}},
-                {'owner': username}
+    access = _app_access_filter(username)
+    projection = dict(projection or {'_id': 0})
+    projection['_id'] = 0
+    
+    results = []
+    seen_ids = set()
+    
+    # Ranked full-text matches
+    text_projection = dict(projection, score={'$meta': 'textScore'})
+    text_results = apps_listing.find(
+        {**access, '$text': {'$search': term}},
+        text_projection
+    ).sort([('score', {'$meta': 'textScore'})]).limit(limit)
+    for app in text_results:
+        seen_ids.add(app['id'])
+        results.append(app)
+    
+    # Apps with a matching release note in an earlier version; the access
+    # filter goes in the first stage so hidden apps don't take up the limit
+    if len(results) < limit:
+        version_access = {'app_id': access['id']} if access else {}
+        version_matches = app_versions_listing.aggregate([
+            {'$match': {**version_access, '$text': {'$search': term}}},
+            {'$group': {'_id': '$app_id', 'score': {'$max': {'$meta': 'textScore'}}}},
+            {'$match': {'_id': {'$nin': list(seen_ids)}}},
+            {'$sort': {'score': -1}},
+            {'$limit': limit}
+        ])
+        ranked_ids = [match['_id'] for match in version_matches]
+        if ranked_ids:
+            version_apps = {
+                app['id']: app
+                for app in apps_listing.find({'$and': [access, {'id': {'$in': ranked_ids}}]}, projection)
+            }
+            for app_id in ranked_ids:
+                if app_id in version_apps and len(results) < limit:
+                    seen_ids.add(app_id)
+                    results.append(version_apps[app_id])
+    
+    # Prefix matches for partial words (type-ahead)
+    if len(results) < limit:
+        prefix = {'$regex': '^' + re.escape(term.lower())}
+        prefix_query = {
+            '$and': [
+                access,
+                {'$or': [{'name_lower': prefix}, {'bundle_id_lower': prefix}]},
+                {'id': {'$nin': list(seen_ids)}}
             ]
-        }, {'_id': 0}))
+        }
+        results.extend(apps_listing.find(
+            prefix_query,
+            projection
+        ).sort('name_lower', 1).limit(limit - len(results)))
     
-    # For testers, only show shared apps
-    return list(apps_collection.find({'id': {'$in': shared_app_ids}}, {'_id': 0}))
+    return results
+
+def refresh_app_search_fields():
+    """
+    Backfill the lowercase search fields on every app
+    
+    Returns:
+        int: Number of apps updated
+    """
+    result = apps_collection.update_many({}, [{'$set': {
+        'name_lower': {'$toLower': {'$ifNull': ['$name', '']}},
+        'bundle_id_lower': {'$toLower': {'$ifNull': ['$bundle_id', '']}}
+    }}])
+    return result.modified_count
 
-def get_app(app_id):
-    """Get an app by ID"""
-    return apps_collection.find_one({'id': app_id}, {'_id': 0})
+def get_app(app_id, fields=None):
+    """
+    Get an app by ID
+    
+    Args:
+        app_id (str): The app ID
+        fields (list, optional): Only return these fields instead of the whole document
+    """
+    projection = {'_id': 0}
+    if fields:
+        projection.update({field: 1 for field in fields})
+    return apps_collection.find_one({'id': app_id}, projection)
 
 def save_app(app_data):
-    """Create or update an app"""
+    """Create an app, or replace all of its fields (use update_app to change some of them)"""
     app_id = app_data['id']
+    fields = to_document('apps', {key: value for key, value in app_data.items() if key != 'rev'})
     apps_collection.update_one(
         {'id': app_id},
-        {'$set': app_data},
+        {'$set': {**fields, **_app_search_fields(app_data)}, '$inc': {'rev': 1}},
         upsert=True
     )
+    
+    # New apps and owner changes alter developers' visible apps
+    bump_acl_version()
+    
+    # Version, name or bundle id may have changed
+    delete_app_manifests(app_id)
+
+def update_app(app_id, fields, expect_rev=None):
+    """
+    Update some fields of an app without rewriting the whole document
+    
+    Every update increments the app's `rev`, so a caller that read the app
+    can pass expect_rev to only write if nobody changed it in between.
+    
+    Args:
+        app_id (str): The app ID
+        fields (dict): Fields to set
+        expect_rev (int, optional): Only update if the app is still at this revision
+        
+    Returns:
+        bool: True if the app was updated
+    """
+    update = to_document('apps', fields)
+    if 'name' in fields or 'bundle_id' in fields:
+        current = get_app(app_id, fields=['name', 'bundle_id']) or {}
+        update.update(_app_search_fields({**current, **fields}))
+    
+    query = {'id': app_id}
+    if expect_rev is not None:
+        # Apps created before revisions were tracked count as revision 0
+        query['rev'] = {'$in': [0, None]} if expect_rev == 0 else expect_rev
+    
+    result = apps_collection.update_one(query, {'$set': update, '$inc': {'rev': 1}})
+    if not result.matched_count:
+        return False
+    if 'owner' in fields:
+        bump_acl_version()
+    
+    # Every manifest carries the name and bundle id; only the latest one the version
+    delete_app_manifests(app_id, variant=None if 'name' in fields or 'bundle_id' in fields else 'latest')
+    return True
 
 def delete_app(app_id):
     """Delete an app and all associated files"""
@@ -193,12 +509,214 @@ def delete_app(app_id):
     
     # Remove any shares for this app
     app_shares_collection.delete_many({'app_id': app_id})
+    bump_acl_version()
+    
+    delete_app_manifests(app_id)
+    
+    # Re-uploading the same IPA should create the app again
+    release_job_dedup_keys({'result.app_id': app_id})
+    
+    provisioning_profiles_collection.delete_many({'app_id': app_id})
+    
+    app_versions_collection.delete_many({'app_id': app_id})
 
 def save_apps(apps):
     """Save multiple apps (used for batch operations)"""
     for app in apps:
         save_app(app)
 
+# App version history
+def save_app_version(app_id, version):
+    """
+    Record an uploaded version of an app
+    
+    Saving the same file again (e.g. when a job is retried) updates the
+    existing entry instead of adding a second one.
+    
+    Args:
+        app_id (str): The app ID
+        version (dict): version, build_number, filename, file_id, upload_date and release_notes
+        
+    Returns:
+        dict: The stored version
+    """
+    version_doc = to_document('app_versions', {**version, 'app_id': app_id})
+    version_doc.pop('_id', None)
+    
+    if not version_doc.get('file_id'):
+        version_doc.setdefault('id', str(uuid.uuid4()))
+        app_versions_collection.insert_one(dict(version_doc))
+        return version_doc
+    
+    new_id = version_doc.pop('id', None) or str(uuid.uuid4())
+    return app_versions_collection.find_one_and_update(
+        {'app_id': app_id, 'file_id': version_doc['file_id']},
+        {'$set': version_doc, '$setOnInsert': {'id': new_id}},
+        projection={'_id': 0},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+
+def get_app_version(app_id, file_id):
+    """Get the version of an app stored under a file id"""
+    return app_versions_collection.find_one({'app_id': app_id, 'file_id': file_id}, {'_id': 0})
+
+def get_app_versions(app_id, page=1, per_page=20):
+    """
+    Get a page of an app's version history, newest first
+    
+    Args:
+        app_id (str): The app ID
+        page (int): 1-based page
+        per_page (int): Versions per page
+        
+    Returns:
+        dict: {'versions': list, 'total': int, 'page': int, 'per_page': int, 'has_more': bool}
+    """
+    page = max(1, page)
+    query = {'app_id': app_id}
+    
+    versions = list(
+        app_versions_listing.find(query, {'_id': 0})
+        .sort([('upload_date', -1), ('id', -1)])
+        .skip((page - 1) * per_page)
+        .limit(per_page)
+    )
+    total = app_versions_listing.count_documents(query)
+    
+    return {
+        'versions': versions,
+        'total': total,
+        'page': page,
+        'per_page': per_page,
+        'has_more': page * per_page < total
+    }
+
+def get_all_app_versions(app_id, fields=None):
+    """
+    Get an app's whole version history, newest first
+    
+    Args:
+        app_id (str): The app ID
+        fields (list, optional): Only return these fields
+    """
+    projection = {'_id': 0}
+    if fields:
+        projection.update({field: 1 for field in fields})
+    return list(app_versions_collection.find({'app_id': app_id}, projection).sort('upload_date', -1))
+
+def update_app_version(version_id, fields):
+    """Update fields of a version history entry"""
+    result = app_versions_collection.update_one({'id': version_id}, {'$set': fields})
+    return result.matched_count > 0
+
+# Install manifest cache
+def get_manifest(app_id, variant='latest'):
+    """
+    Get a cached install manifest
+    
+    Args:
+        app_id (str): The app ID
+        variant (str): 'latest' for the current version, or a version file_id
+        
+    Returns:
+        dict or None: {'data': bytes, 'etag': str, ...} if cached
+    """
+    return manifests_collection.find_one(
+        {'app_id': app_id, 'variant': variant},
+        {'_id': 0}
+    )
+
+def save_manifest(app_id, data, etag, variant='latest', file_id=None):
+    """
+    Store a rendered install manifest
+    
+    Args:
+        app_id (str): The app ID
+        data (bytes): Rendered plist, with placeholders for the host and download token
+        etag (str): Entity tag for conditional requests
+        variant (str): 'latest' for the current version, or a version file_id
+        file_id (str, optional): File the manifest installs
+    """
+    manifests_collection.update_one(
+        {'app_id': app_id, 'variant': variant},
+        {'$set': {
+            'app_id': app_id,
+            'variant': variant,
+            'file_id': file_id,
+            'data': data,
+            'etag': etag,
+            'created_at': utc_now()
+        }},
+        upsert=True
+    )
+
+def delete_app_manifests(app_id, variant=None):
+    """
+    Drop cached install manifests for an app so they are rendered again
+    
+    Args:
+        app_id (str): The app ID
+        variant (str, optional): Only drop this variant (e.g. 'latest')
+        
+    Returns:
+        int: Number of manifests deleted
+    """
+    query = {'app_id': app_id}
+    if variant:
+        query['variant'] = variant
+    return manifests_collection.delete_many(query).deleted_count
+
+# Provisioning profile operations
+def save_provisioning_profile(file_id, app_id, profile):
+    """
+    Store the provisioning profile embedded in an uploaded IPA
+    
+    Args:
+        file_id (str): The IPA's file ID
+        app_id (str): The app the IPA belongs to
+        profile (dict): As returned by utils.provisioning.parse_mobileprovision
+    """
+    provisioning_profiles_collection.update_one(
+        {'file_id': file_id},
+        {'$set': {**profile, 'file_id': file_id, 'app_id': app_id}},
+        upsert=True
+    )
+
+def get_provisioning_profile(file_id):
+    """Get the stored provisioning profile of an IPA, without its device list"""
+    return provisioning_profiles_collection.find_one({'file_id': file_id}, {'_id': 0, 'devices': 0})
+
+def check_device_eligibility(app_id, file_id, udid):
+    """
+    Check whether a device can install an IPA according to its provisioning profile
+    
+    Args:
+        app_id (str): The app the IPA belongs to
+        file_id (str): The IPA's file ID
+        udid (str): Normalized device UDID
+        
+    Returns:
+        str: 'eligible', 'not_provisioned', 'expired', or 'unknown' if the IPA
+             has no stored profile
+    """
+    profile = provisioning_profiles_collection.find_one(
+        {'file_id': file_id, 'app_id': app_id},
+        {'_id': 0, 'all_devices': 1, 'expiration_date': 1}
+    )
+    if not profile:
+        return 'unknown'
+    
+    if profile.get('expiration_date') and profile['expiration_date'] < utc_now():
+        return 'expired'
+    
+    if profile.get('all_devices'):
+        return 'eligible'
+    
+    # Device lists are indexed with the file id, so this is an index-only lookup
+    listed = provisioning_profiles_collection.count_documents({'file_id': file_id, 'devices': udid}, limit=1)
+    return 'eligible' if listed else 'not_provisioned'
+
 # App sharing operations
 def share_app(app_id, username):
     """Share an app with a specific user"""
@@ -226,6 +744,7 @@ def share_app(app_id, username):
         }},
         upsert=True
     )
+    bump_acl_version()
     
     return True, f"App {app.get('name', app_id)} shared with {username}"
 
@@ -242,6 +761,7 @@ def unshare_app(app_id, username, requesting_user=None):
 
     result = app_shares_collection.delete_one({'app_id': app_id, 'username': username})
     if result.deleted_count > 0:
+        bump_acl_version()
         return True, "Access removed successfully"
     else:
         return False, "Share not found"
@@ -262,71 +782,271 @@ def get_shared_users(app_id):
 
 def get_user_app_access(username, app_id):
     """Check if a user has access to a specific app"""
-    user = get_user(username)
-    if not user:
-        return False
-        
-    # Admins and Developers have access to all apps
-    if user.get('role') in ['admin', 'developer']:
-        return True
-        
-    # Check if app is shared with the user
-    share = app_shares_collection.find_one({'app_id': app_id, 'username': username})
-    return share is not None
+    # Answered from the cached access-control index (see acl.py)
+    from acl import can_access
+    return can_access(username, [app_id])[app_id]
+
+def get_acl_version():
+    """
+    Get the current access-control version
+    
+    Returns:
+        int: Version number, incremented on every sharing, ownership or role change
+    """
+    doc = meta_collection.find_one({'_id': 'acl_version'})
+    return doc.get('version', 0) if doc else 0
+
+def bump_acl_version():
+    """
+    Invalidate cached access-control sets in every process
+    
+    Returns:
+        int: The new version
+    """
+    doc = meta_collection.find_one_and_update(
+        {'_id': 'acl_version'},
+        {'$inc': {'version': 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    
+    # Drop this process's cache right away; other processes notice the new
+    # version on their next check
+    try:
+        from acl import invalidate
+        invalidate(doc['version'])
+    except Exception as e:
+        print(f"Error invalidating access cache: {e}")
+    
+    return doc['version']
 
 # Build operations
+# Statuses of builds that haven't finished; only these may move to a final status
+ACTIVE_BUILD_STATUSES = ('queued', 'in_progress')
+
 def get_builds():
     """Get all builds"""
-    return list(builds_collection.find({}, {'_id': 0}))
+    return list(builds_listing.find({}, {'_id': 0}))
 
 def get_build(build_id):
     """Get a build by ID"""
     return builds_collection.find_one({'id': build_id}, {'_id': 0})
 
-def save_build(build_data):
-    """Create or update a build"""
-    build_id = build_data['id']
-    builds_collection.update_one(
-        {'id': build_id},
-        {'$set': build_data},
-        upsert=True
+def create_build(build_data):
+    """
+    Insert a new build
+    
+    Args:
+        build_data (dict): The build; its `log`, if any, is stored as a list of entries
+        
+    Returns:
+        dict: The stored build
+    """
+    build = to_document('builds', build_data)
+    if isinstance(build.get('log'), str):
+        build['log'] = [build['log']]
+    build['rev'] = 0
+    builds_collection.insert_one(build)
+    build.pop('_id', None)
+    return build
+
+def _as_array(field):
+    """Aggregation expression for a field as an array (missing -> [], scalar -> [scalar])"""
+    return {'$cond': [
+        {'$isArray': f'${field}'},
+        f'${field}',
+        {'$cond': [{'$eq': [{'$ifNull': [f'${field}', None]}, None]}, [], [f'${field}']]}
+    ]}
+
+def update_build(build_id, set=None, push=None, unset=None, expect_status=None, expect_rev=None):
+    """
+    Atomically update some fields of a build
+    
+    Only the given fields are sent, so concurrent writers (the workflow
+    monitor, the build webhook, admins) don't overwrite each other's
+    changes. Every update increments the build's `rev`; passing expect_rev or
+    expect_status makes the update conditional, for optimistic concurrency
+    and status transitions.
+    
+    Args:
+        build_id (str): The build ID
+        set (dict, optional): Fields to set
+        push (dict, optional): Field -> value or list of values appended to an array
+            (a legacy string value is turned into the first entry)
+        unset (list, optional): Fields to remove
+        expect_status (str or tuple, optional): Only update if the build has this status (or one of them)
+        expect_rev (int, optional): Only update if the build is still at this revision
+        
+    Returns:
+        dict or None: The updated build without its log, or None if the build
+                      doesn't exist or didn't match the expectations
+    """
+    query = {'id': build_id}
+    if expect_status is not None:
+        statuses = [expect_status] if isinstance(expect_status, str) else list(expect_status)
+        query['status'] = {'$in': statuses}
+    if expect_rev is not None:
+        # Builds created before revisions were tracked count as revision 0
+        query['rev'] = {'$in': [0, None]} if expect_rev == 0 else expect_rev
+    
+    # A pipeline update keeps the whole change a single atomic write
+    stage = {field: {'$literal': value} for field, value in to_document('builds', set or {}).items()}
+    for field, values in (push or {}).items():
+        if not isinstance(values, list):
+            values = [values]
+        stage[field] = {'$concatArrays': [_as_array(field), {'$literal': values}]}
+    stage['rev'] = {'$add': [{'$ifNull': ['$rev', 0]}, 1]}
+    
+    pipeline = [{'$set': stage}]
+    if unset:
+        pipeline.append({'$unset': list(unset)})
+    
+    return builds_collection.find_one_and_update(
+        query,
+        pipeline,
+        projection={'_id': 0, 'log': 0},
+        return_document=ReturnDocument.AFTER
     )
 
-def update_build_status(build_id, status, log=None, end_time=None):
-    """Update build status and optional fields"""
-    update_data = {'status': status}
+def get_builds_started_before(cutoff, status='in_progress'):
+    """
+    Get builds in a status that started before a time
     
-    if log is not None:
-        # First check if the log field exists and what type it is
-        build = get_build(build_id)
-        if build and 'log' in build:
-            if isinstance(build['log'], list):
-                # If it's already an array, append to it
-                builds_collection.update_one(
-                    {'id': build_id},
-                    {'$push': {'log': log}}
-                )
-            else:
-                # If it's a string, convert to array with both old and new content
-                builds_collection.update_one(
-                    {'id': build_id},
-                    {'$set': {'log': [build['log'], log]}}
-                )
-        else:
-            # If log field doesn't exist, create it as an array
-            builds_collection.update_one(
-                {'id': build_id},
-                {'$set': {'log': [log]}}
-            )
+    Args:
+        cutoff (datetime): UTC time
+        status (str): Build status
+    """
+    return list(builds_collection.find(
+        {'status': status, 'start_time': {'$lt': cutoff}},
+        {'_id': 0, 'log': 0}
+    ))
+
+def get_queued_builds():
+    """
+    Get the builds waiting for a build slot, oldest first
+    
+    Returns:
+        list: Builds with id, user and start_time (the time they were queued)
+    """
+    return list(builds_collection.find(
+        {'status': 'queued'},
+        {'_id': 0, 'id': 1, 'user': 1, 'start_time': 1}
+    ).sort([('start_time', 1), ('id', 1)]))
+
+def count_running_builds_by_user():
+    """
+    Count the builds holding a build slot
+    
+    Returns:
+        dict: Username -> number of builds in progress
+    """
+    return {
+        group['_id']: group['count']
+        for group in builds_collection.aggregate([
+            {'$match': {'status': 'in_progress'}},
+            {'$group': {'_id': '$user', 'count': {'$sum': 1}}}
+        ])
+    }
+
+def get_last_build_dispatches(usernames):
+    """
+    Get when each user's most recent build left the queue
+    
+    Args:
+        usernames (list): Usernames to look up
+        
+    Returns:
+        dict: Username -> UTC datetime (users without a dispatched build are left out)
+    """
+    return {
+        group['_id']: group['last']
+        for group in builds_collection.aggregate([
+            {'$match': {'user': {'$in': list(usernames)}, 'dispatched_at': {'$type': 'date'}}},
+            {'$group': {'_id': '$user', 'last': {'$max': '$dispatched_at'}}}
+        ])
+    }
+
+def get_active_build_ids():
+    """Get the IDs of queued and running builds"""
+    return [build['id'] for build in builds_collection.find(
+        {'status': {'$in': list(ACTIVE_BUILD_STATUSES)}},
+        {'_id': 0, 'id': 1}
+    )]
+
+def get_fork_builds(owner, repos):
+    """
+    Get the builds that use some temporary GitHub repositories
+    
+    Args:
+        owner (str): Owner of the repositories
+        repos (list): Repository names
+        
+    Returns:
+        list: Builds with id, status, fork_info and fork_cleaned
+    """
+    return list(builds_collection.find(
+        {'fork_info.owner': owner, 'fork_info.repo': {'$in': list(repos)}},
+        {'_id': 0, 'id': 1, 'status': 1, 'fork_info': 1, 'fork_cleaned': 1}
+    ))
+
+def get_uncleaned_fork_builds(owner):
+    """
+    Get finished builds whose temporary GitHub repository isn't known to be deleted
+    
+    Args:
+        owner (str): Owner of the repositories
+        
+    Returns:
+        list: Builds with id and fork_info
+    """
+    return list(builds_collection.find(
+        {
+            'fork_info.owner': owner,
+            'fork_cleaned': {'$ne': True},
+            'status': {'$nin': list(ACTIVE_BUILD_STATUSES)}
+        },
+        {'_id': 0, 'id': 1, 'fork_info': 1}
+    ))
+
+def mark_forks_cleaned(build_ids):
+    """
+    Record that the temporary GitHub repositories of some builds are deleted
+    
+    Args:
+        build_ids (list): Build IDs
+        
+    Returns:
+        int: Number of builds updated
+    """
+    if not build_ids:
+        return 0
+    
+    result = builds_collection.update_many(
+        {'id': {'$in': list(build_ids)}, 'fork_cleaned': {'$ne': True}},
+        [{'$set': {'fork_cleaned': True, 'rev': {'$add': [{'$ifNull': ['$rev', 0]}, 1]}}}]
+    )
+    return result.modified_count
+
+def update_build_status(build_id, status, log=None, end_time=None, expect_status=None):
+    """
+    Update build status, appending an entry to the build log
     
+    Args:
+        build_id (str): The build ID
+        status (str): The new status
+        log (str, optional): Log entry to append
+        end_time (datetime, optional): End time of the build
+        expect_status (str or tuple, optional): Only update builds in this status
+        
+    Returns:
+        bool: True if the build was updated
+    """
+    update_data = {'status': status}
     if end_time is not None:
         update_data['end_time'] = end_time
     
-    builds_collection.update_one(
-        {'id': build_id},
-        {'$set': update_data}
-    )
-    return True
+    push = {'log': log} if log is not None else None
+    return update_build(build_id, set=update_data, push=push, expect_status=expect_status) is not None
 
 def delete_build(build_id):
     """
@@ -336,62 +1056,389 @@ def delete_build(build_id):
         build_id (str): Build identifier
         
     Returns:
-        bool: True if the build was deleted, False otherwise
+        bool: True if the build was deleted, False otherwise
+    """
+    # Get the build to check if it exists
+    build = get_build(build_id)
+    if not build:
+        return False
+    
+    # Delete any associated build files first
+    delete_build_files(build_id)
+    
+    # Delete the build
+    result = builds_collection.delete_one({'id': build_id})
+    return result.deleted_count > 0
+
+# File storage operations
+#
+# File documents hold metadata (filename, owner build, size) and the sha256 of
+# their content. The bytes live once in `blobs`, whose refcount is the number
+# of file documents pointing at them, so re-uploads and CI builds promoted to
+# app versions don't store a second copy. Streamed uploads keep their bytes in
+# `blob_chunks`, referenced by the blob's `chunks_id`.
+#
+# IPAs can also be stored as a delta `layout`: a list of segments that are
+# either small inline bytes ({'raw': ...}) or a blob ({'sha256', 'size'}).
+# Unchanged ZIP members of successive versions then share one blob.
+def _store_blob(file_data):
+    """
+    Store file content, or add a reference to identical content already stored
+    
+    Args:
+        file_data (bytes): Binary content
+        
+    Returns:
+        str: The content's sha256 hex digest
+    """
+    sha256 = hashlib.sha256(file_data).hexdigest()
+    
+    for _ in range(2):
+        try:
+            blobs_collection.update_one(
+                {'sha256': sha256},
+                {
+                    '$inc': {'refcount': 1},
+                    '$setOnInsert': {
+                        'sha256': sha256,
+                        'size': len(file_data),
+                        'data': file_data,
+                        'created_at': utc_now()
+                    }
+                },
+                upsert=True
+            )
+            return sha256
+        except DuplicateKeyError:
+            # Another upload inserted the same content first; retry as an increment
+            continue
+    
+    raise RuntimeError(f"Could not store blob {sha256}")
+
+def _store_blob_stream(chunks):
+    """
+    Store content read from an iterable of byte strings without holding it in memory
+    
+    Chunks are written to `blob_chunks` as they arrive. If identical content is
+    already stored, the new chunks are dropped and a reference is added instead;
+    if that content is deleted before the reference lands, the new chunks are
+    stored as the blob after all.
+    
+    Args:
+        chunks (iterable): Byte strings making up the content
+        
+    Returns:
+        tuple: (sha256 hex digest, size in bytes)
+    """
+    blob_id = str(uuid.uuid4())
+    digest = hashlib.sha256()
+    size = 0
+    n = 0
+    buffer = bytearray()
+    
+    def flush():
+        nonlocal n
+        blob_chunks_collection.insert_one({'blob_id': blob_id, 'n': n, 'data': bytes(buffer)})
+        n += 1
+        buffer.clear()
+    
+    try:
+        for chunk in chunks:
+            digest.update(chunk)
+            size += len(chunk)
+            buffer.extend(chunk)
+            if len(buffer) >= BLOB_CHUNK_SIZE:
+                flush()
+        if buffer or n == 0:
+            flush()
+        
+        sha256 = digest.hexdigest()
+        for _ in range(3):
+            try:
+                blobs_collection.insert_one({
+                    'sha256': sha256,
+                    'size': size,
+                    'chunks_id': blob_id,
+                    'refcount': 1,
+                    'created_at': utc_now()
+                })
+                return sha256, size
+            except DuplicateKeyError:
+                result = blobs_collection.update_one({'sha256': sha256}, {'$inc': {'refcount': 1}})
+                if result.matched_count:
+                    break
+                # The stored copy was released and deleted in between; keep ours after all
+        else:
+            raise RuntimeError(f"Could not store blob {sha256}")
+    except BaseException:
+        blob_chunks_collection.delete_many({'blob_id': blob_id})
+        raise
+    
+    # Same content was already stored; ours is redundant
+    blob_chunks_collection.delete_many({'blob_id': blob_id})
+    return sha256, size
+
+def _release_blob(sha256):
+    """
+    Drop a reference to stored content, deleting the content with the last reference
+    
+    Args:
+        sha256 (str): The content's sha256 hex digest
+        
+    Returns:
+        bool: True if the content itself was deleted
+    """
+    blob = blobs_collection.find_one_and_update(
+        {'sha256': sha256},
+        {'$inc': {'refcount': -1}},
+        projection={'refcount': 1, 'chunks_id': 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if not blob or blob['refcount'] > 0:
+        return False
+    
+    result = blobs_collection.delete_one({'sha256': sha256, 'refcount': {'$lte': 0}})
+    if result.deleted_count and blob.get('chunks_id'):
+        blob_chunks_collection.delete_many({'blob_id': blob['chunks_id']})
+    return result.deleted_count > 0
+
+def _blob_chunks(sha256):
+    """
+    Get the content of a blob as an iterator of byte strings
+    
+    Returns:
+        iterator or None: None if the blob doesn't exist
+    """
+    blob = blobs_collection.find_one({'sha256': sha256}, {'_id': 0, 'data': 1, 'chunks_id': 1})
+    if not blob:
+        return None
+    if blob.get('chunks_id'):
+        return (
+            chunk['data']
+            for chunk in blob_chunks_collection.find({'blob_id': blob['chunks_id']}, {'_id': 0, 'data': 1}).sort('n', 1)
+        )
+    return iter([blob['data']])
+
+def _iter_layout(layout):
+    """Yield the content of a delta layout segment by segment"""
+    for segment in layout:
+        if 'raw' in segment:
+            yield segment['raw']
+            continue
+        chunks = _blob_chunks(segment['sha256'])
+        if chunks is None:
+            raise IOError(f"Missing blob {segment['sha256']}")
+        yield from chunks
+
+def _iter_file_doc(file_doc):
+    """
+    Get the content of a file document as an iterator of byte strings
+    
+    Returns:
+        iterator or None: None if the content is missing
+    """
+    if 'data' in file_doc:
+        return iter([file_doc['data']])
+    if 'layout' in file_doc:
+        return _iter_layout(file_doc['layout'])
+    if file_doc.get('sha256'):
+        return _blob_chunks(file_doc['sha256'])
+    return None
+
+def _file_blob_refs(file_doc):
+    """List the blobs a file document holds references to"""
+    if 'layout' in file_doc:
+        return [segment['sha256'] for segment in file_doc['layout'] if 'sha256' in segment]
+    if file_doc.get('sha256'):
+        return [file_doc['sha256']]
+    return []
+
+def _attach_blob_data(file_doc):
+    """Fill in `data` for a file document whose content is stored as blobs"""
+    if file_doc and 'data' not in file_doc:
+        chunks = _iter_file_doc(file_doc)
+        file_doc['data'] = b''.join(chunks) if chunks is not None else None
+        file_doc.pop('layout', None)
+    return file_doc
+
+def save_file(file_id, filename, file_data, content_type='application/octet-stream'):
+    """
+    Store a file in MongoDB
+    
+    Args:
+        file_id (str): Unique identifier for the file
+        filename (str): Original filename
+        file_data (bytes): Binary content of the file
+        content_type (str): MIME type of the file
+        
+    Returns:
+        str: The file_id
+    """
+    return _save_file_doc(file_id, filename, content_type, len(file_data), _store_blob(file_data))
+
+def save_file_stream(file_id, filename, chunks, content_type='application/octet-stream'):
+    """
+    Store a file read from a stream, keeping at most one chunk in memory
+    
+    Args:
+        file_id (str): Unique identifier for the file
+        filename (str): Original filename
+        chunks (iterable): Byte strings making up the file
+        content_type (str): MIME type of the file
+        
+    Returns:
+        str: The file_id
+    """
+    sha256, size = _store_blob_stream(chunks)
+    return _save_file_doc(file_id, filename, content_type, size, sha256)
+
+def _save_file_doc(file_id, filename, content_type, size, sha256):
+    """Create or replace a file document pointing at stored content"""
+    file_doc = {
+        'file_id': file_id,
+        'filename': filename,
+        'content_type': content_type,
+        'size': size,
+        'sha256': sha256,
+        'upload_date': utc_now()
+    }
+    
+    previous = files_collection.find_one_and_update(
+        {'file_id': file_id},
+        {'$set': file_doc, '$unset': {'data': '', 'layout': ''}},
+        projection={'sha256': 1, 'layout.sha256': 1},
+        upsert=True
+    )
+    
+    # Overwriting a file releases the content it pointed at before
+    if previous:
+        for sha256 in _file_blob_refs(previous):
+            _release_blob(sha256)
+    
+    return file_id
+
+def get_file(file_id, include_data=True):
+    """
+    Retrieve a file from MongoDB
+    
+    Args:
+        file_id (str): Unique identifier for the file
+        include_data (bool): Load the file content; False returns metadata only
+        
+    Returns:
+        dict or None: The file document if found, None otherwise
+    """
+    if not include_data:
+        return files_collection.find_one({'file_id': file_id}, {'_id': 0, 'data': 0, 'layout': 0})
+    return _attach_blob_data(files_collection.find_one({'file_id': file_id}, {'_id': 0}))
+
+def get_file_sizes(file_ids):
+    """
+    Look up the sizes of several files in one query
+    
+    Returns:
+        dict: file_id -> size in bytes
+    """
+    return {
+        file_doc['file_id']: file_doc.get('size', 0)
+        for file_doc in files_collection.find({'file_id': {'$in': list(file_ids)}}, {'_id': 0, 'file_id': 1, 'size': 1})
+    }
+
+def iter_file_data(file_id):
+    """
+    Stream a file's content without loading all of it
+    
+    Args:
+        file_id (str): Unique identifier for the file
+        
+    Returns:
+        iterator or None: Byte strings making up the file, or None if it doesn't exist
     """
-    # Get the build to check if it exists
-    build = get_build(build_id)
-    if not build:
-        return False
-    
-    # Delete any associated build files first
-    delete_build_files(build_id)
-    
-    # Delete the build
-    result = builds_collection.delete_one({'id': build_id})
-    return result.deleted_count > 0
+    file_doc = files_collection.find_one({'file_id': file_id}, {'_id': 0, 'sha256': 1, 'data': 1, 'layout': 1})
+    if not file_doc:
+        return None
+    return _iter_file_doc(file_doc)
 
-# File storage operations
-def save_file(file_id, filename, file_data, content_type='application/octet-stream'):
+def read_file_to(file_id, fileobj):
     """
-    Store a file in MongoDB
+    Write a file's content into a file object, one stored chunk at a time
     
     Args:
         file_id (str): Unique identifier for the file
-        filename (str): Original filename
-        file_data (bytes): Binary content of the file
-        content_type (str): MIME type of the file
+        fileobj: Writable binary file object
         
     Returns:
-        str: The file_id
+        bool: True if the file was found
     """
-    file_doc = {
-        'file_id': file_id,
-        'filename': filename,
-        'content_type': content_type,
-        'size': len(file_data),
-        'data': file_data,
-        'upload_date': os.environ.get('TZ', 'UTC')
-    }
-    
-    files_collection.update_one(
-        {'file_id': file_id},
-        {'$set': file_doc},
-        upsert=True
-    )
+    chunks = iter_file_data(file_id)
+    if chunks is None:
+        return False
     
-    return file_id
+    for chunk in chunks:
+        fileobj.write(chunk)
+    return True
 
-def get_file(file_id):
+def store_file_as_delta(file_id, fileobj):
     """
-    Retrieve a file from MongoDB
+    Re-store an IPA as ZIP segments so members unchanged between versions are shared
+    
+    The segments are checked to add up to the stored content's sha256 before
+    the file is switched over, so the original bytes are always reproduced.
     
     Args:
         file_id (str): Unique identifier for the file
+        fileobj: Seekable binary file object with the file's current content
         
     Returns:
-        dict or None: The file document if found, None otherwise
+        bool: True if the file now uses a delta layout
     """
-    return files_collection.find_one({'file_id': file_id}, {'_id': 0})
+    file_doc = files_collection.find_one({'file_id': file_id}, {'_id': 0, 'sha256': 1, 'layout': 1, 'data': 1})
+    if not file_doc or 'layout' in file_doc or 'data' in file_doc or not file_doc.get('sha256'):
+        return False
+    
+    try:
+        segments = split_zip(fileobj)
+    except (zipfile.BadZipFile, EOFError):
+        return False
+    
+    layout = []
+    digest = hashlib.sha256()
+    
+    def hashed(chunks):
+        for chunk in chunks:
+            digest.update(chunk)
+            yield chunk
+    
+    try:
+        for kind, offset, length in segments:
+            if kind == 'raw' and length < MIN_DELTA_MEMBER_SIZE:
+                raw = b''.join(iter_segment(fileobj, offset, length))
+                digest.update(raw)
+                layout.append({'raw': raw})
+                continue
+            
+            sha256, size = _store_blob_stream(hashed(iter_segment(fileobj, offset, length, BLOB_CHUNK_SIZE)))
+            layout.append({'sha256': sha256, 'size': size})
+        
+        if digest.hexdigest() != file_doc['sha256']:
+            raise ValueError("Segments don't reproduce the stored file")
+        
+        result = files_collection.update_one(
+            {'file_id': file_id, 'sha256': file_doc['sha256'], 'layout': {'$exists': False}},
+            {'$set': {'layout': layout}}
+        )
+        if not result.modified_count:
+            raise ValueError("File changed while it was being split")
+    except Exception as e:
+        logging.warning(f"Delta storage skipped for {file_id}: {str(e)}")
+        for segment in layout:
+            if 'sha256' in segment:
+                _release_blob(segment['sha256'])
+        return False
+    
+    # The whole-file blob is no longer referenced by this file
+    _release_blob(file_doc['sha256'])
+    return True
 
 def delete_file(file_id):
     """
@@ -403,8 +1450,13 @@ def delete_file(file_id):
     Returns:
         bool: True if the file was deleted, False otherwise
     """
-    result = files_collection.delete_one({'file_id': file_id})
-    return result.deleted_count > 0
+    file_doc = files_collection.find_one_and_delete({'file_id': file_id}, projection={'sha256': 1, 'layout.sha256': 1})
+    if not file_doc:
+        return False
+    
+    for sha256 in _file_blob_refs(file_doc):
+        _release_blob(sha256)
+    return True
 
 def delete_app_files(app_id):
     """
@@ -425,11 +1477,10 @@ def delete_app_files(app_id):
         if 'file_id' in app:
             files_to_delete.append(app['file_id'])
         
-        # Add versions files if exist
-        if 'versions' in app:
-            for version in app['versions']:
-                if 'file_id' in version:
-                    files_to_delete.append(version['file_id'])
+        # Add files of earlier versions
+        for version in get_all_app_versions(app_id, fields=['file_id']):
+            if version.get('file_id') and version['file_id'] not in files_to_delete:
+                files_to_delete.append(version['file_id'])
     
     # Delete all files found
     deleted_count = 0
@@ -462,17 +1513,14 @@ def save_build_file(build_id, file_path, file_data, content_type='application/oc
         'file_path': file_path,
         'content_type': content_type,
         'size': len(file_data),
-        'data': file_data,
-        'upload_date': datetime.now().isoformat()
+        'sha256': _store_blob(file_data),
+        'upload_date': utc_now()
     }
     
     files_collection.insert_one(file_doc)
     
     # Update the build to reference this file
-    builds_collection.update_one(
-        {'id': build_id},
-        {'$push': {'build_files': file_id}}
-    )
+    update_build(build_id, push={'build_files': file_id})
     
     return file_id
 
@@ -491,23 +1539,23 @@ def get_build_file(build_id, file_path=None, file_id=None):
     """
     if file_id:
         # Get specific file by ID
-        return files_collection.find_one({
+        return _attach_blob_data(files_collection.find_one({
             'file_id': file_id, 
             'build_id': build_id
-        }, {'_id': 0})
+        }, {'_id': 0}))
     
     if file_path:
         # Get specific file by path
-        return files_collection.find_one({
+        return _attach_blob_data(files_collection.find_one({
             'build_id': build_id,
             'file_path': file_path
-        }, {'_id': 0})
+        }, {'_id': 0}))
     
     # Get all files for this build
-    return list(files_collection.find(
-        {'build_id': build_id}, 
-        {'_id': 0}
-    ))
+    return [
+        _attach_blob_data(file_doc)
+        for file_doc in files_collection.find({'build_id': build_id}, {'_id': 0})
+    ]
 
 def delete_build_files(build_id):
     """
@@ -519,17 +1567,287 @@ def delete_build_files(build_id):
     Returns:
         int: Number of files deleted
     """
-    # Delete all files for this build
+    # Delete all files for this build, then release their content
+    hashes = [
+        sha256
+        for file_doc in files_collection.find({'build_id': build_id, 'sha256': {'$exists': True}}, {'sha256': 1, 'layout.sha256': 1})
+        for sha256 in _file_blob_refs(file_doc)
+    ]
     result = files_collection.delete_many({'build_id': build_id})
+    for sha256 in hashes:
+        _release_blob(sha256)
     
     # Update the build to remove file references
-    builds_collection.update_one(
-        {'id': build_id},
-        {'$unset': {'build_files': ""}}
-    )
+    update_build(build_id, unset=['build_files'])
     
     return result.deleted_count > 0
 
+def get_blob_storage_report():
+    """
+    Compare the size of all stored files with the content actually kept
+    
+    Returns:
+        dict: file and blob counts, delta_files (files stored as ZIP
+              segments), logical_bytes (sum of file sizes), stored_bytes
+              (unique content plus files not yet moved to blobs; the small
+              inline segments of delta files are not counted) and bytes_saved
+    """
+    def total(collection, match):
+        result = list(collection.aggregate([
+            {'$match': match},
+            {'$group': {'_id': None, 'count': {'$sum': 1}, 'bytes': {'$sum': '$size'}}}
+        ]))
+        return (result[0]['count'], result[0]['bytes']) if result else (0, 0)
+    
+    files, logical_bytes = total(files_collection, {})
+    inline_files, inline_bytes = total(files_collection, {'sha256': {'$exists': False}})
+    delta_files = files_collection.count_documents({'layout': {'$exists': True}})
+    blobs, blob_bytes = total(blobs_collection, {})
+    stored_bytes = blob_bytes + inline_bytes
+    
+    return {
+        'files': files,
+        'inline_files': inline_files,
+        'delta_files': delta_files,
+        'blobs': blobs,
+        'logical_bytes': logical_bytes,
+        'stored_bytes': stored_bytes,
+        'bytes_saved': logical_bytes - stored_bytes
+    }
+
+# Job operations
+def create_job(job):
+    """
+    Insert a job, unless a job with the same dedup_key already exists
+    
+    Args:
+        job (dict): The job document (see jobs.enqueue)
+        
+    Returns:
+        tuple: (job, created) where job is the new job or the existing duplicate
+    """
+    try:
+        jobs_collection.insert_one(job)
+        job.pop('_id', None)
+        return job, True
+    except DuplicateKeyError:
+        existing = jobs_collection.find_one({'dedup_key': job['dedup_key']}, {'_id': 0})
+        if existing:
+            return existing, False
+        # The duplicate was released in the meantime
+        jobs_collection.insert_one(job)
+        job.pop('_id', None)
+        return job, True
+
+def get_job(job_id):
+    """Get a job by ID"""
+    return jobs_collection.find_one({'id': job_id}, {'_id': 0})
+
+def claim_next_job(worker_id, job_types=None, lease_seconds=300):
+    """
+    Atomically take the runnable queued job with the highest priority (oldest first)
+    
+    The claim is a lease: the worker has to renew it (renew_job_lease) while
+    the job runs, or the job is handed out again by the expired lease sweep.
+    
+    Args:
+        worker_id (str): Identifies the worker in the job document
+        job_types (list, optional): Only claim jobs of these types
+        lease_seconds (int): How long the claim is valid without renewal
+        
+    Returns:
+        dict or None: The claimed job
+    """
+    now = utc_now()
+    query = {'status': 'queued', 'run_after': {'$lte': now}}
+    if job_types:
+        query['type'] = {'$in': list(job_types)}
+    
+    return jobs_collection.find_one_and_update(
+        query,
+        {
+            '$set': {
+                'status': 'running',
+                'worker': worker_id,
+                'started_at': now,
+                'updated_at': now,
+                'lease_expires_at': now + timedelta(seconds=lease_seconds)
+            },
+            '$inc': {'attempts': 1}
+        },
+        projection={'_id': 0},
+        sort=[('priority', -1), ('run_after', 1)],
+        return_document=ReturnDocument.AFTER
+    )
+
+def _running_job_filter(job_id, worker_id=None, lease_expired_before=None):
+    """Filter matching a running job, optionally only while a worker holds it or after its lease expired"""
+    query = {'id': job_id, 'status': 'running'}
+    if worker_id is not None:
+        query['worker'] = worker_id
+    if lease_expired_before is not None:
+        # Jobs claimed before leases existed have no expiry and count as expired
+        query['lease_expires_at'] = {'$not': {'$gt': lease_expired_before}}
+    return query
+
+def renew_job_lease(job_id, worker_id, lease_seconds=300):
+    """
+    Extend the lease of a running job
+    
+    Returns:
+        bool: False if the worker no longer holds the job (its lease expired
+              and the job was handed out again, or it finished)
+    """
+    now = utc_now()
+    result = jobs_collection.update_one(
+        _running_job_filter(job_id, worker_id),
+        {'$set': {'lease_expires_at': now + timedelta(seconds=lease_seconds), 'updated_at': now}}
+    )
+    return result.matched_count > 0
+
+def get_expired_jobs(limit=100):
+    """Get running jobs whose lease expired (their worker stopped or crashed)"""
+    return list(jobs_collection.find(
+        {'status': 'running', 'lease_expires_at': {'$not': {'$gt': utc_now()}}},
+        {'_id': 0}
+    ).limit(limit))
+
+def complete_job(job_id, result=None, worker_id=None):
+    """
+    Mark a running job as completed with its result
+    
+    Args:
+        job_id (str): The job ID
+        result: Value returned by the handler
+        worker_id (str, optional): Only if this worker still holds the job
+        
+    Returns:
+        bool: True if the job was updated
+    """
+    now = utc_now()
+    update = jobs_collection.update_one(
+        _running_job_filter(job_id, worker_id),
+        {
+            '$set': {'status': 'completed', 'result': result, 'finished_at': now, 'updated_at': now},
+            '$unset': {'lease_expires_at': ''}
+        }
+    )
+    return update.matched_count > 0
+
+def retry_job(job_id, error, run_after, worker_id=None, lease_expired_before=None):
+    """
+    Put a failed job back in the queue to run again after `run_after`
+    
+    Args:
+        job_id (str): The job ID
+        error (str): Error of the failed attempt
+        run_after (datetime): Earliest time of the next attempt
+        worker_id (str, optional): Only if this worker still holds the job
+        lease_expired_before (datetime, optional): Only if the job's lease expired before this time
+        
+    Returns:
+        bool: True if the job was updated
+    """
+    update = jobs_collection.update_one(
+        _running_job_filter(job_id, worker_id, lease_expired_before),
+        {
+            '$set': {'status': 'queued', 'error': error, 'run_after': run_after, 'updated_at': utc_now()},
+            '$unset': {'lease_expires_at': ''}
+        }
+    )
+    return update.matched_count > 0
+
+def fail_job(job_id, error, worker_id=None, lease_expired_before=None):
+    """
+    Mark a job as permanently failed
+    
+    The dedup key is released so the same content can be submitted again.
+    
+    Args:
+        job_id (str): The job ID
+        error (str): Error of the last attempt
+        worker_id (str, optional): Only if this worker still holds the job
+        lease_expired_before (datetime, optional): Only if the job's lease expired before this time
+        
+    Returns:
+        bool: True if the job was updated
+    """
+    now = utc_now()
+    update = jobs_collection.update_one(
+        _running_job_filter(job_id, worker_id, lease_expired_before),
+        {
+            '$set': {'status': 'failed', 'error': error, 'finished_at': now, 'updated_at': now},
+            '$unset': {'dedup_key': '', 'lease_expires_at': ''}
+        }
+    )
+    return update.matched_count > 0
+
+def acquire_lock(name, owner, seconds=30):
+    """
+    Take a lock shared by all processes
+    
+    The lock expires after `seconds`, so a crashed holder can't keep it.
+    
+    Args:
+        name (str): Lock name
+        owner (str): Identifies the holder
+        seconds (int): Time after which the lock is released anyway
+        
+    Returns:
+        bool: True if the lock was taken
+    """
+    now = utc_now()
+    try:
+        meta_collection.update_one(
+            {'_id': f'lock:{name}', 'locked_until': {'$not': {'$gt': now}}},
+            {'$set': {'owner': owner, 'locked_until': now + timedelta(seconds=seconds)}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # Held by someone else: the lock exists, so the upsert collided with it
+        return False
+    return True
+
+def release_lock(name, owner):
+    """Release a lock taken with acquire_lock"""
+    meta_collection.update_one({'_id': f'lock:{name}', 'owner': owner}, {'$set': {'locked_until': utc_now()}})
+
+def claim_schedule(name, interval_seconds):
+    """
+    Claim the next run of a periodic task, across all processes
+    
+    Args:
+        name (str): Name of the periodic task
+        interval_seconds (int): Time between runs
+        
+    Returns:
+        bool: True if this caller should run the task now
+    """
+    now = utc_now()
+    try:
+        meta_collection.update_one(
+            {'_id': f'schedule:{name}', 'next_run': {'$not': {'$gt': now}}},
+            {'$set': {'next_run': now + timedelta(seconds=interval_seconds), 'last_run': now}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # Not due yet: the schedule exists, so the upsert collided with it
+        return False
+    return True
+
+def release_job_dedup_keys(query):
+    """
+    Allow content handled by matching jobs to be submitted again
+    
+    Args:
+        query (dict): Filter on jobs (e.g. {'result.app_id': app_id})
+        
+    Returns:
+        int: Number of jobs updated
+    """
+    query = {**query, 'dedup_key': {'$exists': True}}
+    return jobs_collection.update_many(query, {'$unset': {'dedup_key': ''}}).modified_count
+
 # Comment operations
 def add_comment(app_id, version, username, text, parent_id=None):
     """
@@ -556,11 +1874,21 @@ def add_comment(app_id, version, username, text, parent_id=None):
         'username': username,
         'user_role': user.get('role', 'user'),
         'text': text,
-        'timestamp': datetime.now().isoformat(),
+        'timestamp': utc_now(),
         'parent_id': parent_id
     }
     
     comments_collection.insert_one(comment_data)
+    
+    # Keep the per-version counters in step with the comment
+    comment_summaries_collection.update_one(
+        {'app_id': app_id, 'version': version},
+        {
+            '$inc': {'comment_count': 1},
+            '$max': {'last_comment_at': comment_data['timestamp']}
+        },
+        upsert=True
+    )
     return {'success': True, 'comment': comment_data}
 
 def get_comments_for_version(app_id, version=None):
@@ -608,6 +1936,103 @@ def get_comments_for_version(app_id, version=None):
     # Sort parent comments by timestamp (newest first)
     return sorted(comment_threads, key=lambda x: x['timestamp'], reverse=True)
 
+def get_comment_threads(app_id, version, page=1, per_page=20, reply_limit=3):
+    """
+    Get a page of comment threads for a single app version
+    
+    Threads are built by the database: top-level comments are paginated
+    newest first and each one carries its reply count and the first
+    `reply_limit` replies (oldest first). Remaining replies can be fetched
+    with get_comment_replies.
+    
+    Args:
+        app_id (str): The app ID
+        version (str): The app version
+        page (int): 1-based page of top-level comments
+        per_page (int): Top-level comments per page
+        reply_limit (int): Number of replies embedded in each thread
+        
+    Returns:
+        dict: {'threads': list, 'total': int, 'page': int, 'per_page': int, 'has_more': bool}
+    """
+    page = max(1, page)
+    thread_query = {'app_id': app_id, 'version': version, 'parent_id': None}
+    
+    pipeline = [
+        {'$match': thread_query},
+        {'$sort': {'timestamp': -1}},
+        {'$skip': (page - 1) * per_page},
+        {'$limit': per_page},
+        {'$lookup': {
+            'from': comments_collection.name,
+            'let': {'comment_id': '$id'},
+            'pipeline': [
+                {'$match': {
+                    'app_id': app_id,
+                    'version': version,
+                    '$expr': {'$eq': ['$parent_id', '$$comment_id']}
+                }},
+                {'$sort': {'timestamp': 1}},
+                {'$facet': {
+                    'first': [{'$limit': reply_limit}, {'$project': {'_id': 0}}],
+                    'count': [{'$count': 'total'}]
+                }}
+            ],
+            'as': 'reply_info'
+        }},
+        {'$addFields': {
+            'replies': {'$ifNull': [{'$arrayElemAt': ['$reply_info.first', 0]}, []]},
+            'reply_count': {'$ifNull': [{'$arrayElemAt': [{'$arrayElemAt': ['$reply_info.count.total', 0]}, 0]}, 0]}
+        }},
+        {'$project': {'_id': 0, 'reply_info': 0}}
+    ]
+    
+    threads = list(comments_listing.aggregate(pipeline))
+    total = comments_listing.count_documents(thread_query)
+    
+    return {
+        'threads': threads,
+        'total': total,
+        'page': page,
+        'per_page': per_page,
+        'has_more': page * per_page < total
+    }
+
+def get_comment_replies(app_id, comment_id, offset=0, limit=20):
+    """
+    Get replies to a comment, oldest first
+    
+    Args:
+        app_id (str): The app ID
+        comment_id (str): The parent comment ID
+        offset (int): Number of replies to skip
+        limit (int): Maximum number of replies to return
+        
+    Returns:
+        dict or None: {'replies': list, 'reply_count': int, 'has_more': bool},
+                      or None if the parent comment doesn't exist
+    """
+    parent = comments_collection.find_one(
+        {'id': comment_id, 'app_id': app_id},
+        {'_id': 0, 'version': 1}
+    )
+    if not parent:
+        return None
+    
+    # Include app_id and version so the query uses the thread index
+    query = {'app_id': app_id, 'version': parent.get('version'), 'parent_id': comment_id}
+    replies = list(comments_listing.find(
+        query,
+        {'_id': 0}
+    ).sort('timestamp', 1).skip(max(0, offset)).limit(limit))
+    reply_count = comments_listing.count_documents(query)
+    
+    return {
+        'replies': replies,
+        'reply_count': reply_count,
+        'has_more': max(0, offset) + len(replies) < reply_count
+    }
+
 def delete_comment(comment_id, username=None, is_admin=False):
     """
     Delete a comment
@@ -629,13 +2054,24 @@ def delete_comment(comment_id, username=None, is_admin=False):
     if not is_admin and username != comment.get('username'):
         return False
         
+    deleted_count = 0
+    
     # Delete the comment and all its replies
     if comment.get('parent_id') is None:
         # This is a parent comment, delete all replies too
-        comments_collection.delete_many({'parent_id': comment_id})
+        deleted_count += comments_collection.delete_many({
+            'app_id': comment.get('app_id'),
+            'version': comment.get('version'),
+            'parent_id': comment_id
+        }).deleted_count
     
     # Delete the comment itself
     result = comments_collection.delete_one({'id': comment_id})
+    deleted_count += result.deleted_count
+    
+    if deleted_count:
+        _decrement_comment_summary(comment.get('app_id'), comment.get('version'), deleted_count)
+    
     return result.deleted_count > 0
 
 def delete_app_comments(app_id):
@@ -649,8 +2085,77 @@ def delete_app_comments(app_id):
         int: Number of comments deleted
     """
     result = comments_collection.delete_many({'app_id': app_id})
+    comment_summaries_collection.delete_many({'app_id': app_id})
     return result.deleted_count
 
+def _decrement_comment_summary(app_id, version, count):
+    """Subtract deleted comments from a version summary and refresh its last activity"""
+    latest = comments_collection.find_one(
+        {'app_id': app_id, 'version': version},
+        {'_id': 0, 'timestamp': 1},
+        sort=[('timestamp', -1)]
+    )
+    if not latest:
+        comment_summaries_collection.delete_one({'app_id': app_id, 'version': version})
+        return
+    
+    comment_summaries_collection.update_one(
+        {'app_id': app_id, 'version': version},
+        {
+            '$inc': {'comment_count': -count},
+            '$set': {'last_comment_at': latest.get('timestamp')}
+        }
+    )
+
+def get_comment_summaries(app_id):
+    """
+    Get comment counters for every version of an app
+    
+    Args:
+        app_id (str): The app ID
+        
+    Returns:
+        dict: Maps version to {'comment_count': int, 'last_comment_at': timestamp}
+    """
+    summaries = comment_summaries_collection.find({'app_id': app_id}, {'_id': 0, 'app_id': 0})
+    return {summary['version']: summary for summary in summaries}
+
+def rebuild_comment_summaries(app_id=None):
+    """
+    Recompute the per-version comment counters from the comments collection
+    
+    Args:
+        app_id (str, optional): Only rebuild summaries for this app
+        
+    Returns:
+        int: Number of version summaries written
+    """
+    match = {'app_id': app_id} if app_id else {}
+    pipeline = [
+        {'$match': match},
+        {'$group': {
+            '_id': {'app_id': '$app_id', 'version': '$version'},
+            'comment_count': {'$sum': 1},
+            'last_comment_at': {'$max': '$timestamp'}
+        }}
+    ]
+    
+    operations = []
+    for group in comments_collection.aggregate(pipeline, allowDiskUse=True):
+        key = {'app_id': group['_id']['app_id'], 'version': group['_id']['version']}
+        operations.append(ReplaceOne(key, {
+            **key,
+            'comment_count': group['comment_count'],
+            'last_comment_at': group['last_comment_at']
+        }, upsert=True))
+    
+    # Drop summaries for versions that no longer have comments
+    comment_summaries_collection.delete_many(match)
+    if operations:
+        comment_summaries_collection.bulk_write(operations, ordered=False)
+    
+    return len(operations)
+
 # Notification operations
 def create_notification(username, type, content, reference_id=None, reference_type=None, from_user=None):
     """
@@ -658,7 +2163,7 @@ def create_notification(username, type, content, reference_id=None, reference_ty
     
     Args:
         username (str): The username to notify
-        type (str): Notification type (mention, reply, access)
+        type (str): Notification type (mention, reply, access, upload)
         content (str): Notification content
         reference_id (str, optional): ID of the referenced object (comment, app, etc.)
         reference_type (str, optional): Type of the referenced object
@@ -670,9 +2175,9 @@ def create_notification(username, type, content, reference_id=None, reference_ty
     notification = {
         'id': str(uuid.uuid4()),
         'username': username,
-        'type': type,  # mention, reply, access
+        'type': type,  # mention, reply, access, upload
         'content': content,
-        'timestamp': datetime.now().isoformat(),
+        'timestamp': utc_now(),
         'read': False,
         'reference_id': reference_id,
         'reference_type': reference_type,
@@ -692,7 +2197,7 @@ def create_notification(username, type, content, reference_id=None, reference_ty
     
     return notification
 
-def get_user_notifications(username, limit=20, include_read=False):
+def get_user_notifications(username, limit=20, include_read=False, after=None, before=None):
     """
     Get notifications for a user
     
@@ -700,20 +2205,109 @@ def get_user_notifications(username, limit=20, include_read=False):
         username (str): The username to get notifications for
         limit (int): Maximum number of notifications to return
         include_read (bool): Whether to include read notifications
+        after (str, optional): Cursor; only return notifications older than it
+        before (str, optional): Cursor; only return notifications newer than it
         
     Returns:
         list: List of notifications
     """
-    query = {'username': username}
-    if not include_read:
-        query['read'] = False
+    return get_user_notifications_page(username, limit, include_read, after, before)['notifications']
+
+def encode_notification_cursor(notification):
+    """
+    Build an opaque pagination cursor pointing at a notification
+    
+    Args:
+        notification (dict): Notification with `timestamp` and `id`
+        
+    Returns:
+        str: URL-safe cursor string
+    """
+    timestamp = notification.get('timestamp')
+    if isinstance(timestamp, datetime):
+        position = ['d', timestamp.isoformat(), notification.get('id')]
+    else:
+        # Legacy ISO string timestamp (see migrate_notifications.py)
+        position = ['s', timestamp, notification.get('id')]
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode().rstrip('=')
+
+def decode_notification_cursor(cursor):
+    """
+    Decode a cursor created by encode_notification_cursor
+    
+    Args:
+        cursor (str): Cursor string
+        
+    Returns:
+        tuple: (timestamp, notification_id), or (None, None) if the cursor is invalid
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        kind, timestamp, notification_id = json.loads(base64.urlsafe_b64decode(padded))
+        if kind == 'd':
+            timestamp = datetime.fromisoformat(timestamp)
+        return timestamp, notification_id
+    except (ValueError, TypeError):
+        return None, None
+
+def get_user_notifications_page(username, limit=20, include_read=False, after=None, before=None):
+    """
+    Get one page of notifications for a user using keyset pagination
+    
+    Notifications are ordered newest first by (timestamp, id). Pass the
+    returned `next_cursor` as `after` to fetch older notifications, or
+    `prev_cursor` as `before` to poll for newer ones. Each page is a bounded
+    index range scan, so the cost does not grow with how deep the user scrolls.
+    
+    Args:
+        username (str): The username to get notifications for
+        limit (int): Maximum number of notifications to return
+        include_read (bool): Whether to include read notifications
+        after (str, optional): Cursor; only return notifications older than it
+        before (str, optional): Cursor; only return notifications newer than it
         
+    Returns:
+        dict: {'notifications': list, 'next_cursor': str or None, 'prev_cursor': str or None}
+    """
+    # Always constrain `read` so the (username, read, timestamp, id) index can
+    # merge the read and unread ranges instead of sorting in memory
+    query = {
+        'username': username,
+        'read': {'$in': [False, True]} if include_read else False
+    }
+    
+    cursor = before or after
+    timestamp, notification_id = decode_notification_cursor(cursor) if cursor else (None, None)
+    direction = 1 if before and timestamp is not None else -1
+    
+    if timestamp is not None:
+        op = '$gt' if direction == 1 else '$lt'
+        query['$or'] = [
+            {'timestamp': {op: timestamp}},
+            {'timestamp': timestamp, 'id': {op: notification_id}}
+        ]
+    
+    # Fetch one extra row to know whether another page exists
     notifications = list(notifications_collection.find(
         query, 
         {'_id': 0}
-    ).sort('timestamp', -1).limit(limit))
+    ).sort([('timestamp', direction), ('id', direction)]).limit(limit + 1))
     
-    return notifications
+    has_more = len(notifications) > limit
+    notifications = notifications[:limit]
+    
+    if direction == 1:
+        # Newer-than queries run oldest first; flip back to newest first
+        notifications.reverse()
+        has_older = True
+    else:
+        has_older = has_more
+    
+    return {
+        'notifications': notifications,
+        'next_cursor': encode_notification_cursor(notifications[-1]) if notifications and has_older else None,
+        'prev_cursor': encode_notification_cursor(notifications[0]) if notifications else before
+    }
 
 def mark_notification_read(notification_id, username=None):
     """
@@ -732,7 +2326,7 @@ def mark_notification_read(notification_id, username=None):
         
     result = notifications_collection.update_one(
         query,
-        {'$set': {'read': True}}
+        {'$set': {'read': True, 'read_at': utc_now()}}
     )
     
     return result.modified_count > 0
@@ -749,7 +2343,7 @@ def mark_all_notifications_read(username):
     """
     result = notifications_collection.update_many(
         {'username': username, 'read': False},
-        {'$set': {'read': True}}
+        {'$set': {'read': True, 'read_at': utc_now()}}
     )
     
     return result.modified_count
@@ -800,6 +2394,47 @@ def delete_notification(notification_id, username=None):
     result = notifications_collection.delete_one(query)
     return result.deleted_count > 0
 
+def archive_expired_notifications(archive_dir=None, retention_days=None, batch_size=1000):
+    """
+    Move read notifications past the retention window into a compressed archive
+    
+    Expired notifications are written to a gzipped JSONL file in archive_dir
+    and removed from the collection once the file has been closed.
+    
+    Args:
+        archive_dir (str, optional): Directory for archive files, defaults to NOTIFICATION_ARCHIVE_DIR
+        retention_days (int, optional): Age in days after being read, defaults to NOTIFICATION_RETENTION_DAYS
+        batch_size (int): Number of notifications fetched and deleted per round trip
+        
+    Returns:
+        int: Number of notifications archived
+    """
+    archive_dir = archive_dir or NOTIFICATION_ARCHIVE_DIR
+    if retention_days is None:
+        retention_days = NOTIFICATION_RETENTION_DAYS
+    if not archive_dir or retention_days <= 0:
+        return 0
+    
+    cutoff = utc_now() - timedelta(days=retention_days)
+    query = {'read_at': {'$lt': cutoff}}
+    if notifications_collection.count_documents(query, limit=1) == 0:
+        return 0
+    
+    os.makedirs(archive_dir, exist_ok=True)
+    archive_path = os.path.join(archive_dir, f"notifications-{utc_now():%Y%m%dT%H%M%S}.jsonl.gz")
+    
+    archived_ids = []
+    with gzip.open(archive_path, 'wt', encoding='utf-8') as archive_file:
+        for notification in notifications_collection.find(query).batch_size(batch_size):
+            archived_ids.append(notification.pop('_id'))
+            archive_file.write(json.dumps(notification, default=json_default) + '\n')
+    
+    # Only delete once everything is safely on disk
+    for start in range(0, len(archived_ids), batch_size):
+        notifications_collection.delete_many({'_id': {'$in': archived_ids[start:start + batch_size]}})
+    
+    return len(archived_ids)
+
 def get_notification_details(notification_id, username=None):
     """
     Get detailed information about a notification for navigation
@@ -47,26 +47,23 @@ def update_release_notes_in_db():
 
 Released on {current_date}"""
             
-            app['release_notes'] = release_notes
+            db.update_app(app_id, {'release_notes': release_notes})
             updated_apps += 1
             print(f"Added release notes to app: {app_name}")
         
         # Update version release notes if not present
-        for version in app.get('versions', []):
+        for version in db.get_all_app_versions(app_id):
             if not version.get('release_notes'):
                 version_num = version.get('version', 'Unknown')
                 version_date = version.get('upload_date', '').split('T')[0] if version.get('upload_date') else 'Unknown date'
                 
-                version['release_notes'] = f"""Version {version_num}
+                db.update_app_version(version['id'], {'release_notes': f"""Version {version_num}
 
 - Release date: {version_date}
 - Maintenance update
-- Bug fixes and improvements"""
+- Bug fixes and improvements"""})
                 
                 updated_versions += 1
-        
-        # Save the updated app
-        db.save_app(app)
     
     # Print summary
     print(f"\nUpdate complete!")
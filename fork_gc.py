@@ -0,0 +1,140 @@
+"""
+Garbage collection of temporary GitHub repositories.
+
+Every GitHub build pushes its sources and workflow to a temporary repository
+("fork") under the build account. Forks are normally deleted by a
+cleanup_fork job when their build ends, but that job can give up, and a worker
+can die between creating a fork and recording it on the build. collect_forks()
+runs periodically from the job scheduler and reconciles GitHub with the build
+records instead:
+
+1. List the account's repositories created for builds (recognized by their
+   description, so other repositories are never touched).
+2. Keep forks of queued and running builds, forks of successful builds unless
+   AUTO_CLEANUP_FORKS is set, and forks younger than FORK_GC_MIN_AGE_MINUTES.
+3. Delete the other forks, at most FORK_GC_BATCH_SIZE per run with
+   FORK_GC_DELETE_DELAY_SECONDS between deletions to stay clear of GitHub's
+   secondary rate limits; the rest wait for the next run.
+4. Set fork_cleaned in one update on every finished build whose fork is gone.
+"""
+
+import os
+import re
+import time
+import logging
+from datetime import timedelta
+
+import database as db
+
+# Seconds between garbage collection runs
+FORK_GC_INTERVAL_SECONDS = int(os.environ.get('FORK_GC_INTERVAL_SECONDS', '3600'))
+
+# Forks deleted per run, and the pause between two deletions (seconds)
+FORK_GC_BATCH_SIZE = int(os.environ.get('FORK_GC_BATCH_SIZE', '30'))
+FORK_GC_DELETE_DELAY_SECONDS = float(os.environ.get('FORK_GC_DELETE_DELAY_SECONDS', '2'))
+
+# Forks younger than this are left alone, as their build may not have recorded them yet
+FORK_GC_MIN_AGE_MINUTES = int(os.environ.get('FORK_GC_MIN_AGE_MINUTES', '60'))
+
+# Delete the forks of successful builds too (they are kept by default for inspection)
+AUTO_CLEANUP_FORKS = os.environ.get('AUTO_CLEANUP_FORKS', 'false').lower() == 'true'
+
+# Fork names end with the first 8 characters of the build ID
+FORK_BUILD_PREFIX = re.compile(r'-([0-9a-f]{8})$')
+
+def is_orphan(fork, build, active_prefixes, cutoff):
+    """
+    Decide whether a fork can be deleted
+
+    Args:
+        fork (dict): owner, repo and created_at of the fork
+        build (dict or None): The build recording the fork, if any
+        active_prefixes (set): First 8 characters of the IDs of queued and running builds
+        cutoff (datetime): Forks created after this UTC time are kept
+
+    Returns:
+        bool: True if nothing needs the fork anymore
+    """
+    if fork.get('created_at') is None or fork['created_at'] > cutoff:
+        return False
+
+    if build is None:
+        # Not recorded on any build: keep it if a running build may still record it
+        match = FORK_BUILD_PREFIX.search(fork['repo'])
+        return not (match and match.group(1) in active_prefixes)
+
+    if build.get('status') in db.ACTIVE_BUILD_STATUSES:
+        return False
+    return build.get('status') != 'completed' or AUTO_CLEANUP_FORKS
+
+def collect_forks(batch_size=None):
+    """
+    Delete forks no build needs anymore and record deleted forks on their builds
+
+    Args:
+        batch_size (int, optional): Forks deleted at most (defaults to FORK_GC_BATCH_SIZE)
+
+    Raises:
+        RuntimeError: If the forks couldn't be listed
+
+    Returns:
+        dict: listed, orphaned, deleted and failed fork counts, and marked
+              (builds whose fork_cleaned was set)
+    """
+    # Import here to keep app startup fast
+    from utils import github_utils
+
+    if not github_utils.GITHUB_API_TOKEN:
+        return {'skipped': "GitHub API token not configured"}
+
+    batch_size = FORK_GC_BATCH_SIZE if batch_size is None else batch_size
+    owner, forks = github_utils.list_build_forks()
+    if owner is None:
+        raise RuntimeError("Could not list the build forks on GitHub")
+
+    cutoff = db.utc_now() - timedelta(minutes=FORK_GC_MIN_AGE_MINUTES)
+    active_prefixes = {build_id[:8] for build_id in db.get_active_build_ids()}
+
+    orphans = []
+    by_owner = {}
+    for fork in forks:
+        by_owner.setdefault(fork['owner'], []).append(fork)
+    for fork_owner, owner_forks in by_owner.items():
+        builds = {
+            build['fork_info']['repo']: build
+            for build in db.get_fork_builds(fork_owner, [fork['repo'] for fork in owner_forks])
+        }
+        orphans.extend(
+            fork for fork in owner_forks
+            if is_orphan(fork, builds.get(fork['repo']), active_prefixes, cutoff)
+        )
+
+    deleted = set()
+    failed = 0
+    for index, fork in enumerate(orphans[:batch_size]):
+        if index:
+            time.sleep(FORK_GC_DELETE_DELAY_SECONDS)
+        if github_utils.cleanup_fork(fork['owner'], fork['repo']):
+            deleted.add((fork['owner'], fork['repo']))
+        else:
+            failed += 1
+
+    # Forks still on GitHub; the listing is complete for the account, so any
+    # other fork of its finished builds is gone
+    remaining = {(fork['owner'], fork['repo']) for fork in forks} - deleted
+    cleaned = [
+        build['id'] for build in db.get_uncleaned_fork_builds(owner)
+        if (owner, build['fork_info'].get('repo')) not in remaining
+    ]
+    marked = db.mark_forks_cleaned(cleaned)
+
+    if deleted or failed:
+        logging.info(f"Fork garbage collection deleted {len(deleted)} of {len(orphans)} orphaned forks"
+                     f"{f', {failed} failed' if failed else ''}")
+    return {
+        'listed': len(forks),
+        'orphaned': len(orphans),
+        'deleted': len(deleted),
+        'failed': failed,
+        'marked': marked
+    }
@@ -0,0 +1,306 @@
+"""
+Durable background jobs.
+
+Slow work (IPA metadata extraction, icon decoding, app and build updates,
+GitHub builds, fork cleanup, notification fan-out and periodic sweeps) is
+queued as a job document in MongoDB and picked up by worker threads, so the
+request that submitted it can answer right away with the job id. Failed jobs
+are retried with a growing delay until JOB_MAX_ATTEMPTS is reached.
+
+Workers run in dedicated processes (worker.py); web processes only queue jobs.
+Jobs with a higher priority are claimed first. A claimed job is leased to its
+worker, which renews the lease while the handler runs; if the worker dies, the
+scheduler queues the job again once the lease has expired. The scheduler also
+queues periodic jobs (register_schedule), each once per interval across all
+processes.
+
+Jobs can carry a dedup key (e.g. the content hash of an uploaded IPA): while a
+job with that key is queued, running or completed, submitting the same key
+returns the existing job instead of creating a new one.
+"""
+
+import os
+import uuid
+import socket
+import time
+import logging
+import threading
+from datetime import timedelta
+
+import database as db
+
+# Number of worker threads started by worker.py and the 'jobs' background role
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '2'))
+
+# Attempts before a job is marked as failed
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', '3'))
+
+# Delay before the first retry; later retries wait proportionally longer (seconds)
+JOB_RETRY_DELAY_SECONDS = int(os.environ.get('JOB_RETRY_DELAY_SECONDS', '30'))
+
+# How long an idle worker waits before looking for new jobs (seconds)
+JOB_POLL_SECONDS = float(os.environ.get('JOB_POLL_SECONDS', '1'))
+
+# How long a claimed job stays with its worker without a renewal (seconds);
+# running jobs renew their lease every third of this
+JOB_LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS', '300'))
+
+# How often the scheduler queues due periodic jobs and recovers expired leases (seconds)
+JOB_SCHEDULER_SECONDS = float(os.environ.get('JOB_SCHEDULER_SECONDS', '30'))
+
+# Job priorities; higher runs first
+PRIORITY_HIGH = 10
+PRIORITY_NORMAL = 0
+PRIORITY_LOW = -10
+
+_handlers = {}  # job type -> (handler, on_failure)
+_schedules = {}  # job type -> (interval seconds, priority)
+_wakeup = threading.Event()
+_stopping = threading.Event()
+_workers = []
+
+def register_handler(job_type, handler, on_failure=None):
+    """
+    Register the function that runs jobs of a type
+
+    Args:
+        job_type (str): The job type
+        handler (callable): Called with the job's payload; its return value is stored as the result
+        on_failure (callable, optional): Called with the payload and error once the last attempt failed
+    """
+    _handlers[job_type] = (handler, on_failure)
+
+def get_job_types():
+    """Get the job types that have a handler"""
+    return list(_handlers)
+
+def register_schedule(job_type, interval_seconds, priority=PRIORITY_LOW):
+    """
+    Queue a job of a type periodically, with an empty payload
+
+    Args:
+        job_type (str): The job type (its handler is registered separately)
+        interval_seconds (int): Time between runs
+        priority (int): Priority of the queued jobs
+    """
+    _schedules[job_type] = (interval_seconds, priority)
+
+def enqueue(job_type, payload, dedup_key=None, created_by=None, max_attempts=None,
+            priority=PRIORITY_NORMAL, delay=0):
+    """
+    Queue a job
+
+    Args:
+        job_type (str): The job type
+        payload (dict): Arguments for the handler
+        dedup_key (str, optional): Key identifying duplicate submissions
+        created_by (str, optional): Username allowed to see the job
+        max_attempts (int, optional): Attempts before giving up (defaults to JOB_MAX_ATTEMPTS)
+        priority (int): Jobs with a higher priority are claimed first
+        delay (float): Seconds before the job may run
+
+    Returns:
+        tuple: (job, created) where created is False if an existing job was returned
+    """
+    now = db.utc_now()
+    job = {
+        'id': str(uuid.uuid4()),
+        'type': job_type,
+        'payload': payload,
+        'status': 'queued',
+        'priority': priority,
+        'attempts': 0,
+        'max_attempts': max_attempts or JOB_MAX_ATTEMPTS,
+        'created_by': created_by,
+        'created_at': now,
+        'updated_at': now,
+        'run_after': now + timedelta(seconds=delay)
+    }
+    if dedup_key:
+        job['dedup_key'] = f"{job_type}:{dedup_key}"
+
+    job, created = db.create_job(job)
+    if created:
+        _wakeup.set()
+    return job, created
+
+def _fail(job, error, **conditions):
+    """Mark a job as failed and run its failure handler"""
+    if not db.fail_job(job['id'], error, **conditions):
+        return
+
+    _, on_failure = _handlers.get(job['type'], (None, None))
+    if on_failure:
+        try:
+            on_failure(job['payload'], error)
+        except Exception as e:
+            logging.error(f"Error in failure handler for job {job['id']}: {str(e)}")
+
+def _renew_lease(job, worker_id, done):
+    """Renew a running job's lease until `done` is set"""
+    while not done.wait(JOB_LEASE_SECONDS / 3):
+        try:
+            if not db.renew_job_lease(job['id'], worker_id, JOB_LEASE_SECONDS):
+                logging.warning(f"Job {job['id']} ({job['type']}) lost its lease")
+                return
+        except Exception as e:
+            logging.error(f"Error renewing the lease of job {job['id']}: {str(e)}")
+
+def run_job(job, worker_id=None):
+    """
+    Run a claimed job and record its outcome
+
+    Args:
+        job (dict): The job as returned by database.claim_next_job
+        worker_id (str, optional): The worker holding the job; the outcome is
+            only recorded while the worker still holds it
+    """
+    handler, _ = _handlers.get(job['type'], (None, None))
+    if not handler:
+        db.fail_job(job['id'], f"No handler for job type {job['type']}")
+        return
+
+    done = threading.Event()
+    if worker_id:
+        threading.Thread(target=_renew_lease, args=(job, worker_id, done), daemon=True).start()
+
+    try:
+        result = handler(job['payload'])
+    except Exception as e:
+        error = str(e)
+        if job['attempts'] < job.get('max_attempts', JOB_MAX_ATTEMPTS):
+            delay = JOB_RETRY_DELAY_SECONDS * job['attempts']
+            logging.warning(f"Job {job['id']} ({job['type']}) failed, retrying in {delay}s: {error}")
+            db.retry_job(job['id'], error, db.utc_now() + timedelta(seconds=delay), worker_id=worker_id)
+            return
+
+        logging.error(f"Job {job['id']} ({job['type']}) failed after {job['attempts']} attempts: {error}")
+        _fail(job, error, worker_id=worker_id)
+        return
+    finally:
+        done.set()
+
+    if not db.complete_job(job['id'], result, worker_id=worker_id):
+        logging.warning(f"Job {job['id']} ({job['type']}) finished after losing its lease, result not recorded")
+
+def run_next_job(worker_id, job_types=None):
+    """
+    Claim and run one job
+
+    Args:
+        worker_id (str): Identifies the worker
+        job_types (list, optional): Only run jobs of these types (defaults to every registered type)
+
+    Returns:
+        bool: True if a job was run
+    """
+    job = db.claim_next_job(worker_id, job_types or list(_handlers), JOB_LEASE_SECONDS)
+    if not job:
+        return False
+    run_job(job, worker_id)
+    return True
+
+def recover_expired_jobs():
+    """
+    Queue jobs again whose worker stopped renewing their lease
+
+    The interrupted attempt counts: jobs that used up their attempts are
+    marked as failed instead.
+
+    Returns:
+        int: Number of jobs queued again
+    """
+    now = db.utc_now()
+    recovered = 0
+    for job in db.get_expired_jobs():
+        error = f"Worker {job.get('worker')} stopped while running the job"
+        if job['attempts'] < job.get('max_attempts', JOB_MAX_ATTEMPTS):
+            if db.retry_job(job['id'], error, now, lease_expired_before=now):
+                recovered += 1
+        else:
+            _fail(job, error, lease_expired_before=now)
+
+    if recovered:
+        logging.warning(f"Queued {recovered} jobs again after their lease expired")
+        _wakeup.set()
+    return recovered
+
+def run_schedules():
+    """
+    Queue the periodic jobs that are due
+
+    Returns:
+        int: Number of jobs queued
+    """
+    queued = 0
+    for job_type, (interval, priority) in _schedules.items():
+        if db.claim_schedule(job_type, interval):
+            enqueue(job_type, {}, priority=priority)
+            queued += 1
+    return queued
+
+def _worker_loop(worker_id, job_types):
+    while not _stopping.is_set():
+        try:
+            if run_next_job(worker_id, job_types):
+                continue
+        except Exception as e:
+            logging.error(f"Error in job worker {worker_id}: {str(e)}")
+
+        _wakeup.wait(JOB_POLL_SECONDS)
+        _wakeup.clear()
+
+def _scheduler_loop():
+    while not _stopping.is_set():
+        try:
+            recover_expired_jobs()
+            run_schedules()
+        except Exception as e:
+            logging.error(f"Error in job scheduler: {str(e)}")
+
+        _stopping.wait(JOB_SCHEDULER_SECONDS)
+
+def start_workers(count=None, job_types=None):
+    """
+    Start job worker threads in this process
+
+    Args:
+        count (int, optional): Number of workers (defaults to JOB_WORKERS)
+        job_types (list, optional): Only run jobs of these types
+
+    Returns:
+        int: Number of workers started
+    """
+    count = JOB_WORKERS if count is None else count
+    for _ in range(count):
+        worker_id = f"{socket.gethostname()}:{os.getpid()}:{len(_workers)}"
+        thread = threading.Thread(target=_worker_loop, args=(worker_id, job_types), name=f"job-worker-{len(_workers)}")
+        thread.daemon = True
+        thread.start()
+        _workers.append(thread)
+    return count
+
+def start_scheduler():
+    """Start the thread that queues periodic jobs and recovers expired leases"""
+    thread = threading.Thread(target=_scheduler_loop, name='job-scheduler')
+    thread.daemon = True
+    thread.start()
+    return thread
+
+def stop_workers(timeout=None):
+    """
+    Stop claiming jobs and wait for the running ones to finish
+
+    Args:
+        timeout (float, optional): Seconds to wait in total
+
+    Returns:
+        bool: True if every worker finished; jobs still running are queued
+              again once their lease expires
+    """
+    _stopping.set()
+    _wakeup.set()
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    for thread in _workers:
+        thread.join(None if deadline is None else max(0, deadline - time.monotonic()))
+    return not any(thread.is_alive() for thread in _workers)
@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+# Script to create the database indexes and default data
+#
+# The web app no longer builds indexes when it starts, so serverless cold
+# starts stay fast. Run this once per deploy (and after upgrading) before
+# the new code serves traffic. It is safe to run repeatedly.
+#
+# Usage:
+#   python3 ./migrate.py
+
+import sys
+import time
+
+import database as db
+
+if __name__ == "__main__":
+    try:
+        started = time.perf_counter()
+        db.create_indexes()
+        print("Indexes are up to date")
+
+        db.ensure_default_admin()
+        print(f"Done in {time.perf_counter() - started:.2f}s")
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        sys.exit(1)
@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+# Script to prepare existing apps for indexed search
+#
+# Creates the search indexes and backfills the lowercase `name_lower` and
+# `bundle_id_lower` fields used for prefix (type-ahead) matching. Apps saved
+# after this change get the fields automatically.
+#
+# Usage:
+#   python3 ./migrate_app_search.py
+
+import sys
+
+import database as db
+
+if __name__ == "__main__":
+    try:
+        db.initialize_db()
+        count = db.refresh_app_search_fields()
+        print(f"Updated search fields on {count} apps")
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        sys.exit(1)
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# Script to move the version history embedded in app documents into the
+# `app_versions` collection
+#
+# Apps used to keep every upload in a `versions` array, which was loaded with
+# every app lookup and rewritten with every upload. Each entry becomes an
+# `app_versions` document and the array is removed from the app. Running the
+# script again skips apps that are already migrated.
+#
+# Usage:
+#   python3 ./migrate_app_versions.py
+
+import sys
+
+import database as db
+
+def migrate_app(app_id):
+    """
+    Move one app's embedded versions into app_versions
+
+    Returns:
+        int: Number of versions moved, or None if the app has no embedded history
+    """
+    app = db.apps_collection.find_one({'id': app_id, 'versions': {'$exists': True}}, {'_id': 0})
+    if not app:
+        return None
+
+    versions = list(app.get('versions') or [])
+    # Apps that never had a history entry for their current upload get one now
+    if app.get('file_id') and not any(v.get('file_id') == app['file_id'] for v in versions):
+        versions.append({
+            'version': app.get('version'),
+            'build_number': app.get('build_number'),
+            'filename': app.get('filename'),
+            'file_id': app.get('file_id'),
+            'upload_date': app.get('upload_date'),
+            'release_notes': app.get('release_notes')
+        })
+
+    for version in versions:
+        # save_app_version upserts by file, so an interrupted run can be repeated
+        db.save_app_version(app_id, version)
+
+    db.apps_collection.update_one({'id': app_id}, {'$unset': {'versions': ''}})
+    return len(versions)
+
+def migrate_app_versions():
+    """
+    Migrate every app that still has an embedded `versions` array
+
+    Returns:
+        tuple: (apps migrated, versions moved)
+    """
+    app_ids = [app['id'] for app in db.apps_collection.find({'versions': {'$exists': True}}, {'_id': 0, 'id': 1})]
+
+    apps = 0
+    moved = 0
+    for app_id in app_ids:
+        count = migrate_app(app_id)
+        if count is None:
+            continue
+        apps += 1
+        moved += count
+        print(f"Migrated {count} versions of {app_id}")
+
+    return apps, moved
+
+if __name__ == "__main__":
+    try:
+        # Also rebuilds the app search index without the embedded release notes
+        db.initialize_db()
+
+        apps, moved = migrate_app_versions()
+        print(f"Moved {moved} versions of {apps} apps into app_versions")
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        sys.exit(1)
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# Script to move inline file contents into the content-addressed blob store
+#
+# Files stored before deduplication keep their bytes in the `files` document.
+# This moves each one into `blobs` (sharing content with identical files) and
+# prints how much space deduplication saves. With --delta, IPAs are also
+# re-stored as ZIP segments so versions of an app share unchanged members.
+#
+# Usage:
+#   python3 ./migrate_file_blobs.py [--report] [--delta]
+
+import argparse
+import sys
+import tempfile
+
+import database as db
+
+def migrate_file_blobs():
+    """
+    Replace inline `data` in file documents with a reference to a blob
+
+    Returns:
+        int: Number of files migrated
+    """
+    migrated = 0
+    # Only ids are fetched up front; contents are loaded one file at a time
+    file_ids = [
+        file_doc['_id']
+        for file_doc in db.files_collection.find({'sha256': {'$exists': False}, 'data': {'$exists': True}}, {'_id': 1})
+    ]
+
+    for _id in file_ids:
+        file_doc = db.files_collection.find_one({'_id': _id, 'sha256': {'$exists': False}}, {'data': 1})
+        if not file_doc or file_doc.get('data') is None:
+            continue
+
+        sha256 = db._store_blob(file_doc['data'])
+        result = db.files_collection.update_one(
+            {'_id': _id, 'sha256': {'$exists': False}},
+            {'$set': {'sha256': sha256, 'size': len(file_doc['data'])}, '$unset': {'data': ''}}
+        )
+        if result.modified_count:
+            migrated += 1
+        else:
+            # Migrated concurrently; drop the extra reference
+            db._release_blob(sha256)
+
+    return migrated
+
+def migrate_delta_storage():
+    """
+    Re-store IPAs kept as a single blob as shared ZIP segments
+
+    Returns:
+        int: Number of files converted
+    """
+    converted = 0
+    file_ids = [
+        file_doc['file_id']
+        for file_doc in db.files_collection.find(
+            {'sha256': {'$exists': True}, 'layout': {'$exists': False}, 'filename': {'$regex': r'\.ipa$', '$options': 'i'}},
+            {'file_id': 1}
+        )
+    ]
+
+    for file_id in file_ids:
+        with tempfile.TemporaryFile() as ipa_file:
+            if not db.read_file_to(file_id, ipa_file):
+                continue
+            if db.store_file_as_delta(file_id, ipa_file):
+                converted += 1
+
+    return converted
+
+def print_report(report):
+    """Print the output of database.get_blob_storage_report"""
+    mb = 1024 * 1024
+    print(f"Files: {report['files']} ({report['inline_files']} not yet migrated, {report['delta_files']} stored as ZIP segments)")
+    print(f"Unique blobs: {report['blobs']}")
+    print(f"Logical size: {report['logical_bytes'] / mb:.1f} MB")
+    print(f"Stored size: {report['stored_bytes'] / mb:.1f} MB")
+    print(f"Saved by deduplication: {report['bytes_saved'] / mb:.1f} MB")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Move file contents into the deduplicated blob store')
+    parser.add_argument('--report', action='store_true', help='Only print the storage report')
+    parser.add_argument('--delta', action='store_true', help='Also split IPAs into shared ZIP members')
+    args = parser.parse_args()
+
+    try:
+        db.initialize_db()
+
+        if not args.report:
+            print("Migrating files...")
+            count = migrate_file_blobs()
+            print(f"Migrated {count} files")
+
+            if args.delta:
+                print("Splitting IPAs into ZIP members...")
+                count = migrate_delta_storage()
+                print(f"Converted {count} files")
+
+        print_report(db.get_blob_storage_report())
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        sys.exit(1)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# Script to convert stored notifications to the retention-aware schema
+#
+# - `timestamp` ISO strings (server local time) become native UTC datetimes
+# - notifications that are already read get a `read_at` date so the TTL
+#   index can expire them
+#
+# Usage:
+#   python3 ./migrate_notifications.py [--batch-size N] [--archive]
+
+import argparse
+import sys
+from pymongo import UpdateOne
+
+import database as db
+from schema import parse_timestamp
+
+def migrate_notifications(batch_size=1000):
+    """
+    Rewrite string timestamps as datetimes and backfill `read_at`
+
+    Args:
+        batch_size (int): Number of updates sent per bulk write
+
+    Returns:
+        int: Number of notifications updated
+    """
+    query = {'$or': [
+        {'timestamp': {'$type': 'string'}},
+        {'read': True, 'read_at': {'$exists': False}}
+    ]}
+
+    updated = 0
+    operations = []
+    cursor = db.notifications_collection.find(
+        query, {'_id': 1, 'timestamp': 1, 'read': 1, 'read_at': 1}
+    ).batch_size(batch_size)
+
+    for notification in cursor:
+        timestamp = notification.get('timestamp')
+        if isinstance(timestamp, str):
+            timestamp = parse_timestamp(timestamp) or db.utc_now()
+
+        changes = {'timestamp': timestamp}
+        if notification.get('read') and 'read_at' not in notification:
+            changes['read_at'] = timestamp
+
+        operations.append(UpdateOne({'_id': notification['_id']}, {'$set': changes}))
+
+        if len(operations) >= batch_size:
+            updated += db.notifications_collection.bulk_write(operations, ordered=False).modified_count
+            operations = []
+
+    if operations:
+        updated += db.notifications_collection.bulk_write(operations, ordered=False).modified_count
+
+    return updated
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Migrate notifications to native timestamps')
+    parser.add_argument('--batch-size', type=int, default=1000, help='Documents per bulk write')
+    parser.add_argument('--archive', action='store_true',
+                        help='Archive expired notifications after migrating (needs NOTIFICATION_ARCHIVE_DIR)')
+    args = parser.parse_args()
+
+    try:
+        print("Migrating notifications...")
+        count = migrate_notifications(args.batch_size)
+        print(f"Updated {count} notifications")
+
+        # Indexes are created after the data is converted so the TTL index
+        # starts working immediately
+        db.initialize_db()
+
+        if args.archive:
+            archived = db.archive_expired_notifications(batch_size=args.batch_size)
+            print(f"Archived {archived} expired notifications")
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        sys.exit(1)
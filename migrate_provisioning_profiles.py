@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# Script to extract provisioning profiles from IPAs uploaded before profiles
+# were stored at ingest
+#
+# Usage:
+#   python3 ./migrate_provisioning_profiles.py
+
+import sys
+import tempfile
+import zipfile
+
+import database as db
+from utils.file_utils import extract_provisioning_profile
+
+def find_info_plist(ipa):
+    """Find the app's Info.plist in an opened IPA, as extract_app_info does"""
+    for name in ipa.namelist():
+        if 'Info.plist' in name:
+            return name
+    return None
+
+def migrate_provisioning_profiles():
+    """
+    Store the embedded profile of every app file that doesn't have one yet
+
+    Returns:
+        tuple: (files with a profile stored, files checked)
+    """
+    stored = 0
+    checked = 0
+
+    for app in db.apps_collection.find({}, {'_id': 0, 'id': 1, 'file_id': 1}):
+        file_ids = {app.get('file_id')} | {v.get('file_id') for v in db.get_all_app_versions(app['id'], fields=['file_id'])}
+        file_ids.discard(None)
+
+        for file_id in file_ids:
+            if db.provisioning_profiles_collection.count_documents({'file_id': file_id}, limit=1):
+                continue
+            checked += 1
+
+            with tempfile.TemporaryFile() as ipa_file:
+                if not db.read_file_to(file_id, ipa_file):
+                    continue
+                ipa_file.seek(0)
+                try:
+                    with zipfile.ZipFile(ipa_file) as ipa:
+                        plist_path = find_info_plist(ipa)
+                        profile = extract_provisioning_profile(ipa, plist_path) if plist_path else None
+                except zipfile.BadZipFile:
+                    profile = None
+
+            if profile:
+                db.save_provisioning_profile(file_id, app['id'], profile)
+                stored += 1
+
+    return stored, checked
+
+if __name__ == "__main__":
+    try:
+        db.initialize_db()
+        print("Extracting provisioning profiles...")
+        stored, checked = migrate_provisioning_profiles()
+        print(f"Stored {stored} profiles from {checked} files")
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        sys.exit(1)
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# Script to convert stored timestamps to native UTC datetimes
+#
+# Dates used to be stored as ISO strings in server local time (and file
+# upload dates as the TZ setting). Every field listed in
+# schema.DATETIME_FIELDS that still holds a string is rewritten as a UTC
+# datetime so sorting, range queries and TTL indexes work. Values that can't
+# be parsed fall back to the document's creation time (from its ObjectId).
+#
+# Usage:
+#   python3 ./migrate_timestamps.py [--batch-size N] [--collection NAME]
+
+import argparse
+import sys
+from pymongo import UpdateOne
+
+import database as db
+import schema
+
+def get_path(document, field):
+    """Get a possibly nested (dotted) field of a document"""
+    value = document
+    for key in field.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+def migrate_collection(name, fields, batch_size=1000):
+    """
+    Rewrite string timestamps of one collection as datetimes
+
+    Args:
+        name (str): Collection name
+        fields (list): Datetime fields of the collection
+        batch_size (int): Number of updates sent per bulk write
+
+    Returns:
+        int: Number of documents updated
+    """
+    collection = db.db[name]
+    query = {'$or': [{field: {'$type': 'string'}} for field in fields]}
+    projection = {field: 1 for field in fields}
+
+    updated = 0
+    operations = []
+    for document in collection.find(query, projection).batch_size(batch_size):
+        changes = {}
+        for field in fields:
+            value = get_path(document, field)
+            if isinstance(value, str):
+                changes[field] = schema.parse_timestamp(value) or schema.parse_timestamp(document['_id'].generation_time)
+
+        operations.append(UpdateOne({'_id': document['_id']}, {'$set': changes}))
+        if len(operations) >= batch_size:
+            updated += collection.bulk_write(operations, ordered=False).modified_count
+            operations = []
+
+    if operations:
+        updated += collection.bulk_write(operations, ordered=False).modified_count
+
+    return updated
+
+def migrate_timestamps(batch_size=1000, collections=None):
+    """
+    Migrate every collection in schema.DATETIME_FIELDS
+
+    Args:
+        batch_size (int): Number of updates sent per bulk write
+        collections (list, optional): Only migrate these collections
+
+    Returns:
+        dict: Collection name -> documents updated
+    """
+    results = {}
+    for name, fields in schema.DATETIME_FIELDS.items():
+        if collections and name not in collections:
+            continue
+        results[name] = migrate_collection(name, fields, batch_size)
+        print(f"{name}: updated {results[name]} documents")
+
+    # Comment summaries copy the latest comment timestamp
+    if results.get('comments'):
+        db.rebuild_comment_summaries()
+
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Convert stored timestamps to UTC datetimes')
+    parser.add_argument('--batch-size', type=int, default=1000, help='Documents per bulk write')
+    parser.add_argument('--collection', action='append', choices=sorted(schema.DATETIME_FIELDS),
+                        help='Only migrate this collection (can be repeated)')
+    args = parser.parse_args()
+
+    try:
+        results = migrate_timestamps(args.batch_size, args.collection)
+        print(f"Updated {sum(results.values())} documents")
+
+        db.initialize_db()
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        sys.exit(1)
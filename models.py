@@ -1,20 +1,287 @@
 import os
-import threading
+import uuid
+import tempfile
+import re
 import database as db
+import jobs
+import build_queue
+import fork_gc
 import logging
-from utils.file_utils import extract_app_info, extract_minimal_app_info
-from datetime import datetime
+from utils.file_utils import extract_app_info
+from datetime import timedelta
 
-def add_app_version(app_id, file_data, filename, version=None, release_notes=None):
+# Bytes read from an upload stream at a time
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# Seconds between checks of a build's GitHub Actions workflow, and how many
+# checks are made before the build is considered timed out (30 minutes)
+WORKFLOW_CHECK_SECONDS = 30
+WORKFLOW_MAX_CHECKS = 60
+
+def store_upload(stream, filename, max_size=None):
+    """
+    Store an uploaded IPA without reading it into memory
+    
+    The stream is read in chunks that are hashed and written to the blob store
+    as they arrive, so memory use stays at a few chunks whatever the file size.
+    
+    Args:
+        stream: File-like object to read the IPA from (e.g. FileStorage.stream)
+        filename (str): The filename of the IPA file
+        max_size (int, optional): Reject uploads larger than this many bytes
+        
+    Returns:
+        dict: The stored file's metadata, including file_id, size and sha256
+    """
+    file_id = str(uuid.uuid4())
+    
+    def chunks():
+        size = 0
+        while True:
+            chunk = stream.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if max_size and size > max_size:
+                raise ValueError(f'File is larger than {max_size // (1024 * 1024)} MB')
+            yield chunk
+    
+    db.save_file_stream(file_id, filename, chunks())
+    return db.get_file(file_id, include_data=False)
+
+def queue_ipa_ingest(stream, filename, username, app_id=None, max_size=None, **fields):
+    """
+    Store an uploaded IPA and queue a job that creates the app or version from it
+    
+    Uploading the same IPA for the same target again returns the existing job
+    (for a new app, only when the same user uploads it again).
+    
+    Args:
+        stream: File-like object to read the IPA from
+        filename (str): The filename of the IPA file
+        username (str): The uploading user
+        app_id (str, optional): Add a version to this app instead of creating a new app
+        max_size (int, optional): Reject uploads larger than this many bytes
+        **fields: release_notes and version for a new version, description for a new app
+        
+    Returns:
+        tuple: (job, created) as returned by jobs.enqueue
+    """
+    file_doc = store_upload(stream, filename, max_size)
+    
+    payload = {
+        'file_id': file_doc['file_id'],
+        'filename': filename,
+        'app_id': app_id,
+        'username': username,
+        **fields
+    }
+    if not app_id:
+        # Chosen here rather than in the job, so a retried attempt updates the
+        # app an interrupted attempt already saved instead of creating another
+        payload['new_app_id'] = str(uuid.uuid4())
+    # New apps are per uploader: another user's upload of the same IPA creates their own app
+    dedup_key = f"{app_id or 'new:' + username}:{file_doc['sha256']}"
+    job, created = jobs.enqueue('ingest_ipa', payload, dedup_key=dedup_key, created_by=username)
+    
+    # The existing job already has its own copy of the file
+    if not created:
+        db.delete_file(file_doc['file_id'])
+    
+    return job, created
+
+def queue_build_ingest(build_id, filename, ipa_data):
+    """
+    Store a CI build's IPA and queue a job that records the build result
+    
+    Args:
+        build_id (str): The build ID
+        filename (str): The IPA filename
+        ipa_data (bytes): The IPA content
+        
+    Returns:
+        tuple: (job, created) as returned by jobs.enqueue
+    """
+    file_id = db.save_build_file(build_id, filename, ipa_data, 'application/octet-stream')
+    file_doc = db.get_file(file_id, include_data=False)
+    
+    payload = {'build_id': build_id, 'file_id': file_id, 'filename': filename}
+    job, created = jobs.enqueue('ingest_build', payload, dedup_key=f"{build_id}:{file_doc['sha256']}")
+    
+    # A repeated webhook call; the first upload is already being processed
+    if not created:
+        db.delete_file(file_id)
+    
+    return job, created
+
+def _analyze_stored_ipa(file_id, filename, build_id=None, delta=True):
+    """
+    Copy a stored IPA to a temporary file and analyze it in the IPA analyzer's process pool
+    
+    Args:
+        file_id (str): ID of the stored IPA
+        filename (str): Original filename
+        build_id (str, optional): Extract the minimal build info instead of full app info
+        delta (bool): Also re-store the IPA as shared ZIP members (see database.store_file_as_delta)
+    
+    Returns:
+        dict: As returned by ipa_analyzer.analyze_ipa
+    """
+    # Import here so the process pool machinery loads with the first upload
+    from utils import ipa_analyzer
+    
+    ipa_file = tempfile.NamedTemporaryFile(suffix='.ipa', delete=False)
+    try:
+        with ipa_file:
+            if not db.read_file_to(file_id, ipa_file):
+                raise ValueError(f"File {file_id} not found")
+        app_info = ipa_analyzer.analyze_ipa(ipa_file.name, filename, build_id)
+        
+        if delta:
+            with open(ipa_file.name, 'rb') as stored:
+                db.store_file_as_delta(file_id, stored)
+        
+        return app_info
+    finally:
+        os.unlink(ipa_file.name)
+
+def ingest_ipa_job(payload):
+    """
+    Job handler: create an app, or add a version to one, from an uploaded IPA
+    
+    Returns:
+        dict: app_id, name, version and build_number of the result
+    """
+    filename = payload['filename']
+    app_info = _analyze_stored_ipa(payload['file_id'], filename)
+    app_info['file_id'] = payload['file_id']
+    
+    if payload.get('app_id'):
+        app = add_app_version(
+            payload['app_id'], None, filename,
+            payload.get('version'), payload.get('release_notes'),
+            app_info=app_info
+        )
+    else:
+        app = app_info
+        profile = app.pop('provisioning', None)
+        
+        # save_app upserts on the id, so retries are idempotent
+        app['id'] = payload.get('new_app_id') or app['id']
+        app['owner'] = payload.get('username')
+        if payload.get('description'):
+            app['description'] = payload['description']
+        if payload.get('release_notes'):
+            app['release_notes'] = payload['release_notes']
+        db.save_app(app)
+        db.save_app_version(app['id'], {
+            'version': app['version'],
+            'build_number': app['build_number'],
+            'filename': filename,
+            'file_id': app['file_id'],
+            'upload_date': app['upload_date'],
+            'release_notes': payload.get('release_notes')
+        })
+        if profile:
+            db.save_provisioning_profile(app['file_id'], app['id'], profile)
+    
+    if payload.get('username'):
+        db.create_notification(
+            payload['username'],
+            'upload',
+            f"{app['name']} {app['version']} ({app['build_number']}) is ready",
+            reference_id=app['id'],
+            reference_type='app'
+        )
+    
+    return {
+        'app_id': app['id'],
+        'name': app['name'],
+        'version': app['version'],
+        'build_number': app['build_number']
+    }
+
+def ingest_ipa_failed(payload, error):
+    """Job failure handler: drop the uploaded file unless an app uses it, and tell the uploader"""
+    file_id = payload['file_id']
+    
+    # A late failure (e.g. while saving the provisioning profile) can leave
+    # the app or version already saved with the file
+    app_id = payload.get('app_id') or payload.get('new_app_id')
+    app = db.get_app(app_id, fields=['file_id']) if app_id else None
+    in_use = app_id and ((app and app.get('file_id') == file_id) or db.get_app_version(app_id, file_id))
+    if not in_use:
+        db.delete_file(file_id)
+    
+    if payload.get('username'):
+        db.create_notification(
+            payload['username'],
+            'upload',
+            f"Processing {payload['filename']} failed: {error}",
+            reference_id=payload.get('app_id'),
+            reference_type='app' if payload.get('app_id') else None
+        )
+
+def ingest_build_job(payload):
+    """
+    Job handler: record a successful CI build from its uploaded IPA
+    
+    Returns:
+        dict: The extracted app info
+    """
+    build_id = payload['build_id']
+    filename = payload['filename']
+    build = db.get_build(build_id)
+    if not build:
+        raise ValueError(f"Build {build_id} not found")
+    
+    app_info = _analyze_stored_ipa(payload['file_id'], filename, build_id)
+    
+    completed = db.update_build(
+        build_id,
+        set={
+            'status': 'completed',
+            'end_time': db.utc_now(),
+            'output_filename': filename,
+            'app_info': app_info
+        },
+        push={'log': f"Build completed successfully.\nOutput: {filename}\n" +
+                     f"App: {app_info.get('name')} {app_info.get('version')} ({app_info.get('build_number')})"},
+        expect_status=db.ACTIVE_BUILD_STATUSES
+    )
+    if not completed:
+        # Cancelled or timed out while the result was on its way; keep that outcome
+        logging.warning(f"Build {build_id} is no longer active, result not recorded")
+        return app_info
+    release_build_slot()
+    
+    # Clean up GitHub fork if configured to do so
+    if fork_gc.AUTO_CLEANUP_FORKS:
+        queue_fork_cleanup(build_id, build.get('fork_info'))
+    
+    return app_info
+
+def ingest_build_failed(payload, error):
+    """Job failure handler: mark the build as failed"""
+    update_build_status(
+        payload['build_id'],
+        'failed',
+        f"Error processing build result: {error}",
+        db.utc_now(),
+        expect_status=db.ACTIVE_BUILD_STATUSES
+    )
+
+def add_app_version(app_id, file_data, filename, version=None, release_notes=None, app_info=None):
     """
     Add a new version of an app to the database
     
     Args:
         app_id (str): The app ID
-        file_data (bytes): The IPA file data
+        file_data (bytes): The IPA file data (None when app_info is given)
         filename (str): The filename of the IPA file
         version (str, optional): The version string
         release_notes (str, optional): Release notes for this version
+        app_info (dict, optional): Info extracted from an IPA that is already stored under app_info['file_id']
         
     Returns:
         dict: The app data
@@ -22,83 +289,68 @@ def add_app_version(app_id, file_data, filename, version=None, release_notes=Non
     # Get app if it exists
     app = db.get_app(app_id)
     
-    # Extract app info from IPA
-    app_info = extract_app_info(file_data, filename)
+    # Extract app info from IPA and store the file
+    if app_info is None:
+        app_info = extract_app_info(file_data, filename)
+        db.save_file(app_info['file_id'], filename, file_data)
+    
+    # The embedded provisioning profile is stored separately, keyed by file
+    profile = app_info.pop('provisioning', None)
+    
+    new_version = {
+        'version': version or app_info['version'],
+        'build_number': app_info['build_number'],
+        'filename': filename,
+        'file_id': app_info['file_id'],
+        'upload_date': app_info['upload_date'],
+        'release_notes': release_notes
+    }
     
     # If app exists, preserve some fields
     if app:
-        old_versions = app.get('versions', [])
-        
-        # Create version entry for the old app
-        if app.get('version') and app.get('build_number'):
-            old_version = {
-                'version': app.get('version'),
-                'build_number': app.get('build_number'),
-                'filename': app.get('filename'),
-                'file_id': app.get('file_id'),
-                'upload_date': app.get('upload_date'),
-                'release_notes': app.get('release_notes')  # Preserve version release notes
-            }
-            
-            # Only add if it doesn't exist already
-            if not any(v.get('version') == old_version['version'] and 
-                     v.get('build_number') == old_version['build_number'] 
-                     for v in old_versions):
-                old_versions.append(old_version)
-        
-        # Create new version entry with current release notes
-        new_version = {
-            'version': version or app_info['version'],
-            'build_number': app_info['build_number'],
+        # Apps from before the version history was kept may lack an entry for their current file
+        if app.get('version') and app.get('build_number') and app.get('file_id'):
+            if not db.get_app_version(app_id, app['file_id']):
+                db.save_app_version(app_id, {
+                    'version': app.get('version'),
+                    'build_number': app.get('build_number'),
+                    'filename': app.get('filename'),
+                    'file_id': app.get('file_id'),
+                    'upload_date': app.get('upload_date'),
+                    'release_notes': app.get('release_notes')  # Preserve version release notes
+                })
+        
+        db.save_app_version(app_id, new_version)
+        
+        # The app document only points at the current version
+        current = {
+            'version': new_version['version'],
+            'build_number': new_version['build_number'],
             'filename': filename,
             'file_id': app_info['file_id'],
             'upload_date': app_info['upload_date'],
             'release_notes': release_notes
         }
+        db.update_app(app_id, current)
+        app.update(current)
         
-        # Update app with new values
-        app['version'] = version or app_info['version']
-        app['build_number'] = app_info['build_number']
-        app['filename'] = filename
-        app['file_id'] = app_info['file_id']
-        app['upload_date'] = app_info['upload_date']
-        
-        # Add the new version to versions list
-        old_versions.append(new_version)
-        app['versions'] = old_versions
-        
-        # Save the file with the new file_id
-        db.save_file(app_info['file_id'], filename, file_data)
-        
-        # Save updated app to database
-        db.save_app(app)
+        if profile:
+            db.save_provisioning_profile(app_info['file_id'], app_id, profile)
         return app
     else:
         # Create new app
         new_app = app_info.copy()
         if version:
             new_app['version'] = version
-            
-        # Create first version entry
-        first_version = {
-            'version': version or app_info['version'],
-            'build_number': app_info['build_number'],
-            'filename': filename,
-            'file_id': app_info['file_id'],
-            'upload_date': app_info['upload_date'],
-            'release_notes': release_notes
-        }
         
-        new_app['versions'] = [first_version]
-        
-        # Save the file
-        db.save_file(app_info['file_id'], filename, file_data)
-        
-        # Save app to database
+        # Save app to database, with its upload as the first version
         db.save_app(new_app)
+        db.save_app_version(new_app['id'], new_version)
+        if profile:
+            db.save_provisioning_profile(app_info['file_id'], new_app['id'], profile)
         return new_app
 
-def update_build_status(build_id, status, log=None, end_time=None):
+def update_build_status(build_id, status, log=None, end_time=None, expect_status=None):
     """
     Update the status of a build in the database
     
@@ -106,32 +358,30 @@ def update_build_status(build_id, status, log=None, end_time=None):
         build_id (str): The ID of the build to update
         status (str): The new status (queued, in_progress, completed, failed, cancelled)
         log (str, optional): The build log to append
-        end_time (str, optional): The end time of the build
+        end_time (datetime, optional): The end time of the build (UTC)
+        expect_status (str or tuple, optional): Only update the build while it has this status
     
     Returns:
         bool: True if successful, False otherwise
     """
-    # Get the build first
-    build = db.get_build(build_id)
-    if not build:
-        return False
-    
-    # Prepare updates    
-    if log is not None:
-        # Let the database function handle the log update directly
-        # to avoid recursive calls
-        result = db.update_build_status(build_id, status, log, end_time)
-        return result
-    
-    # For updates without log changes
-    build['status'] = status
-    
-    if end_time is not None:
-        build['end_time'] = end_time
+    updated = db.update_build_status(build_id, status, log, end_time, expect_status=expect_status)
+    if updated and status not in db.ACTIVE_BUILD_STATUSES:
+        # The build gave up its slot (or left the queue)
+        release_build_slot()
+    return updated
+
+def get_build_log_text(build):
+    """
+    Get a build's log as text
     
-    # Save the build with updates    
-    db.save_build(build)
-    return True
+    Logs are stored as a list of entries; builds from before that may hold a single string.
+    """
+    log = build.get('log')
+    if not log:
+        return ''
+    if isinstance(log, list):
+        return '\n'.join(str(entry) for entry in log)
+    return str(log)
 
 def build_ios_app_from_github(build_id, repo_url, branch, app_name, build_config='Release', 
                         certificate_path=None, provisioning_profile=None, release_notes=None):
@@ -151,11 +401,13 @@ def build_ios_app_from_github(build_id, repo_url, branch, app_name, build_config
     Returns:
         bool: True if build started successfully, False otherwise
     """
-    # Set status to in progress
-    update_build_status(build_id, 'in_progress', "Starting build...")
+    # Set status to in progress (the build queue may already have); stops
+    # here if the build was cancelled
+    if not update_build_status(build_id, 'in_progress', "Starting build...", expect_status=db.ACTIVE_BUILD_STATUSES):
+        return False
     
     # Import here to avoid circular import
-    from utils.github_utils import fork_and_setup_github_workflow, monitor_github_workflow
+    from utils.github_utils import fork_and_setup_github_workflow
     
     # Setup GitHub workflow
     success, message, fork_info = fork_and_setup_github_workflow(
@@ -163,56 +415,264 @@ def build_ios_app_from_github(build_id, repo_url, branch, app_name, build_config
     )
     
     if not success:
-        update_build_status(build_id, 'failed', message)
+        update_build_status(build_id, 'failed', message, expect_status=db.ACTIVE_BUILD_STATUSES)
         return False
     
-    # Update build with fork info and release notes
-    build = db.get_build(build_id)
-    if build:
-        build['fork_info'] = fork_info
-        build['status'] = 'in_progress'
-        build['log'] = message
-        if release_notes:
-            build['release_notes'] = release_notes
-        db.save_build(build)
-    
-    # Start a thread to monitor the workflow
-    monitor_thread = threading.Thread(
-        target=monitor_github_workflow,
-        args=(build_id, fork_info)
-    )
-    monitor_thread.daemon = True
-    monitor_thread.start()
+    # Update build with fork info and release notes, unless it was cancelled meanwhile
+    fields = {'fork_info': fork_info}
+    if release_notes:
+        fields['release_notes'] = release_notes
+    if not db.update_build(build_id, set=fields, push={'log': message}, expect_status=db.ACTIVE_BUILD_STATUSES):
+        queue_fork_cleanup(build_id, fork_info)
+        return False
+    
+    # Monitor the workflow from a job
+    jobs.enqueue('monitor_build', {'build_id': build_id, 'fork_info': fork_info, 'check': 1},
+                 dedup_key=f"{build_id}:1", delay=WORKFLOW_CHECK_SECONDS)
     
     return True
 
+def queue_build(build):
+    """
+    Save a new GitHub build in the build queue
+    
+    The build starts from a job once a build slot is free (see build_queue.py).
+    
+    Args:
+        build (dict): The build document, with status 'queued'
+        
+    Returns:
+        bool: True if the build was started right away
+    """
+    db.create_build(build)
+    return build['id'] in build_queue.dispatch_builds()
+
+def release_build_slot():
+    """Start queued builds after a build finished (the scheduler catches up if this fails)"""
+    try:
+        build_queue.dispatch_builds()
+    except Exception as e:
+        logging.error(f"Error starting queued builds: {str(e)}")
+
+def dispatch_builds_job(payload):
+    """Periodic job: start queued builds while build slots are free"""
+    return {'started': build_queue.dispatch_builds()}
+
+def run_build_job(payload):
+    """
+    Job handler: fork the repository, push the workflow and start monitoring it
+    
+    Returns:
+        dict: started (False if the build was cancelled or failed to start)
+    """
+    build = db.get_build(payload['build_id'])
+    if not build:
+        return {'started': False}
+    
+    started = build_ios_app_from_github(
+        build['id'], build['repo_url'], build['branch'], build['app_name'],
+        build.get('build_config', 'Release'), release_notes=build.get('release_notes')
+    )
+    return {'started': started}
+
+def run_build_failed(payload, error):
+    """Job failure handler: mark the build as failed"""
+    update_build_status(
+        payload['build_id'],
+        'failed',
+        f"Error starting build: {error}",
+        db.utc_now(),
+        expect_status=db.ACTIVE_BUILD_STATUSES
+    )
+
+def monitor_build_job(payload):
+    """
+    Job handler: check a build's GitHub Actions workflow once
+    
+    While the workflow runs, the job queues the next check instead of
+    holding a worker for the whole build.
+    
+    Returns:
+        dict: The check number and whether monitoring is over
+    """
+    # Import here to avoid circular import
+    from utils.github_utils import check_github_workflow
+    
+    build_id = payload['build_id']
+    check = payload.get('check', 1)
+    
+    if check_github_workflow(build_id, payload['fork_info']):
+        return {'check': check, 'done': True}
+    
+    if check >= WORKFLOW_MAX_CHECKS:
+        if update_build_status(build_id, 'failed', "Build timed out after 30 minutes", expect_status=db.ACTIVE_BUILD_STATUSES):
+            queue_fork_cleanup(build_id, payload['fork_info'])
+        return {'check': check, 'done': True}
+    
+    # Keyed by check number: a retry of this check after it already queued the
+    # next one (e.g. its lease expired) doesn't start a second chain
+    jobs.enqueue('monitor_build', dict(payload, check=check + 1), dedup_key=f"{build_id}:{check + 1}",
+                 delay=WORKFLOW_CHECK_SECONDS)
+    return {'check': check, 'done': False}
+
+def queue_fork_cleanup(build_id, fork_info):
+    """
+    Queue a job that deletes a build's GitHub fork
+    
+    Args:
+        build_id (str): The build ID (the build may already be deleted)
+        fork_info (dict): The build's fork_info, with owner and repo
+        
+    Returns:
+        tuple or None: (job, created) as returned by jobs.enqueue, or None
+                       if there is no fork to delete
+    """
+    if not isinstance(fork_info, dict) or not fork_info.get('owner') or not fork_info.get('repo'):
+        return None
+    
+    payload = {'build_id': build_id, 'owner': fork_info['owner'], 'repo': fork_info['repo']}
+    return jobs.enqueue('cleanup_fork', payload, dedup_key=f"{fork_info['owner']}/{fork_info['repo']}",
+                        priority=jobs.PRIORITY_LOW)
+
+def cleanup_fork_job(payload):
+    """Job handler: delete a build's GitHub fork (retried while GitHub refuses)"""
+    # Import here to avoid circular import
+    from utils.github_utils import cleanup_fork
+    
+    if not cleanup_fork(payload['owner'], payload['repo']):
+        raise RuntimeError(f"Could not delete fork {payload['owner']}/{payload['repo']}")
+    if payload.get('build_id'):
+        db.update_build(payload['build_id'], set={'fork_cleaned': True})
+    return {'deleted': f"{payload['owner']}/{payload['repo']}"}
+
+def extract_mentions(text):
+    """
+    Extract mentions from text
+    
+    Args:
+        text (str): The text to search for mentions
+        
+    Returns:
+        list: List of usernames mentioned
+    """
+    # Match @username pattern
+    return re.findall(r'@(\w+)', text)
+
+def queue_comment_notifications(app, version, comment, username):
+    """
+    Queue a job that notifies the parent comment's author and mentioned users
+    
+    Args:
+        app (dict): The commented app
+        version (str): The app version
+        comment (dict): The new comment
+        username (str): The commenting user
+    """
+    payload = {
+        'app_id': app['id'],
+        'app_name': app.get('name'),
+        'version': version,
+        'comment_id': comment['id'],
+        'parent_id': comment.get('parent_id'),
+        'text': comment.get('text', ''),
+        'username': username
+    }
+    return jobs.enqueue('comment_notifications', payload, dedup_key=comment['id'])
+
+def comment_notifications_job(payload):
+    """
+    Job handler: notify the author of the parent comment and every mentioned user
+    
+    Returns:
+        dict: notified (usernames)
+    """
+    username = payload['username']
+    where = f"{payload.get('app_name')} v{payload['version']}"
+    notified = []
+    
+    # This is a reply, notify the parent comment author
+    if payload.get('parent_id'):
+        parent_comment = db.comments_collection.find_one({'id': payload['parent_id']}, {'_id': 0, 'username': 1})
+        if parent_comment and parent_comment.get('username') != username:
+            db.create_notification(
+                username=parent_comment['username'],
+                type='reply',
+                content=f"{username} replied to your comment on {where}",
+                reference_id=payload['comment_id'],
+                reference_type='comment',
+                from_user=username
+            )
+            notified.append(parent_comment['username'])
+    
+    # Notify mentioned users that exist, other than the commenter
+    for mentioned_username in dict.fromkeys(extract_mentions(payload.get('text', ''))):
+        if mentioned_username != username and db.get_user(mentioned_username):
+            db.create_notification(
+                username=mentioned_username,
+                type='mention',
+                content=f"{username} mentioned you in a comment on {where}",
+                reference_id=payload['comment_id'],
+                reference_type='comment',
+                from_user=username
+            )
+            notified.append(mentioned_username)
+    
+    return {'notified': notified}
+
 def check_abandoned_builds():
     """
     Check for abandoned builds and mark them as failed
     This is meant to be called periodically
+    
+    Returns:
+        int: Number of builds marked as failed
     """
-    builds = db.get_builds()
-    
-    for build in builds:
-        # Only check in-progress builds
-        if build.get('status') != 'in_progress':
-            continue
-        
-        # Check if it has been running for too long
-        start_time = datetime.fromisoformat(build.get('start_time', ''))
-        current_time = datetime.now()
-        
-        # If running for more than 1 hour and no updates in log for more than 15 minutes
-        time_diff = (current_time - start_time).total_seconds()
-        if time_diff > 3600:  # 1 hour
-            update_build_status(
-                build['id'], 
-                'failed', 
-                "Build timed out. No updates received for over an hour.",
-                current_time.isoformat()
-            )
-            
-            # Clean up GitHub fork if needed
-            if 'fork_info' in build:
-                from utils.github_utils import cleanup_fork_on_failure
-                cleanup_fork_on_failure(build) 
\ No newline at end of file
+    # Builds running for more than 1 hour
+    current_time = db.utc_now()
+    cutoff = current_time - timedelta(hours=1)
+    
+    failed = 0
+    for build in db.get_builds_started_before(cutoff):
+        timed_out = update_build_status(
+            build['id'], 
+            'failed', 
+            "Build timed out. No updates received for over an hour.",
+            current_time,
+            expect_status='in_progress'
+        )
+        
+        # Clean up GitHub fork if needed
+        if timed_out:
+            failed += 1
+            queue_fork_cleanup(build['id'], build.get('fork_info'))
+    
+    return failed
+
+def sweep_abandoned_builds_job(payload):
+    """Periodic job: fail builds that stopped reporting progress"""
+    return {'failed': check_abandoned_builds()}
+
+def collect_forks_job(payload):
+    """Periodic job: delete GitHub forks no build needs anymore"""
+    return fork_gc.collect_forks()
+
+def archive_notifications_job(payload):
+    """Periodic job: archive and delete expired notifications"""
+    return {'archived': db.archive_expired_notifications()}
+
+jobs.register_handler('ingest_ipa', ingest_ipa_job, on_failure=ingest_ipa_failed)
+jobs.register_handler('ingest_build', ingest_build_job, on_failure=ingest_build_failed)
+jobs.register_handler('run_build', run_build_job, on_failure=run_build_failed)
+jobs.register_handler('dispatch_builds', dispatch_builds_job)
+jobs.register_handler('monitor_build', monitor_build_job)
+jobs.register_handler('cleanup_fork', cleanup_fork_job)
+jobs.register_handler('collect_forks', collect_forks_job)
+jobs.register_handler('comment_notifications', comment_notifications_job)
+jobs.register_handler('sweep_abandoned_builds', sweep_abandoned_builds_job)
+jobs.register_handler('archive_notifications', archive_notifications_job)
+
+# Periodic maintenance, queued by the job scheduler
+jobs.register_schedule('sweep_abandoned_builds', 300)
+jobs.register_schedule('dispatch_builds', 30, priority=jobs.PRIORITY_HIGH)
+jobs.register_schedule('archive_notifications', 300)
+jobs.register_schedule('collect_forks', fork_gc.FORK_GC_INTERVAL_SECONDS)
@@ -0,0 +1,23 @@
+#!/usr/bin/env python3
+# Script to rebuild the per-version comment counters from the comments collection
+#
+# Usage:
+#   python3 ./rebuild_comment_summaries.py [APP_ID]
+
+import argparse
+import sys
+
+import database as db
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Rebuild per-version comment counts')
+    parser.add_argument('app_id', nargs='?', help='Only rebuild counters for this app')
+    args = parser.parse_args()
+
+    try:
+        db.initialize_db()
+        count = db.rebuild_comment_summaries(args.app_id)
+        print(f"Rebuilt comment summaries for {count} version(s)")
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        sys.exit(1)
@@ -1,15 +1,14 @@
-from flask import Blueprint, jsonify, request, session, abort
+from flask import Blueprint, jsonify, request, session, abort, url_for
 import database as db
+import connection
+import build_queue
 import base64
 import logging
-from datetime import datetime
-import json
-import os
 
 from utils.decorators import login_required, admin_required
-from utils.github_utils import fetch_branches
-from utils.file_utils import extract_minimal_app_info
-from models import update_build_status
+from utils.file_utils import format_datetime
+from utils.provisioning import normalize_udid
+from models import update_build_status, queue_build_ingest, queue_fork_cleanup, get_build_log_text
 
 api_bp = Blueprint('api', __name__)
 
@@ -19,6 +18,30 @@ def api_apps():
     apps = db.get_apps_for_user(session['username'])
     return jsonify(apps)
 
+@api_bp.route('/api/apps/search')
+@login_required
+def api_apps_search():
+    """
+    Search apps the current user has access to
+    
+    Query parameters:
+        q (str): Search text (matches words in name, bundle id and release notes,
+                 or the start of the name or bundle id)
+        limit (int): Maximum number of results (max 50)
+    """
+    query = request.args.get('q', '').strip()
+    limit = max(1, min(request.args.get('limit', 10, type=int), 50))
+    if not query:
+        return jsonify([])
+        
+    apps = db.search_apps(
+        session['username'],
+        query,
+        limit=limit,
+        projection={'id': 1, 'name': 1, 'bundle_id': 1, 'version': 1, 'build_number': 1}
+    )
+    return jsonify(apps)
+
 @api_bp.route('/api/app/<app_id>')
 @login_required
 def api_app(app_id):
@@ -27,6 +50,91 @@ def api_app(app_id):
         abort(404)
     return jsonify(app)
 
+@api_bp.route('/api/app/<app_id>/device_check')
+@login_required
+def api_device_check(app_id):
+    """
+    Check whether a device can install a build of an app
+    
+    Query parameters:
+        udid (str): The device UDID
+        file_id (str, optional): The build to check (default: latest version)
+    """
+    app = db.get_app(app_id, fields=['id', 'file_id'])
+    if not app or not db.get_user_app_access(session['username'], app_id):
+        abort(404)
+    
+    udid = normalize_udid(request.args.get('udid'))
+    if not udid:
+        return jsonify({'error': 'udid is required'}), 400
+    
+    file_id = request.args.get('file_id') or app.get('file_id')
+    return jsonify({
+        'udid': udid,
+        'file_id': file_id,
+        'status': db.check_device_eligibility(app_id, file_id, udid)
+    })
+
+@api_bp.route('/api/app/<app_id>/comments')
+@login_required
+def api_app_comments(app_id):
+    """
+    Get a page of comment threads for one app version
+    
+    Query parameters:
+        version (str): App version (defaults to the current version)
+        page (int): 1-based page of top-level comments
+        per_page (int): Top-level comments per page (max 50)
+        replies (int): Replies embedded per thread (max 20)
+    """
+    app = db.get_app(app_id)
+    if not app or not db.get_user_app_access(session['username'], app_id):
+        abort(404)
+        
+    version = request.args.get('version') or app.get('version')
+    per_page = max(1, min(request.args.get('per_page', 20, type=int), 50))
+    reply_limit = max(0, min(request.args.get('replies', 3, type=int), 20))
+    
+    result = db.get_comment_threads(
+        app_id,
+        version,
+        page=request.args.get('page', 1, type=int),
+        per_page=per_page,
+        reply_limit=reply_limit
+    )
+    for thread in result['threads']:
+        thread['time_ago'] = format_datetime(thread.get('timestamp'), 'timeago')
+        for reply in thread['replies']:
+            reply['time_ago'] = format_datetime(reply.get('timestamp'), 'timeago')
+    result['version'] = version
+    return jsonify(result)
+
+@api_bp.route('/api/app/<app_id>/comments/<comment_id>/replies')
+@login_required
+def api_comment_replies(app_id, comment_id):
+    """
+    Lazily load replies to a comment
+    
+    Query parameters:
+        offset (int): Number of replies to skip (the ones already shown)
+        limit (int): Maximum number of replies to return (max 100)
+    """
+    if not db.get_user_app_access(session['username'], app_id):
+        abort(404)
+        
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+    result = db.get_comment_replies(
+        app_id,
+        comment_id,
+        offset=request.args.get('offset', 0, type=int),
+        limit=limit
+    )
+    if result is None:
+        abort(404)
+    for reply in result['replies']:
+        reply['time_ago'] = format_datetime(reply.get('timestamp'), 'timeago')
+    return jsonify(result)
+
 @api_bp.route('/api/builds')
 @login_required
 def api_builds():
@@ -88,22 +196,69 @@ def api_build_status():
         return jsonify({'error': 'Access denied'}), 403
         
     # Return minimal build info
-    return jsonify({
+    status = {
         'id': build.get('id'),
         'status': build.get('status'),
         'app_name': build.get('app_name'),
-        'log_preview': build.get('log', '')[-500:] if build.get('log') else '',
+        'log_preview': get_build_log_text(build)[-500:],
         'start_time': build.get('start_time'),
         'end_time': build.get('end_time')
+    }
+    if build.get('status') == 'queued':
+        # Place in the build queue (position 1 starts next)
+        status['queue'] = build_queue.get_queue_position(build_id)
+    return jsonify(status)
+
+@api_bp.route('/api/jobs/<job_id>')
+def api_job_status(job_id):
+    """
+    Status of a background job (e.g. processing an uploaded IPA)
+    
+    Jobs submitted by a user are only visible to that user and admins. Jobs
+    queued by the build webhook can be polled by anyone holding the job id.
+    """
+    job = db.get_job(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    if job.get('created_by'):
+        if 'username' not in session:
+            return jsonify({'error': 'Authentication required'}), 401
+        if job['created_by'] != session['username'] and db.get_user(session['username']).get('role') != 'admin':
+            return jsonify({'error': 'Job not found'}), 404
+    
+    return jsonify({
+        'id': job['id'],
+        'type': job['type'],
+        'status': job['status'],
+        'attempts': job.get('attempts', 0),
+        'max_attempts': job.get('max_attempts'),
+        'result': job.get('result'),
+        'error': job.get('error'),
+        'created_at': job['created_at'],
+        'finished_at': job.get('finished_at')
     })
 
+@api_bp.route('/api/db_pool_stats')
+@admin_required
+def api_db_pool_stats():
+    """
+    MongoDB connection pool metrics of the process serving the request
+    
+    Each client (metadata, blob) reports checkouts, how long they waited for
+    a pooled connection and how many failed or timed out.
+    """
+    return jsonify(connection.get_pool_stats())
+
 @api_bp.route('/api/branches')
 @admin_required
 def api_branches():
     repo_url = request.args.get('repo_url', '')
     if not repo_url:
         return jsonify([])
-        
+    
+    # Import here so requests is only loaded when GitHub is used
+    from utils.github_utils import fetch_branches
     branches = fetch_branches(repo_url)
     return jsonify(branches)
 
@@ -149,35 +304,15 @@ def api_build_complete():
                 # Decode IPA data
                 ipa_data = base64.b64decode(ipa_data_b64)
                 
-                # Save the IPA file
-                db.save_build_file(build_id, filename, ipa_data, 'application/octet-stream')
-                
-                # Extract app info from IPA
-                app_info = extract_minimal_app_info(ipa_data, filename, build_id)
-                
-                # Update build
-                build['status'] = 'completed'
-                build['end_time'] = datetime.now().isoformat()
-                build['output_filename'] = filename
-                build['app_info'] = app_info
-                build['log'] = (build.get('log', '') + 
-                               f"\n\nBuild completed successfully.\nOutput: {filename}\n" +
-                               f"App: {app_info.get('name')} {app_info.get('version')} ({app_info.get('build_number')})")
-                
-                db.save_build(build)
-                
-                # Clean up GitHub fork if configured to do so
-                if os.environ.get('AUTO_CLEANUP_FORKS', 'false').lower() == 'true':
-                    if build.get('fork_info'):
-                        from utils.github_utils import cleanup_fork
-                        owner = build.get('fork_info').get('owner')
-                        repo = build.get('fork_info').get('repo')
-                        if owner and repo:
-                            cleanup_fork(owner, repo)
-                            build['fork_cleaned'] = True
-                            db.save_build(build)
+                # Save the IPA file; extraction and the build update run as a job
+                job, created = queue_build_ingest(build_id, filename, ipa_data)
                 
-                return jsonify({'status': 'success'})
+                return jsonify({
+                    'status': 'accepted',
+                    'job_id': job['id'],
+                    'duplicate': not created,
+                    'status_url': url_for('api.api_job_status', job_id=job['id'])
+                }), 202
                 
             except Exception as e:
                 logging.error(f"Error processing build result: {str(e)}")
@@ -185,29 +320,25 @@ def api_build_complete():
                     build_id, 
                     'failed', 
                     f"Error processing build result: {str(e)}",
-                    datetime.now().isoformat()
+                    db.utc_now(),
+                    expect_status=db.ACTIVE_BUILD_STATUSES
                 )
                 return jsonify({'error': f'Error processing build: {str(e)}'}), 500
         
         # Handle failure
         elif status == 'failed':
             error = data.get('error', 'Unknown error')
-            update_build_status(
+            failed = update_build_status(
                 build_id, 
                 'failed', 
                 f"Build failed: {error}",
-                datetime.now().isoformat()
+                db.utc_now(),
+                expect_status=db.ACTIVE_BUILD_STATUSES
             )
             
             # Clean up GitHub fork
-            if build.get('fork_info'):
-                from utils.github_utils import cleanup_fork
-                owner = build.get('fork_info').get('owner')
-                repo = build.get('fork_info').get('repo')
-                if owner and repo:
-                    cleanup_fork(owner, repo)
-                    build['fork_cleaned'] = True
-                    db.save_build(build)
+            if failed:
+                queue_fork_cleanup(build_id, build.get('fork_info'))
             
             return jsonify({'status': 'failure recorded'})
             
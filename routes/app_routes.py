@@ -1,38 +1,53 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session, send_file, abort, jsonify, make_response
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, abort, jsonify, make_response, current_app, Response, stream_with_context
 from werkzeug.utils import secure_filename
 import database as db
 import os
-import io
 import uuid
 from datetime import datetime
-import plistlib
 import logging
 import base64
-import re
+from urllib.parse import quote
+from xml.sax.saxutils import escape
 
 from utils.decorators import login_required, admin_required, admin_or_developer_required
-from utils.file_utils import allowed_file, format_datetime
-from models import add_app_version
+from utils.file_utils import allowed_file, format_datetime, render_install_manifest
+from utils.download_tokens import create_download_token, verify_download_token
+from utils.provisioning import normalize_udid
+from models import queue_ipa_ingest, queue_comment_notifications
 
 app_bp = Blueprint('app', __name__)
 
+# Maximum number of apps shown for a search on the index page
+SEARCH_RESULTS_LIMIT = 100
+
+# Versioned downloads never change, so caches may keep them for a year
+IMMUTABLE_MAX_AGE = 31536000
+
+# App fields needed to resolve a version's file
+VERSION_FILE_FIELDS = ['id', 'file_id', 'filename', 'version']
+
+# Mark where the request's host and a download token go in cached manifests
+MANIFEST_HOST_PLACEHOLDER = '__HOST_URL__'
+MANIFEST_TOKEN_PLACEHOLDER = '__DOWNLOAD_TOKEN__'
+
+# Optional X-Accel-Redirect offload: IPAs are written to DOWNLOAD_OFFLOAD_DIR and
+# served by the front-end server from the internal location DOWNLOAD_ACCEL_PREFIX
+DOWNLOAD_OFFLOAD_DIR = os.environ.get('DOWNLOAD_OFFLOAD_DIR', '')
+DOWNLOAD_ACCEL_PREFIX = os.environ.get('DOWNLOAD_ACCEL_PREFIX', '')
+
 @app_bp.route('/')
 def index():
     # Get apps based on user access level
     if 'username' in session:
-        apps = db.get_apps_for_user(session['username'])
-        
-        # For admin users, filter apps by search query
-        if request.args.get('q'):
-            query = request.args.get('q').lower()
-            filtered_apps = []
-            for app in apps:
-                if (query in app.get('name', '').lower() or 
-                    query in app.get('bundle_id', '').lower()):
-                    filtered_apps.append(app)
-            apps = filtered_apps
+        query = request.args.get('q', '').strip()
+        
+        if query:
+            # Ranking and access filtering happen in the database
+            apps = db.search_apps(session['username'], query, limit=SEARCH_RESULTS_LIMIT)
+        else:
+            apps = db.get_apps_for_user(session['username'])
             
-        return render_template('index.html', apps=apps, query=request.args.get('q', ''))
+        return render_template('index.html', apps=apps, query=query)
     else:
         return render_template('login.html')
 
@@ -62,32 +77,18 @@ def upload():
         app_description = request.form.get('app_description', '').strip()
         
         if file and allowed_file(file.filename):
-            # Save the file data
-            file_data = file.read()
-            
             # Store the file and create the app
             try:
                 filename = secure_filename(file.filename)
                 
                 # This route is only for new apps now
-                # Extract app info and save
-                from utils.file_utils import extract_app_info
-                app_info = extract_app_info(file_data, filename)
-                
-                # Set owner to current user
-                app_info['owner'] = session.get('username')
-                # Set description (if provided)
-                if app_description:
-                    app_info['description'] = app_description
-                
-                # Save the file
-                db.save_file(app_info['file_id'], filename, file_data)
-                
-                # Save app to database
-                db.save_app(app_info)
-                flash(f'App {app_info["name"]} added')
-                    
-                return redirect(url_for('app.index'))
+                # Stream the file into storage; app info is extracted by a background job
+                job, created = queue_ipa_ingest(
+                    file.stream, filename, session.get('username'),
+                    max_size=current_app.config.get('MAX_CONTENT_LENGTH'),
+                    description=app_description, release_notes=release_notes
+                )
+                return _upload_accepted(job, created, url_for('app.index'))
             
             except Exception as e:
                 flash(f'Error processing file: {str(e)}')
@@ -98,6 +99,29 @@ def upload():
             
     return render_template('upload.html')
 
+def _upload_accepted(job, created, redirect_url):
+    """
+    Respond to an upload whose processing was queued
+    
+    API clients get 202 with the job id; browsers are redirected with a message
+    and notified when the job is done.
+    """
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify({
+            'job_id': job['id'],
+            'status': job['status'],
+            'duplicate': not created,
+            'status_url': url_for('api.api_job_status', job_id=job['id'])
+        }), 202
+    
+    if created:
+        flash('Upload received. The app is being processed and you will be notified when it is ready.')
+    elif job['status'] == 'completed':
+        flash('This file was already uploaded.')
+    else:
+        flash('This file is already being processed.')
+    return redirect(redirect_url)
+
 @app_bp.route('/upload_version/<app_id>', methods=['GET', 'POST'])
 @admin_or_developer_required
 def upload_version(app_id):
@@ -114,21 +138,6 @@ def upload_version(app_id):
         flash('You do not have permission to upload a new version for this app')
         return redirect(url_for('app.app_detail', app_id=app_id))
     
-    # Format dates for display and add size information for each version
-    if app.get('versions'):
-        for version in app.get('versions', []):
-            if version.get('upload_date'):
-                version['formatted_upload_date'] = format_datetime(version.get('upload_date'))
-            
-            # Add size information for each version
-            file_id = version.get('file_id')
-            if file_id:
-                file_data = db.get_file(file_id)
-                if file_data:
-                    version['size'] = file_data.get('size', 0)
-                else:
-                    version['size'] = 0
-    
     if request.method == 'POST':
         # Check if the post request has the file part
         if 'file' not in request.files:
@@ -149,18 +158,19 @@ def upload_version(app_id):
             return redirect(request.url)
         
         if file and allowed_file(file.filename):
-            # Save the file data
-            file_data = file.read()
             version = request.form.get('version')
             
             # Store the file and update the app
             try:
                 filename = secure_filename(file.filename)
                 
-                # Update existing app with new version
-                updated_app = add_app_version(app_id, file_data, filename, version, release_notes)
-                flash(f'App {updated_app["name"]} updated to version {updated_app["version"]} ({updated_app["build_number"]})')
-                return redirect(url_for('app.app_detail', app_id=app_id))
+                # Update existing app with new version in a background job
+                job, created = queue_ipa_ingest(
+                    file.stream, filename, current_username, app_id=app_id,
+                    max_size=current_app.config.get('MAX_CONTENT_LENGTH'),
+                    version=version, release_notes=release_notes
+                )
+                return _upload_accepted(job, created, url_for('app.app_detail', app_id=app_id))
             
             except Exception as e:
                 flash(f'Error processing file: {str(e)}')
@@ -169,10 +179,21 @@ def upload_version(app_id):
             flash('Invalid file type. Only IPA files are allowed.')
             return redirect(request.url)
     
-    return render_template('upload_version.html', app=app)
+    # Most recent versions, with dates formatted for display
+    version_page = _version_history_page(app_id, 1)
+    
+    return render_template('upload_version.html', app=app, version_page=version_page)
+
+# Top-level comments shown per page and replies embedded per thread on app_detail
+COMMENTS_PER_PAGE = 20
+
+# Versions shown per page of an app's version history
+VERSIONS_PER_PAGE = 20
+REPLIES_PER_THREAD = 3
 
 @app_bp.route('/app/<app_id>')
-def app_detail(app_id):
+@app_bp.route('/app/<app_id>/<version>')
+def app_detail(app_id, version=None):
     # Check if user has access to this app
     if 'username' not in session:
         flash('Please log in to view app details')
@@ -191,16 +212,20 @@ def app_detail(app_id):
     # Get shared users for this app
     shared_users = db.get_shared_users(app_id)
     
-    # Get comments for all versions
-    all_comments = db.get_comments_for_version(app_id)
+    # Only the visible version's comments are loaded (latest by default);
+    # other versions link back here with their version selected
+    selected_version = version or request.args.get('version') or app.get('version')
+    comment_page = db.get_comment_threads(
+        app_id,
+        selected_version,
+        page=request.args.get('comments_page', 1, type=int),
+        per_page=COMMENTS_PER_PAGE,
+        reply_limit=REPLIES_PER_THREAD
+    )
+    comments_by_version = {selected_version: comment_page['threads']}
     
-    # Organize comments by version
-    comments_by_version = {}
-    for comment in all_comments:
-        version = comment.get('version')
-        if version not in comments_by_version:
-            comments_by_version[version] = []
-        comments_by_version[version].append(comment)
+    # Counters for the version list badges come from the summary collection
+    comment_summaries = db.get_comment_summaries(app_id)
     
     # Format dates in the app object to DD-MMM-YYYY
     if app.get('upload_date'):
@@ -209,24 +234,12 @@ def app_detail(app_id):
     if app.get('creation_date'):
         app['formatted_creation_date'] = format_datetime(app.get('creation_date'))
     
-    # Format dates in versions and add size information
-    if app.get('versions'):
-        for version in app.get('versions', []):
-            if version.get('upload_date'):
-                version['formatted_upload_date'] = format_datetime(version.get('upload_date'))
-            
-            # Add size information for each version
-            file_id = version.get('file_id')
-            if file_id:
-                file_data = db.get_file(file_id)
-                if file_data:
-                    version['size'] = file_data.get('size', 0)
-                else:
-                    version['size'] = 0
+    # One page of the version history, with sizes and formatted dates
+    version_page = _version_history_page(app_id, request.args.get('versions_page', 1, type=int))
     
     # Add size information for the main app if not present
     if not app.get('size') and app.get('file_id'):
-        file_data = db.get_file(app.get('file_id'))
+        file_data = db.get_file(app.get('file_id'), include_data=False)
         if file_data:
             app['size'] = file_data.get('size', 0)
         else:
@@ -236,8 +249,34 @@ def app_detail(app_id):
                            app=app, 
                            shared_users=shared_users, 
                            comments_by_version=comments_by_version,
+                           selected_version=selected_version,
+                           comment_page=comment_page,
+                           comment_summaries=comment_summaries,
+                           version_page=version_page,
                            format_datetime=format_datetime)
 
+def _version_history_page(app_id, page):
+    """
+    Get a page of an app's versions for display
+    
+    Args:
+        app_id (str): The app ID
+        page (int): 1-based page
+        
+    Returns:
+        dict: As returned by database.get_app_versions, each version with
+              formatted_upload_date and size added
+    """
+    version_page = db.get_app_versions(app_id, page=page, per_page=VERSIONS_PER_PAGE)
+    sizes = db.get_file_sizes(v['file_id'] for v in version_page['versions'] if v.get('file_id'))
+    
+    for version in version_page['versions']:
+        if version.get('upload_date'):
+            version['formatted_upload_date'] = format_datetime(version.get('upload_date'))
+        version['size'] = sizes.get(version.get('file_id'), 0)
+    
+    return version_page
+
 @app_bp.route('/edit/<app_id>', methods=['GET', 'POST'])
 @admin_required
 def edit_app(app_id):
@@ -248,14 +287,18 @@ def edit_app(app_id):
         
     if request.method == 'POST':
         # Update app data
-        app['name'] = request.form['name']
-        app['bundle_id'] = request.form['bundle_id']
         # Version and build number should not be updated from form - they're set from latest version in history
-        app['description'] = request.form['app_description']
-        
-        # Save to database
-        db.save_app(app)
-        flash(f'App {app["name"]} updated')
+        fields = {
+            'name': request.form['name'],
+            'bundle_id': request.form['bundle_id'],
+            'description': request.form['app_description']
+        }
+        
+        # Save to database, unless someone else changed the app since the form was loaded
+        if not db.update_app(app_id, fields, expect_rev=request.form.get('rev', type=int)):
+            flash('The app was changed by someone else. Please review and save again.')
+            return redirect(url_for('app.edit_app', app_id=app_id))
+        flash(f'App {fields["name"]} updated')
         return redirect(url_for('app.app_detail', app_id=app_id))
         
     return render_template('edit_app.html', app=app)
@@ -274,22 +317,128 @@ def download_app(app_id, filename):
         
     # Get the file
     file_id = app.get('file_id')
-    file_data = db.get_file(file_id)
-    
-    if not file_data:
+    if not file_id or not db.get_file(file_id, include_data=False):
         flash('File not found')
         return redirect(url_for('app.app_detail', app_id=app_id))
         
-    # Create a response with the file data
-    return send_file(
-        io.BytesIO(file_data['data']),
-        download_name=filename,
-        as_attachment=True,
-        mimetype='application/octet-stream'
-    )
+    return _send_app_file(file_id, filename)
+
+@app_bp.route('/download/<app_id>/v/<file_id>/<filename>')
+def download_app_version(app_id, file_id, filename):
+    token = request.args.get('token')
+    if token:
+        # Signed URLs from install pages and manifests: iOS fetches these without
+        # cookies, and the signature alone proves access
+        remaining = verify_download_token(token, app_id, file_id)
+        if remaining is None:
+            abort(403)
+        cache_control = f'public, max-age={min(remaining, IMMUTABLE_MAX_AGE)}, immutable'
+    else:
+        # Check if user has access to this app
+        if 'username' not in session:
+            # For direct downloads, redirect to login
+            return redirect(url_for('auth.login', next=request.url))
+            
+        app = db.get_app(app_id, fields=VERSION_FILE_FIELDS)
+        if not app or not db.get_user_app_access(session['username'], app_id):
+            flash('You do not have access to this app')
+            return redirect(url_for('app.index'))
+        
+        if not _find_version_file(app, file_id):
+            abort(404)
+        
+        # Downloads are session-gated, so only the browser may keep a copy
+        cache_control = f'private, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    
+    # The file behind a file_id never changes, so the id doubles as a strong
+    # ETag and repeat requests don't need to load the IPA at all
+    if file_id in request.if_none_match:
+        response = make_response('', 304)
+    else:
+        response = _send_app_file(file_id, filename)
+    
+    response.set_etag(file_id)
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+def _send_app_file(file_id, filename):
+    """
+    Send an IPA, handing the transfer to the front-end server when offloading is configured
+    
+    With DOWNLOAD_OFFLOAD_DIR and DOWNLOAD_ACCEL_PREFIX set, the file is written
+    to the offload directory once and later requests only return an
+    X-Accel-Redirect header, so neither MongoDB nor this process serves the bytes.
+    
+    Args:
+        file_id (str): The file ID
+        filename (str): Download name sent to the client
+    """
+    if os.path.basename(file_id) != file_id:
+        abort(404)
+    
+    if DOWNLOAD_OFFLOAD_DIR and DOWNLOAD_ACCEL_PREFIX:
+        path = os.path.join(DOWNLOAD_OFFLOAD_DIR, file_id)
+        if not os.path.exists(path):
+            os.makedirs(DOWNLOAD_OFFLOAD_DIR, exist_ok=True)
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, 'wb') as f:
+                found = db.read_file_to(file_id, f)
+            if not found:
+                os.unlink(tmp_path)
+                abort(404)
+            os.replace(tmp_path, path)
+        
+        response = make_response('')
+        response.headers['X-Accel-Redirect'] = f"{DOWNLOAD_ACCEL_PREFIX.rstrip('/')}/{file_id}"
+        response.headers['Content-Type'] = 'application/octet-stream'
+        response.headers['Content-Disposition'] = f'attachment; filename="{secure_filename(filename) or "app.ipa"}"'
+        return response
+    
+    # Stream the stored chunks, so memory use doesn't grow with the IPA's size
+    file_doc = db.get_file(file_id, include_data=False)
+    chunks = db.iter_file_data(file_id) if file_doc else None
+    if chunks is None:
+        abort(404)
+    
+    size = file_doc.get('size', 0)
+    status = 200
+    start, stop = 0, size
+    
+    # Resumed downloads; an If-Range must name the current ETag (the file id),
+    # since no Last-Modified date is sent to compare a date against
+    if_range = request.if_range
+    if request.range and if_range.date is None and if_range.etag in (None, file_id):
+        byte_range = request.range.range_for_length(size)
+        if byte_range is None:
+            response = make_response('', 416)
+            response.headers['Content-Range'] = f"bytes */{size}"
+            return response
+        start, stop = byte_range
+        status = 206
+    
+    response = Response(stream_with_context(_slice_chunks(chunks, start, stop)), status=status,
+                        mimetype='application/octet-stream')
+    response.headers['Content-Length'] = str(stop - start)
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.headers['Content-Disposition'] = f'attachment; filename="{secure_filename(filename) or "app.ipa"}"'
+    if status == 206:
+        response.headers['Content-Range'] = f"bytes {start}-{stop - 1}/{size}"
+    return response
+
+def _slice_chunks(chunks, start, stop):
+    """Yield the bytes from start up to stop of a stream of byte strings"""
+    offset = 0
+    for chunk in chunks:
+        end = offset + len(chunk)
+        if end > start and offset < stop:
+            yield chunk[max(start - offset, 0):stop - offset]
+        if end >= stop:
+            break
+        offset = end
 
 @app_bp.route('/install/<app_id>')
-def install(app_id):
+@app_bp.route('/install/<app_id>/v/<file_id>')
+def install(app_id, file_id=None):
     # Check if user has access to this app
     if 'username' not in session:
         # For direct installs, redirect to login
@@ -299,13 +448,22 @@ def install(app_id):
     if not app or not db.get_user_app_access(session['username'], app_id):
         flash('You do not have access to this app')
         return redirect(url_for('app.index'))
+    
+    if file_id and not _find_version_file(app, file_id):
+        abort(404)
+    file_id = file_id or app.get('file_id')
         
-    # Generate manifest URL
+    # Generate manifest URL; the token in it is passed on to the IPA download,
+    # since iOS fetches both without the browser's session
     host = request.host_url.rstrip('/')
-    manifest_url = f"{host}{url_for('app.app_manifest', app_id=app_id)}"
+    if file_id:
+        token = create_download_token(app_id, file_id)
+        manifest_url = f"{host}{url_for('app.app_version_manifest', app_id=app_id, file_id=file_id, token=token)}"
+    else:
+        manifest_url = f"{host}{url_for('app.app_manifest', app_id=app_id)}"
     
     # Generate the iOS installation URL using the itms-services protocol
-    install_url = f"itms-services://?action=download-manifest&url={manifest_url}"
+    install_url = f"itms-services://?action=download-manifest&url={quote(manifest_url, safe=':/')}"
     
     return render_template('install.html', app=app, manifest_url=manifest_url, install_url=install_url)
 
@@ -323,39 +481,111 @@ def direct_install(app_id):
     
     # Generate download URL for the IPA file
     host = request.host_url.rstrip('/')
-    download_url = f"{host}{url_for('app.download_app', app_id=app_id, filename=app.get('filename', 'app.ipa'))}"
-    
-    return render_template('direct_install.html', app=app, download_url=download_url)
+    if app.get('file_id'):
+        token = create_download_token(app_id, app['file_id'])
+        download_url = f"{host}{url_for('app.download_app_version', app_id=app_id, file_id=app['file_id'], filename=app.get('filename', 'app.ipa'), token=token)}"
+    else:
+        download_url = f"{host}{url_for('app.download_app', app_id=app_id, filename=app.get('filename', 'app.ipa'))}"
+    
+    # Check the device against the build's provisioning profile before the
+    # tester downloads it; the UDID is remembered for later installs
+    udid = normalize_udid(request.args.get('udid') or session.get('device_udid'))
+    if request.args.get('udid') and udid:
+        # A mistyped UDID doesn't replace the remembered one
+        session['device_udid'] = udid
+    
+    profile = None
+    eligibility = None
+    if app.get('file_id'):
+        profile = db.get_provisioning_profile(app['file_id'])
+        if udid:
+            eligibility = db.check_device_eligibility(app_id, app['file_id'], udid)
+    
+    return render_template('direct_install.html', app=app, download_url=download_url,
+                           profile=profile, udid=udid, eligibility=eligibility)
 
 @app_bp.route('/manifest/<app_id>')
 def app_manifest(app_id):
-    app = db.get_app(app_id)
-    if not app:
-        abort(404)
+    # Always the latest version, so clients must revalidate
+    return _manifest_response(app_id)
+
+@app_bp.route('/manifest/<app_id>/v/<file_id>')
+def app_version_manifest(app_id, file_id):
+    # A specific build; its title changes when the app is edited
+    return _manifest_response(app_id, file_id)
+
+def _find_version_file(app, file_id):
+    """
+    Find the version of an app stored under a file id
+    
+    Args:
+        app (dict): App document with id, file_id, filename and version
+        file_id (str): The file id
         
-    host = request.host_url.rstrip('/')
-    download_url = f"{host}{url_for('app.download_app', app_id=app_id, filename=app.get('filename', 'app.ipa'))}"
-    
-    # Create a Property List (plist) for iOS app installation
-    manifest = {
-        'items': [{
-            'assets': [{
-                'kind': 'software-package',
-                'url': download_url
-            }],
-            'metadata': {
-                'bundle-identifier': app.get('bundle_id', 'com.example.app'),
-                'bundle-version': app.get('version', '1.0'),
-                'kind': 'software',
-                'title': app.get('name', 'App')
-            }
-        }]
-    }
-    
-    # Set content type for plist
-    response = make_response(plistlib.dumps(manifest))
+    Returns:
+        dict or None: {'file_id', 'filename', 'version'} if the file belongs to the app
+    """
+    if app.get('file_id') == file_id:
+        return {'file_id': file_id, 'filename': app.get('filename'), 'version': app.get('version')}
+    
+    version = db.get_app_version(app['id'], file_id)
+    if version:
+        return {'file_id': file_id, 'filename': version.get('filename'), 'version': version.get('version')}
+    
+    return None
+
+def _manifest_response(app_id, file_id=None):
+    """
+    Serve an install manifest from the manifest cache, rendering it on first request
+    
+    Manifests are cached once per app and version, with placeholders for the
+    host and the download token: the host comes from the request when the
+    manifest is served, so Host headers sent by clients don't add cache
+    entries. A versioned manifest requested with ?token= gets the same token
+    added to its download URL.
+    
+    Args:
+        app_id (str): The app ID
+        file_id (str, optional): Version file to install; the latest version if omitted
+    """
+    variant = file_id or 'latest'
+    
+    token = request.args.get('token') if file_id else None
+    if token and verify_download_token(token, app_id, file_id) is None:
+        abort(403)
+    
+    manifest = db.get_manifest(app_id, variant)
+    if not manifest:
+        app = db.get_app(app_id, fields=VERSION_FILE_FIELDS + ['bundle_id', 'name'])
+        if not app:
+            abort(404)
+        
+        version = _find_version_file(app, file_id or app.get('file_id'))
+        if not version:
+            abort(404)
+        
+        # Point at the versioned download so the IPA can be cached as well
+        download_url = f"{MANIFEST_HOST_PLACEHOLDER}{url_for('app.download_app_version', app_id=app_id, file_id=version['file_id'], filename=version['filename'] or 'app.ipa')}"
+        data, etag = render_install_manifest({**app, 'version': version['version']}, download_url + MANIFEST_TOKEN_PLACEHOLDER)
+        db.save_manifest(app_id, data, etag, variant=variant, file_id=version['file_id'])
+        manifest = {'data': data, 'etag': etag}
+    
+    # The plist is XML, so the host is escaped like any other text in it
+    host = escape(request.host_url.rstrip('/'))
+    data = manifest['data'].replace(MANIFEST_HOST_PLACEHOLDER.encode('utf-8'), host.encode('utf-8'))
+    etag = manifest['etag']
+    if token:
+        data = data.replace(MANIFEST_TOKEN_PLACEHOLDER.encode('utf-8'), f"?token={token}".encode('utf-8'))
+        etag = f"{etag}-{token.split('.', 1)[0]}"
+    else:
+        data = data.replace(MANIFEST_TOKEN_PLACEHOLDER.encode('utf-8'), b'')
+    
+    # Set content type for plist; app edits change the title, so clients revalidate
+    response = make_response(data)
     response.headers['Content-Type'] = 'application/xml'
-    return response
+    response.headers['Cache-Control'] = 'no-cache'
+    response.set_etag(etag)
+    return response.make_conditional(request)
 
 @app_bp.route('/delete/<app_id>', methods=['POST'])
 @admin_required
@@ -511,20 +741,6 @@ def unshare_app(app_id, username):
         
     return redirect(url_for('app.app_detail', app_id=app_id))
 
-def extract_mentions(text):
-    """
-    Extract mentions from text
-    
-    Args:
-        text (str): The text to search for mentions
-        
-    Returns:
-        list: List of usernames mentioned
-    """
-    # Match @username pattern
-    mentions = re.findall(r'@(\w+)', text)
-    return mentions
-
 @app_bp.route('/add_comment/<app_id>', methods=['POST'])
 @login_required
 def add_comment(app_id):
@@ -552,38 +768,8 @@ def add_comment(app_id):
     if result.get('success'):
         comment = result.get('comment')
         
-        # Handle notifications for replies
-        if parent_id:
-            # This is a reply, notify the parent comment author
-            parent_comment = db.comments_collection.find_one({'id': parent_id}, {'_id': 0})
-            if parent_comment and parent_comment.get('username') != current_username:
-                parent_author = parent_comment.get('username')
-                
-                # Create notification for the parent comment author
-                db.create_notification(
-                    username=parent_author,
-                    type='reply',
-                    content=f"{current_username} replied to your comment on {app.get('name')} v{version}",
-                    reference_id=comment.get('id'),
-                    reference_type='comment',
-                    from_user=current_username
-                )
-        
-        # Handle notifications for mentions
-        mentions = extract_mentions(text)
-        for mentioned_username in mentions:
-            # Make sure the mentioned user exists and is not the commenter
-            mentioned_user = db.get_user(mentioned_username)
-            if mentioned_user and mentioned_username != current_username:
-                # Create notification for the mentioned user
-                db.create_notification(
-                    username=mentioned_username,
-                    type='mention',
-                    content=f"{current_username} mentioned you in a comment on {app.get('name')} v{version}",
-                    reference_id=comment.get('id'),
-                    reference_type='comment',
-                    from_user=current_username
-                )
+        # Notify the parent comment's author and mentioned users from a job
+        queue_comment_notifications(app, version, comment, current_username)
         
         # Send app refresh notification to all users with access
         try:
@@ -596,7 +782,7 @@ def add_comment(app_id):
     else:
         flash(f'Error adding comment: {result.get("message")}')
     
-    return redirect(url_for('app.app_detail', app_id=app_id))
+    return redirect(url_for('app.app_detail', app_id=app_id, version=version))
 
 @app_bp.route('/delete_comment/<app_id>/<comment_id>', methods=['POST'])
 @login_required
@@ -620,4 +806,4 @@ def delete_comment(app_id, comment_id):
     else:
         flash('Error deleting comment. You can only delete your own comments.')
     
-    return redirect(url_for('app.app_detail', app_id=app_id)) 
\ No newline at end of file
+    return redirect(url_for('app.app_detail', app_id=app_id, version=request.form.get('version'))) 
\ No newline at end of file
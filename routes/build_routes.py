@@ -1,16 +1,13 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session, send_file, abort, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, send_file, jsonify
 import database as db
-import os
+import build_queue
 import io
 import uuid
 from datetime import datetime
-import logging
-import base64
-import threading
 
+from schema import parse_timestamp, to_iso
 from utils.decorators import login_required, admin_required, admin_or_developer_required
-from utils.github_utils import verify_github_token, fetch_branches, cleanup_fork
-from models import build_ios_app_from_github, update_build_status
+from models import queue_build, queue_fork_cleanup, update_build_status, get_build_log_text
 
 build_bp = Blueprint('build', __name__)
 
@@ -38,7 +35,8 @@ def github_build():
             flash('Release notes are required')
             return redirect(url_for('build.github_build'))
             
-        # Verify GitHub token
+        # Verify GitHub token (import here so requests is only loaded when GitHub is used)
+        from utils.github_utils import verify_github_token
         token_valid, token_message = verify_github_token()
         if not token_valid:
             flash(f'GitHub token error: {token_message}')
@@ -57,20 +55,15 @@ def github_build():
             'release_notes': release_notes,
             'status': 'queued',
             'user': session.get('username'),
-            'start_time': datetime.now().isoformat(),
+            'start_time': db.utc_now(),
             'log': f"Build queued for {app_name} from {repo_url} ({branch})..."
         }
         
-        # Save the build
-        db.save_build(build)
-        
-        # Start the build process in the background
-        threading.Thread(
-            target=build_ios_app_from_github,
-            args=(build_id, repo_url, branch, app_name, build_config, None, None, release_notes)
-        ).start()
-        
-        flash(f'Build started for {app_name}')
+        # Save the build; it starts from a worker once a build slot is free
+        if queue_build(build):
+            flash(f'Build started for {app_name}')
+        else:
+            flash(f'Build queued for {app_name}')
         return redirect(url_for('build.build_log', build_id=build_id))
         
     # GET request - show the form
@@ -79,6 +72,7 @@ def github_build():
     branches = []
     
     if repo_url:
+        from utils.github_utils import fetch_branches
         branches = fetch_branches(repo_url)
         
     # Fetch user's previous builds for repo suggestions
@@ -113,7 +107,7 @@ def github_build():
             filtered_builds.append(build)
     
     # Sort builds by start time descending (newest first)
-    filtered_builds.sort(key=lambda x: x.get('start_time', ''), reverse=True)
+    filtered_builds.sort(key=lambda x: parse_timestamp(x.get('start_time')) or datetime.min, reverse=True)
     
     return render_template('github_build.html', 
                           branches=branches, 
@@ -182,17 +176,12 @@ def build_log(build_id):
         app_info = build.get('app_info')
     
     # Get raw log content
-    log_content = build.get('log', 'No log content available')
+    log_content = get_build_log_text(build)
     
     # Process log content to add HTML classes for better formatting
     if log_content:
         processed_lines = []
         
-        # Check if log_content is a list or a string
-        if isinstance(log_content, list):
-            # If it's a list, join it into a string with newlines
-            log_content = '\n'.join([str(line) for line in log_content])
-            
         # Now we can safely split the string
         for line in log_content.split('\n'):
             line = line.rstrip()
@@ -216,7 +205,10 @@ def build_log(build_id):
     else:
         build['log_content'] = 'No log content available'
         
-    return render_template('build_log.html', build=build, app_info=app_info)
+    # Place in the build queue while waiting for a build slot
+    queue = build_queue.get_queue_position(build_id) if build.get('status') == 'queued' else None
+        
+    return render_template('build_log.html', build=build, app_info=app_info, queue=queue)
 
 @build_bp.route('/download_build_log/<build_id>')
 @login_required
@@ -233,7 +225,7 @@ def download_build_log(build_id):
         return redirect(url_for('app.index'))
         
     # Prepare log content
-    log_content = build.get('log', 'No log available')
+    log_content = get_build_log_text(build) or 'No log available'
     
     # Add build info
     build_info = f"""
@@ -243,8 +235,8 @@ Repository: {build.get('repo_url')}
 Branch: {build.get('branch')}
 Config: {build.get('build_config')}
 Status: {build.get('status')}
-Started: {build.get('start_time')}
-Completed: {build.get('end_time', 'Not completed')}
+Started: {to_iso(build.get('start_time'))}
+Completed: {to_iso(build.get('end_time')) or 'Not completed'}
 
 LOG:
 =====
@@ -273,18 +265,20 @@ def stop_build(build_id):
         flash('Build is not in progress')
         return redirect(url_for('build.build_log', build_id=build_id))
         
-    # Update build status
-    update_build_status(
+    # Update build status; the build may have finished since it was loaded
+    cancelled = update_build_status(
         build_id, 
         'cancelled', 
         "Build cancelled by admin",
-        datetime.now().isoformat()
+        db.utc_now(),
+        expect_status=db.ACTIVE_BUILD_STATUSES
     )
+    if not cancelled:
+        flash('Build is not in progress')
+        return redirect(url_for('build.build_log', build_id=build_id))
     
-    # Try to clean up GitHub fork if it exists
-    if 'fork_info' in build:
-        from utils.github_utils import cleanup_fork_on_failure
-        cleanup_fork_on_failure(build)
+    # Clean up the GitHub fork if it exists
+    queue_fork_cleanup(build_id, build.get('fork_info'))
         
     flash('Build cancelled')
     return redirect(url_for('build.build_log', build_id=build_id))
@@ -301,13 +295,8 @@ def delete_build(build_id):
     # Delete the build and associated files
     db.delete_build(build_id)
     
-    # Try to clean up GitHub fork if it exists
-    if build.get('fork_info'):
-        owner = build.get('fork_info', {}).get('owner')
-        repo = build.get('fork_info', {}).get('repo')
-        
-        if owner and repo:
-            cleanup_fork(owner, repo)
+    # Clean up the GitHub fork if it exists
+    queue_fork_cleanup(build_id, build.get('fork_info'))
     
     flash('Build deleted')
     return redirect(url_for('app.index'))
@@ -335,15 +324,8 @@ def cleanup_repository(build_id):
         flash('Invalid fork information')
         return redirect(url_for('build.build_log', build_id=build_id))
         
-    # Try to delete the fork
-    success = cleanup_fork(owner, repo)
-    
-    if success:
-        # Update build to indicate fork was cleaned up
-        build['fork_cleaned'] = True
-        db.save_build(build)
-        flash('GitHub fork repository cleaned up successfully')
-    else:
-        flash('Failed to clean up GitHub fork repository')
+    # Delete the fork in the background; the job sets fork_cleaned when done
+    queue_fork_cleanup(build_id, fork_info)
+    flash('GitHub fork repository cleanup queued')
         
     return redirect(url_for('build.build_log', build_id=build_id)) 
\ No newline at end of file
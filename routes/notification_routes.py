@@ -3,7 +3,7 @@ import database as db
 from utils.decorators import login_required
 from utils.file_utils import format_datetime
 from bson import ObjectId
-from datetime import datetime
+from schema import to_iso
 import json
 import time
 import queue
@@ -22,6 +22,27 @@ def get_queue_for_user(user_id):
             notification_queues[user_id] = queue.Queue()
         return notification_queues[user_id]
 
+def serialize_notification(notification):
+    """
+    Prepare a notification for JSON output
+    
+    Adds a `time_ago` field and converts native datetimes to ISO strings
+    so the payload looks the same for jsonify and the SSE stream.
+    
+    Args:
+        notification (dict): Notification document
+        
+    Returns:
+        dict: JSON-safe copy of the notification
+    """
+    data = {key: value for key, value in notification.items() if key != '_id'}
+    if data.get('timestamp'):
+        data['time_ago'] = format_datetime(data['timestamp'], 'timeago')
+    for field in ('timestamp', 'read_at'):
+        if field in data:
+            data[field] = to_iso(data[field])
+    return data
+
 def send_notification_to_user(username, notification):
     """
     Send a notification to a specific user's queue
@@ -67,12 +88,8 @@ def get_notifications():
     username = session.get('username')
     notifications = db.get_user_notifications(username, limit, include_read)
     
-    # Format timestamps for frontend display
-    for notification in notifications:
-        notification['time_ago'] = format_datetime(notification.get('timestamp'), 'timeago')
-    
     return jsonify({
-        'notifications': notifications,
+        'notifications': [serialize_notification(n) for n in notifications],
         'unread_count': db.get_unread_notification_count(username)
     })
 
@@ -157,21 +174,23 @@ def delete_notification(notification_id):
         'unread_count': db.get_unread_notification_count(username)
     })
 
+# Page size for the all-notifications page and its infinite scroll
+NOTIFICATIONS_PAGE_SIZE = 30
+MAX_NOTIFICATIONS_PAGE_SIZE = 100
+
 @notification_bp.route('/all-notifications')
 @login_required
 def all_notifications():
     """Display all notifications for the current user"""
     username = session.get('username')
     
-    # Get all notifications (both read and unread, with no limit)
-    notifications = db.notifications_collection.find(
-        {'username': username}, 
-        {'_id': 0}
-    ).sort('timestamp', -1)
+    # Render the first page only; older notifications are loaded on scroll
+    # through /notifications/list using the returned cursor
+    page = db.get_user_notifications_page(username, NOTIFICATIONS_PAGE_SIZE, include_read=True)
     
     # Format timestamps
     formatted_notifications = []
-    for notification in notifications:
+    for notification in page['notifications']:
         notification['time_ago'] = format_datetime(notification.get('timestamp'), 'timeago')
         notification['formatted_date'] = format_datetime(notification.get('timestamp'))
         formatted_notifications.append(notification)
@@ -179,28 +198,47 @@ def all_notifications():
     return render_template(
         'all_notifications.html',
         notifications=formatted_notifications,
+        next_cursor=page['next_cursor'],
+        page_size=NOTIFICATIONS_PAGE_SIZE,
         unread_count=db.get_unread_notification_count(username)
     )
 
 @notification_bp.route('/notifications/list')
 @login_required
 def list_notifications():
-    """Get a list of notifications for the current user"""
-    user_id = session.get('user_id')
-    limit = request.args.get('limit', 5, type=int)
-    notifications = db.get_user_notifications(user_id, limit=limit)
+    """
+    Get a page of notifications for the current user
     
-    # Format the date for each notification
-    for notification in notifications:
-        created_at = notification.get('created_at', datetime.now())
-        notification['formatted_date'] = created_at.strftime('%B %d, %Y at %I:%M %p')
+    Query parameters:
+        limit (int): Page size (max 100)
+        include_read (bool): Whether to include read notifications
+        after (str): Cursor from `next_cursor`, returns older notifications
+        before (str): Cursor from `prev_cursor`, returns newer notifications
+    """
+    username = session.get('username')
+    limit = max(1, min(request.args.get('limit', 5, type=int), MAX_NOTIFICATIONS_PAGE_SIZE))
+    include_read = request.args.get('include_read', 'false').lower() == 'true'
+    
+    page = db.get_user_notifications_page(
+        username,
+        limit=limit,
+        include_read=include_read,
+        after=request.args.get('after'),
+        before=request.args.get('before')
+    )
     
-    # Count unread notifications
-    unread_count = db.get_unread_notification_count(user_id)
+    # Format the date for each notification
+    notifications = []
+    for notification in page['notifications']:
+        data = serialize_notification(notification)
+        data['formatted_date'] = format_datetime(notification.get('timestamp'))
+        notifications.append(data)
     
     return jsonify({
         'notifications': notifications,
-        'unread_count': unread_count
+        'next_cursor': page['next_cursor'],
+        'prev_cursor': page['prev_cursor'],
+        'unread_count': db.get_unread_notification_count(username)
     })
 
 @notification_bp.route('/notifications/mark_read/<notification_id>', methods=['POST'])
@@ -348,24 +386,8 @@ def push_real_time_notification(username, notification):
         username (str): Username to notify
         notification (dict): Notification data
     """
-    # Add any needed processing to the notification
-    if 'timestamp' in notification:
-        # Add time_ago field
-        from datetime import datetime
-        timestamp = datetime.fromisoformat(notification['timestamp'])
-        now = datetime.now()
-        delta = now - timestamp
-        
-        if delta.days > 0:
-            notification['time_ago'] = f"{delta.days} day{'s' if delta.days != 1 else ''} ago"
-        elif delta.seconds >= 3600:
-            hours = delta.seconds // 3600
-            notification['time_ago'] = f"{hours} hour{'s' if hours != 1 else ''} ago"
-        elif delta.seconds >= 60:
-            minutes = delta.seconds // 60
-            notification['time_ago'] = f"{minutes} minute{'s' if minutes != 1 else ''} ago"
-        else:
-            notification['time_ago'] = "just now"
+    # Add time_ago and make the payload JSON-safe for the SSE stream
+    notification = serialize_notification(notification)
     
     # Use the new function that handles usernames
     return send_notification_by_username(username, notification)
@@ -406,7 +428,7 @@ def send_app_refresh_notification(app_id, refresh_type):
             'app_id': app_id,
             'app_name': app.get('name', 'Unknown App'),
             'refresh_type': refresh_type,
-            'timestamp': datetime.now().isoformat()
+            'timestamp': to_iso(db.utc_now())
         }
         
         # Send notification to user's queue by username
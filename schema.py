@@ -0,0 +1,100 @@
+"""
+Timestamp schema for stored documents.
+
+All timestamps are stored as native BSON dates holding naive UTC datetimes
+(the form pymongo returns them in), so MongoDB can sort, range-query and
+TTL-expire them. Values are converted at the edges: documents going into the
+database pass through to_document, and JSON responses render datetimes as
+ISO 8601 strings with a `Z` suffix through json_default.
+
+Older documents hold ISO strings written with datetime.now() in server local
+time; parse_timestamp reads those, and migrate_timestamps.py rewrites them.
+"""
+
+from datetime import datetime, timezone
+
+# Datetime fields of each collection; dotted names are nested fields
+DATETIME_FIELDS = {
+    'apps': ['upload_date', 'creation_date'],
+    'app_versions': ['upload_date'],
+    'files': ['upload_date'],
+    'builds': ['start_time', 'end_time', 'app_info.upload_date'],
+    'comments': ['timestamp'],
+    'notifications': ['timestamp', 'read_at']
+}
+
+def utc_now():
+    """Current time as a naive UTC datetime"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def parse_timestamp(value):
+    """
+    Convert a stored or submitted timestamp into a naive UTC datetime
+
+    Args:
+        value (datetime or str): A datetime (naive values are taken to be UTC)
+            or an ISO string (naive strings are taken to be server local time,
+            as written by datetime.now().isoformat())
+
+    Returns:
+        datetime or None: The UTC datetime, or None if it can't be parsed
+    """
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            return value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+
+    if not isinstance(value, str) or not value:
+        return None
+
+    try:
+        dt = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+
+    # Naive local time converts through astimezone as well
+    return dt.astimezone(timezone.utc).replace(tzinfo=None)
+
+def to_document(collection, data):
+    """
+    Convert the datetime fields of a document or update about to be written
+
+    Strings are parsed into datetimes; values that can't be parsed are left
+    unchanged. The input isn't modified.
+
+    Args:
+        collection (str): Collection name (a key of DATETIME_FIELDS)
+        data (dict): Document or $set fields
+
+    Returns:
+        dict: A copy with UTC datetimes
+    """
+    result = dict(data)
+    for field in DATETIME_FIELDS.get(collection, []):
+        path = field.split('.')
+        container = result
+        for key in path[:-1]:
+            if not isinstance(container.get(key), dict):
+                container = None
+                break
+            container[key] = dict(container[key])
+            container = container[key]
+        if container is None or container.get(path[-1]) is None:
+            continue
+
+        converted = parse_timestamp(container[path[-1]])
+        if converted is not None:
+            container[path[-1]] = converted
+    return result
+
+def to_iso(value):
+    """Render a stored UTC datetime as an ISO 8601 string ending in Z"""
+    if isinstance(value, datetime):
+        return parse_timestamp(value).isoformat() + 'Z'
+    return value
+
+def json_default(value):
+    """JSON encoder fallback: datetimes as ISO 8601 UTC strings, other BSON values as strings"""
+    if isinstance(value, datetime):
+        return to_iso(value)
+    return str(value)
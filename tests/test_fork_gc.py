@@ -0,0 +1,232 @@
+"""Tests for fork_gc against a stub GitHub API"""
+
+import json
+import types
+import threading
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+import pytest
+import mongomock
+
+import database as db
+import fork_gc
+from utils import github_utils
+
+OWNER = 'builder'
+PAGE_SIZE = 2
+
+class StubGitHub:
+    """The parts of the GitHub API used by the fork garbage collector"""
+
+    def __init__(self):
+        self.repos = []
+        self.deleted = []
+        self.failing = set()
+        self.tokens = set()
+
+    def add_repo(self, name, description, age):
+        created_at = db.utc_now() - age
+        self.repos.append({
+            'name': name,
+            'owner': {'login': OWNER},
+            'description': description,
+            'created_at': created_at.strftime('%Y-%m-%dT%H:%M:%SZ')
+        })
+
+    def names(self):
+        return {repo['name'] for repo in self.repos}
+
+    def handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def reply(self, status, body=None, headers=None):
+                data = json.dumps(body).encode('utf-8') if body is not None else b''
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                stub.tokens.add(self.headers.get('Authorization'))
+                url = urlsplit(self.path)
+                if url.path == '/user':
+                    return self.reply(200, {'login': OWNER})
+                if url.path == '/user/repos':
+                    # Pages of PAGE_SIZE repositories, linked like GitHub's
+                    page = int(parse_qs(url.query).get('page', ['1'])[0])
+                    repos = stub.repos[(page - 1) * PAGE_SIZE:page * PAGE_SIZE]
+                    headers = {}
+                    if page * PAGE_SIZE < len(stub.repos):
+                        base = f"http://{self.headers['Host']}/user/repos"
+                        headers['Link'] = f'<{base}?per_page={PAGE_SIZE}&page={page + 1}>; rel="next"'
+                    return self.reply(200, repos, headers)
+                self.reply(404, {'message': 'Not Found'})
+
+            def do_DELETE(self):
+                stub.tokens.add(self.headers.get('Authorization'))
+                parts = urlsplit(self.path).path.strip('/').split('/')
+                if len(parts) != 3 or parts[0] != 'repos':
+                    return self.reply(404, {'message': 'Not Found'})
+                name = parts[2]
+                if name in stub.failing:
+                    return self.reply(500, {'message': 'Server Error'})
+                if name not in stub.names():
+                    return self.reply(404, {'message': 'Not Found'})
+                stub.repos = [repo for repo in stub.repos if repo['name'] != name]
+                stub.deleted.append(name)
+                self.reply(204)
+
+        return Handler
+
+@pytest.fixture
+def github(monkeypatch):
+    stub = StubGitHub()
+    server = ThreadingHTTPServer(('127.0.0.1', 0), stub.handler())
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    monkeypatch.setattr(github_utils, 'GITHUB_API_URL', f"http://127.0.0.1:{server.server_port}")
+    monkeypatch.setattr(github_utils, 'GITHUB_API_TOKEN', 'test-token')
+    yield stub
+
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def builds(monkeypatch):
+    collection = mongomock.MongoClient().db.builds
+    monkeypatch.setattr(db, 'builds_collection', collection)
+    return collection
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(fork_gc, 'time', types.SimpleNamespace(sleep=sleeps.append))
+    return sleeps
+
+OLD = timedelta(days=1)
+YOUNG = timedelta(minutes=5)
+
+def add_build(github, builds, build_id, status, listed=True, age=OLD):
+    """Record a build and, if listed, its fork on GitHub"""
+    repo = f"app-dist-build-{build_id[:8]}"
+    if listed:
+        github.add_repo(repo, 'Temporary fork of example/app for build', age)
+    builds.insert_one({'id': build_id, 'status': status, 'fork_info': {'owner': OWNER, 'repo': repo}})
+    return repo
+
+def test_list_build_forks_skips_other_repositories(github):
+    github.add_repo('website', None, OLD)
+    github.add_repo('app-dist-build-1111aaaa', 'Temporary fork of example/app for build', OLD)
+    github.add_repo('notes', 'My notes', OLD)
+    github.add_repo('copy', 'A Temporary fork of something else', OLD)
+    github.add_repo('app-dist-build-2222bbbb', 'Temporary fork of example/other for build', YOUNG)
+
+    owner, forks = github_utils.list_build_forks()
+
+    assert owner == OWNER
+    assert [fork['repo'] for fork in forks] == ['app-dist-build-1111aaaa', 'app-dist-build-2222bbbb']
+    assert all(fork['owner'] == OWNER for fork in forks)
+    assert forks[0]['created_at'] < db.utc_now() - timedelta(hours=23)
+    assert github.tokens == {'token test-token'}
+
+def test_collect_forks_deletes_only_orphans(github, builds, sleeps):
+    failed = add_build(github, builds, '1111aaaa-failed', 'failed')
+    cancelled = add_build(github, builds, '2222bbbb-cancelled', 'cancelled')
+    completed = add_build(github, builds, '3333cccc-completed', 'completed')
+    running = add_build(github, builds, '4444dddd-running', 'in_progress')
+    builds.insert_one({'id': '5555eeee-queued', 'status': 'queued'})
+    young = add_build(github, builds, '6666ffff-young', 'failed', age=YOUNG)
+    github.add_repo('app-dist-build-77770000', 'Temporary fork of example/app for build', OLD)
+    github.add_repo('app-dist-build-5555eeee', 'Temporary fork of example/app for build', OLD)
+    github.add_repo('app-dist-build-88881111', 'Temporary fork of example/app for build', YOUNG)
+    github.add_repo('website', None, OLD)
+    github.add_repo('production-app', 'Production app, not a temporary fork', OLD)
+
+    result = fork_gc.collect_forks(batch_size=10)
+
+    # Unrecorded forks are orphans unless young or named after a queued or running build
+    assert sorted(github.deleted) == sorted([failed, cancelled, 'app-dist-build-77770000'])
+    assert github.names() == {completed, running, young, 'app-dist-build-5555eeee',
+                              'app-dist-build-88881111', 'website', 'production-app'}
+    assert result == {'listed': 8, 'orphaned': 3, 'deleted': 3, 'failed': 0, 'marked': 2}
+    assert len(sleeps) == 2
+
+    cleaned = {build['id'] for build in builds.find({'fork_cleaned': True})}
+    assert cleaned == {'1111aaaa-failed', '2222bbbb-cancelled'}
+
+def test_collect_forks_deletes_forks_of_successful_builds_with_auto_cleanup(github, builds, sleeps, monkeypatch):
+    completed = add_build(github, builds, '3333cccc-completed', 'completed')
+
+    assert fork_gc.collect_forks()['deleted'] == 0
+    assert github.deleted == []
+
+    monkeypatch.setattr(fork_gc, 'AUTO_CLEANUP_FORKS', True)
+    assert fork_gc.collect_forks()['deleted'] == 1
+    assert github.deleted == [completed]
+    assert builds.find_one({'id': '3333cccc-completed'})['fork_cleaned'] is True
+
+def test_collect_forks_deletes_at_most_a_batch_per_run(github, builds, sleeps):
+    for index in range(5):
+        add_build(github, builds, f"{index}000aaaa-failed", 'failed')
+
+    result = fork_gc.collect_forks(batch_size=2)
+
+    assert result['orphaned'] == 5
+    assert result['deleted'] == 2
+    assert len(github.deleted) == 2
+    assert sleeps == [fork_gc.FORK_GC_DELETE_DELAY_SECONDS]
+    assert builds.count_documents({'fork_cleaned': True}) == 2
+
+    result = fork_gc.collect_forks(batch_size=2)
+    assert (result['orphaned'], result['deleted']) == (3, 2)
+    result = fork_gc.collect_forks(batch_size=2)
+    assert (result['orphaned'], result['deleted']) == (1, 1)
+    assert len(github.deleted) == 5
+    assert builds.count_documents({'fork_cleaned': True}) == 5
+
+def test_collect_forks_marks_reclaimed_builds_in_one_update(github, builds, sleeps, monkeypatch):
+    deleted = add_build(github, builds, '1111aaaa-failed', 'failed')
+    add_build(github, builds, '2222bbbb-failed', 'failed', listed=False)
+    add_build(github, builds, '3333cccc-completed', 'completed', listed=False)
+    broken = add_build(github, builds, '4444dddd-failed', 'failed')
+    add_build(github, builds, '5555eeee-running', 'in_progress', listed=False)
+    github.failing.add(broken)
+
+    updates = []
+    update_many = builds.update_many
+
+    def record_update_many(*args, **kwargs):
+        updates.append(args)
+        return update_many(*args, **kwargs)
+
+    monkeypatch.setattr(builds, 'update_many', record_update_many)
+
+    result = fork_gc.collect_forks()
+
+    # Forks already gone from GitHub are recorded along with the ones deleted now,
+    # but not the fork whose deletion failed nor the running build's
+    assert github.deleted == [deleted]
+    assert result['failed'] == 1
+    assert result['marked'] == 3
+    assert len(updates) == 1
+    assert {build['id'] for build in builds.find({'fork_cleaned': True})} == {
+        '1111aaaa-failed', '2222bbbb-failed', '3333cccc-completed'}
+    assert builds.find_one({'id': '1111aaaa-failed'})['rev'] == 1
+
+def test_collect_forks_without_token_does_nothing(github, builds, monkeypatch):
+    monkeypatch.setattr(github_utils, 'GITHUB_API_TOKEN', '')
+    github.add_repo('app-dist-build-77770000', 'Temporary fork of example/app for build', OLD)
+
+    assert 'skipped' in fork_gc.collect_forks()
+    assert github.tokens == set()
+    assert github.deleted == []
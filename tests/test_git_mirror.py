@@ -0,0 +1,121 @@
+"""Tests for utils.git_mirror against local file:// repositories"""
+
+import os
+import subprocess
+
+import pytest
+
+from utils import git_mirror
+
+def git(*args, cwd=None):
+    result = subprocess.run(
+        ['git', '-c', 'user.name=Test', '-c', 'user.email=test@example.com', *args],
+        cwd=cwd, capture_output=True, text=True, check=True
+    )
+    return result.stdout.strip()
+
+def commit(work, name, content):
+    with open(os.path.join(work, name), 'w') as f:
+        f.write(content)
+    git('add', name, cwd=work)
+    git('commit', '--quiet', '-m', f"Add {name}", cwd=work)
+    git('push', '--quiet', 'origin', 'HEAD:refs/heads/main', cwd=work)
+    return git('rev-parse', 'HEAD', cwd=work)
+
+@pytest.fixture
+def source(tmp_path):
+    """A bare repository with three commits on main, and a working copy to add more"""
+    bare = tmp_path / 'source.git'
+    work = tmp_path / 'work'
+    git('init', '--quiet', '--bare', '--initial-branch=main', str(bare))
+    git('clone', '--quiet', str(bare), str(work))
+    for index in range(3):
+        commit(work, f"file{index}.txt", f"content {index}\n")
+    return {'url': f"file://{bare}", 'work': str(work)}
+
+@pytest.fixture
+def cache_dir(tmp_path):
+    return str(tmp_path / 'mirrors')
+
+def test_checkout_is_shallow(source, cache_dir, tmp_path):
+    dest = str(tmp_path / 'checkout')
+    ok, head = git_mirror.checkout(source['url'], 'main', dest, cache_dir=cache_dir, depth=1)
+
+    assert ok, head
+    assert head == git('rev-parse', 'HEAD', cwd=source['work'])
+    assert git('rev-list', '--count', 'HEAD', cwd=dest) == '1'
+    assert sorted(name for name in os.listdir(dest) if name != '.git') == ['file0.txt', 'file1.txt', 'file2.txt']
+
+def test_checkout_with_full_depth(source, cache_dir, tmp_path):
+    dest = str(tmp_path / 'checkout')
+    ok, _ = git_mirror.checkout(source['url'], 'main', dest, cache_dir=cache_dir, depth=0)
+
+    assert ok
+    assert git('rev-list', '--count', 'HEAD', cwd=dest) == '3'
+
+def test_update_mirror_fetches_new_commits(source, cache_dir, tmp_path):
+    ok, first = git_mirror.checkout(source['url'], 'main', str(tmp_path / 'first'), cache_dir=cache_dir)
+    assert ok
+
+    new_head = commit(source['work'], 'file3.txt', "content 3\n")
+    path = git_mirror.update_mirror(source['url'], 'main', cache_dir=cache_dir)
+
+    assert path == git_mirror.mirror_path(source['url'], cache_dir)
+    assert git('rev-parse', 'refs/heads/main', cwd=path) == new_head != first
+
+    ok, head = git_mirror.checkout(source['url'], 'main', str(tmp_path / 'second'), cache_dir=cache_dir)
+    assert (ok, head) == (True, new_head)
+    assert os.path.exists(tmp_path / 'second' / 'file3.txt')
+
+def test_urls_differing_by_suffix_share_a_mirror(cache_dir):
+    assert git_mirror.mirror_path('file:///repos/app.git/', cache_dir) == git_mirror.mirror_path('file:///repos/app', cache_dir)
+    assert git_mirror.mirror_path('file:///repos/app', cache_dir) != git_mirror.mirror_path('file:///repos/other', cache_dir)
+
+def test_checkout_of_missing_branch_fails(source, cache_dir, tmp_path):
+    ok, error = git_mirror.checkout(source['url'], 'no-such-branch', str(tmp_path / 'checkout'), cache_dir=cache_dir)
+
+    assert not ok
+    assert 'no-such-branch' in error
+
+def make_mirrors(cache_dir, count):
+    """Create empty mirrors, least recently used first"""
+    paths = []
+    for index in range(count):
+        path = git_mirror.mirror_path(f"file:///repos/app{index}", cache_dir)
+        os.makedirs(path)
+        with open(os.path.join(path, 'pack'), 'wb') as f:
+            f.write(b'x' * 1000)
+        os.utime(path, (1000000 + index, 1000000 + index))
+        paths.append(path)
+    return paths
+
+def test_evict_mirrors_removes_least_recently_used_over_budget(cache_dir):
+    paths = make_mirrors(cache_dir, 4)
+
+    removed = git_mirror.evict_mirrors(cache_dir, max_bytes=2500)
+
+    assert removed == paths[:2]
+    assert [mirror['path'] for mirror in git_mirror.get_mirrors(cache_dir)] == paths[2:]
+
+def test_evict_mirrors_removes_least_recently_used_over_count(cache_dir):
+    paths = make_mirrors(cache_dir, 4)
+
+    removed = git_mirror.evict_mirrors(cache_dir, max_bytes=10 ** 9, max_count=1)
+
+    assert removed == paths[:3]
+    assert [mirror['path'] for mirror in git_mirror.get_mirrors(cache_dir)] == paths[3:]
+
+def test_evict_mirrors_skips_locked_and_kept_mirrors(cache_dir):
+    paths = make_mirrors(cache_dir, 4)
+
+    with git_mirror._mirror_lock(paths[0]) as locked:
+        assert locked
+        removed = git_mirror.evict_mirrors(cache_dir, max_bytes=0, keep=paths[1])
+
+    assert removed == paths[2:]
+    assert [mirror['path'] for mirror in git_mirror.get_mirrors(cache_dir)] == paths[:2]
+
+def test_evict_mirrors_within_budget_keeps_everything(cache_dir):
+    make_mirrors(cache_dir, 2)
+
+    assert git_mirror.evict_mirrors(cache_dir, max_bytes=10 ** 9) == []
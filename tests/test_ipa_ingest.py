@@ -0,0 +1,100 @@
+"""Tests for queueing IPA uploads and cleaning up after failed ingests"""
+
+import io
+
+import pytest
+import mongomock
+
+import database as db
+import models
+
+IPA = b'PK\x03\x04 not really an IPA, but stored the same way' * 100
+
+@pytest.fixture
+def database(monkeypatch):
+    """Point every collection and listing handle at an in-memory database"""
+    mock = mongomock.MongoClient().db
+    for name in dir(db):
+        if name.endswith('_collection'):
+            monkeypatch.setattr(db, name, mock[name[:-len('_collection')]])
+    for name in dir(db):
+        if name.endswith('_listing'):
+            monkeypatch.setattr(db, name, getattr(db, name[:-len('_listing')] + '_collection'))
+    db.jobs_collection.create_index('dedup_key', unique=True, sparse=True)
+    return mock
+
+def upload(username, app_id=None):
+    return models.queue_ipa_ingest(io.BytesIO(IPA), 'Sample.ipa', username, app_id=app_id)
+
+def test_same_user_uploading_again_gets_the_existing_job(database):
+    job, created = upload('alice')
+    again, created_again = upload('alice')
+
+    assert created and not created_again
+    assert again['id'] == job['id']
+    # The duplicate's file is dropped, the job keeps its own
+    assert db.files_collection.count_documents({}) == 1
+    assert db.get_file(job['payload']['file_id'], include_data=False)
+
+def test_users_uploading_the_same_ipa_get_their_own_apps(database):
+    alice_job, _ = upload('alice')
+    db.jobs_collection.update_one({'id': alice_job['id']}, {'$set': {'status': 'completed'}})
+
+    bob_job, created = upload('bob')
+
+    assert created
+    assert bob_job['id'] != alice_job['id']
+    assert bob_job['created_by'] == 'bob'
+    assert bob_job['payload']['new_app_id'] != alice_job['payload']['new_app_id']
+    assert db.get_file(bob_job['payload']['file_id'], include_data=False)
+    assert db.get_file(alice_job['payload']['file_id'], include_data=False)
+
+def test_versions_of_the_same_app_share_the_upload(database):
+    alice_job, _ = upload('alice', app_id='app-1')
+    bob_job, created = upload('bob', app_id='app-1')
+
+    assert not created
+    assert bob_job['id'] == alice_job['id']
+
+def test_failed_ingest_deletes_unused_file(database):
+    job, _ = upload('alice')
+    payload = job['payload']
+
+    models.ingest_ipa_failed(payload, 'Invalid IPA')
+
+    assert db.get_file(payload['file_id'], include_data=False) is None
+    notification = db.notifications_collection.find_one({'username': 'alice'})
+    assert 'Invalid IPA' in notification['content']
+
+def test_failed_ingest_keeps_file_of_saved_app(database):
+    job, _ = upload('alice')
+    payload = job['payload']
+
+    # The last attempt failed after saving the app and its first version
+    db.save_app({'id': payload['new_app_id'], 'name': 'Sample', 'file_id': payload['file_id']})
+    db.save_app_version(payload['new_app_id'], {
+        'version': '1.0',
+        'build_number': '1',
+        'filename': 'Sample.ipa',
+        'file_id': payload['file_id'],
+        'upload_date': db.utc_now()
+    })
+
+    models.ingest_ipa_failed(payload, 'Could not save the provisioning profile')
+
+    assert db.get_file(payload['file_id'], include_data=False)
+
+def test_failed_ingest_keeps_file_of_saved_version(database):
+    job, _ = upload('alice', app_id='app-1')
+    payload = job['payload']
+    db.save_app_version('app-1', {
+        'version': '2.0',
+        'build_number': '7',
+        'filename': 'Sample.ipa',
+        'file_id': payload['file_id'],
+        'upload_date': db.utc_now()
+    })
+
+    models.ingest_ipa_failed(payload, 'Could not save the provisioning profile')
+
+    assert db.get_file(payload['file_id'], include_data=False)
@@ -0,0 +1,76 @@
+"""Golden-file tests for the workflow files pushed to build repositories"""
+
+import os
+
+import pytest
+
+from utils import workflow
+
+GOLDEN_DIR = os.path.join(os.path.dirname(__file__), 'golden')
+
+# Regenerate the golden files instead of comparing against them
+UPDATE_GOLDEN = os.environ.get('UPDATE_GOLDEN', '') == '1'
+
+BUILD = {
+    'build_id': '0f1e2d3c-4b5a-6978-8796-a5b4c3d2e1f0',
+    'app_name': "  Jane's  Sample/App ",
+    'build_config': 'Release',
+    'team_id': 'ABCDE12345'
+}
+
+@pytest.fixture
+def settings(monkeypatch):
+    """Render with fixed deployment settings, whatever the environment says"""
+    monkeypatch.setattr(workflow, 'BUILD_WORKFLOW_TEMPLATE', os.path.join(
+        os.path.dirname(workflow.__file__), 'workflow_templates', 'ios_build.yml'))
+    monkeypatch.setattr(workflow, 'BUILD_WORKFLOW_REF', '')
+    monkeypatch.setattr(workflow, 'BUILD_RUNNER', 'macos-14')
+    monkeypatch.setattr(workflow, 'BUILD_XCODE_VERSION', '15.4')
+    workflow.get_workflow.cache_clear()
+    yield
+    workflow.get_workflow.cache_clear()
+
+def check_golden(name, content):
+    path = os.path.join(GOLDEN_DIR, name)
+    if UPDATE_GOLDEN:
+        os.makedirs(GOLDEN_DIR, exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(content.encode('utf-8'))
+    with open(path, 'rb') as f:
+        assert content.encode('utf-8') == f.read(), f"{name} differs from tests/golden/{name}"
+
+def test_build_files_match_golden(settings):
+    files = workflow.get_build_files(**BUILD)
+
+    assert set(files) == {workflow.WORKFLOW_PATH, workflow.BUILD_CONFIG_PATH}
+    check_golden('ios_build.yml', files[workflow.WORKFLOW_PATH])
+    check_golden('build-config.json', files[workflow.BUILD_CONFIG_PATH])
+    workflow.validate_workflow(files[workflow.WORKFLOW_PATH])
+
+def test_caller_matches_golden(settings, monkeypatch):
+    monkeypatch.setattr(workflow, 'BUILD_WORKFLOW_REF', 'my-org/build-workflows/.github/workflows/ios_build.yml@v1')
+    workflow.get_workflow.cache_clear()
+
+    files = workflow.get_build_files(**BUILD)
+
+    check_golden('caller.yml', files[workflow.WORKFLOW_PATH])
+    workflow.validate_workflow(files[workflow.WORKFLOW_PATH])
+
+def test_workflow_is_rendered_once(settings):
+    first = workflow.get_build_files(**BUILD)
+    second = workflow.get_build_files(**dict(BUILD, build_id='11111111-2222-3333-4444-555555555555'))
+
+    assert first[workflow.WORKFLOW_PATH] is second[workflow.WORKFLOW_PATH]
+    assert first[workflow.BUILD_CONFIG_PATH] != second[workflow.BUILD_CONFIG_PATH]
+    assert workflow.get_workflow.cache_info().misses == 1
+
+@pytest.mark.parametrize('content', [
+    'name: [unclosed',
+    '- just a list',
+    'on: push\njobs:\n  build:\n    runs-on: macos-latest\n    steps: [{run: make}]\n',
+    'on: workflow_dispatch\njobs: {}\n',
+    'on: workflow_dispatch\njobs:\n  build:\n    runs-on: macos-latest\n',
+])
+def test_invalid_workflows_are_rejected(content):
+    with pytest.raises(ValueError):
+        workflow.validate_workflow(content)
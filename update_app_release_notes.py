@@ -49,8 +49,7 @@ def update_app_release_notes(app_id, release_notes=None):
 Thank you for using {app_name}!"""
         
         # Update the app with the release notes
-        app['release_notes'] = release_notes
-        db.save_app(app)
+        db.update_app(app_id, {'release_notes': release_notes})
         
         print(f"\nSuccessfully updated release notes for {app_name}")
         print("Check the app_detail page to see how the release notes are displayed")
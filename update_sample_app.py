@@ -48,20 +48,17 @@ Released on {current_date}
 """
     
     # Update the app
-    app['release_notes'] = release_notes
-    db.save_app(app)
+    db.update_app(app_id, {'release_notes': release_notes})
     
     # Also add release notes to versions
     updated_versions = 0
-    for version in app.get('versions', []):
+    for version in db.get_all_app_versions(app_id):
         if not version.get('release_notes'):
             version_num = version.get('version', 'Unknown')
-            version['release_notes'] = f"Release notes for version {version_num}"
+            db.update_app_version(version['id'], {'release_notes': f"Release notes for version {version_num}"})
             updated_versions += 1
     
-    # If versions were updated, save the app again
     if updated_versions > 0:
-        db.save_app(app)
         print(f"Updated {updated_versions} version(s) with release notes")
     
     print(f"Successfully updated app {app_name} with release notes")
@@ -100,8 +97,7 @@ else:
     release_notes += f"Released on {current_date}"
     
     # Update the app
-    app['release_notes'] = release_notes
-    db.save_app(app)
+    db.update_app(app_id, {'release_notes': release_notes})
     
     print(f"Successfully updated app {app_name} with release notes")
     print(f"App ID: {app_id}")
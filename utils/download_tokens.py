@@ -0,0 +1,60 @@
+import os
+import hmac
+import time
+import base64
+import hashlib
+
+# Key used to sign download URLs (falls back to the Flask secret key)
+DOWNLOAD_TOKEN_SECRET = os.environ.get('DOWNLOAD_TOKEN_SECRET') or os.environ.get('SECRET_KEY', 'development-key')
+
+# How long a signed download URL stays valid (seconds)
+DOWNLOAD_TOKEN_TTL = int(os.environ.get('DOWNLOAD_TOKEN_TTL', '3600'))
+
+def _signature(app_id, file_id, expires):
+    message = f"{app_id}:{file_id}:{expires}".encode('utf-8')
+    digest = hmac.new(DOWNLOAD_TOKEN_SECRET.encode('utf-8'), message, hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b'=').decode('ascii')
+
+def create_download_token(app_id, file_id, ttl=None):
+    """
+    Create a signed token that allows downloading one app file without a session
+
+    The expiry is rounded up to a quarter of the TTL so everyone installing the
+    same build in that window gets the same URL, which keeps it cacheable.
+
+    Args:
+        app_id (str): The app ID
+        file_id (str): The version's file ID
+        ttl (int, optional): Minimum lifetime in seconds (defaults to DOWNLOAD_TOKEN_TTL)
+
+    Returns:
+        str: Token in the form "<expires>.<signature>"
+    """
+    ttl = ttl or DOWNLOAD_TOKEN_TTL
+    step = max(ttl // 4, 1)
+    expires = (int(time.time()) // step + 1) * step + ttl
+    return f"{expires}.{_signature(app_id, file_id, expires)}"
+
+def verify_download_token(token, app_id, file_id):
+    """
+    Check a download token without touching the database
+
+    Args:
+        token (str): Token from create_download_token
+        app_id (str): The app ID from the URL
+        file_id (str): The file ID from the URL
+
+    Returns:
+        int or None: Seconds until the token expires, or None if it is invalid or expired
+    """
+    try:
+        expires, signature = token.split('.', 1)
+        expires = int(expires)
+    except (AttributeError, ValueError):
+        return None
+
+    if not hmac.compare_digest(signature, _signature(app_id, file_id, expires)):
+        return None
+
+    remaining = expires - int(time.time())
+    return remaining if remaining > 0 else None
@@ -1,12 +1,15 @@
 import os
 import uuid
 import zipfile
+import posixpath
 import tempfile
-import plistlib
 import base64
-from PIL import Image
+import hashlib
 import io
-from datetime import datetime, timedelta
+from schema import utc_now, parse_timestamp
+
+# plistlib, PIL and the provisioning parser are imported in the functions that
+# use them, so web processes that never read an IPA start faster
 
 # File handling utilities
 ALLOWED_EXTENSIONS = {'ipa'}
@@ -45,18 +48,29 @@ def load_default_icon():
     return "data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mNkYAAAAAYAAjCB0C8AAAAASUVORK5CYII="
 
 def extract_app_info(file_data, filename):
-    """Extract app information from IPA file data"""
+    """
+    Extract app information from IPA file data
+    
+    file_data may be bytes or a seekable file object; file objects are read in
+    place instead of being copied to a temporary file.
+    """
     app_id = str(uuid.uuid4())
     file_id = str(uuid.uuid4())
     
-    # Create a temporary file to work with the data
-    with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-        temp_file.write(file_data)
-        temp_path = temp_file.name
+    # Import here to keep app startup fast
+    import plistlib
+    from PIL import Image
+    
+    temp_path = None
+    if isinstance(file_data, (bytes, bytearray)):
+        # Create a temporary file to work with the data
+        with tempfile.NamedTemporaryFile(delete=False) as temp_file:
+            temp_file.write(file_data)
+            temp_path = temp_file.name
     
     try:
         # Extract info from IPA file
-        with zipfile.ZipFile(temp_path, 'r') as ipa:
+        with zipfile.ZipFile(temp_path or file_data, 'r') as ipa:
             # Find Info.plist path
             plist_path = None
             for f in ipa.namelist():
@@ -118,14 +132,15 @@ def extract_app_info(file_data, filename):
                         'build_number': build_number,
                         'filename': filename,
                         'icon': icon_data_url,
-                        'upload_date': datetime.now().isoformat()
+                        'upload_date': utc_now(),
+                        'provisioning': extract_provisioning_profile(ipa, plist_path)
                     }
     except Exception as e:
         # In case of issues extracting info
         pass
     finally:
         # Clean up temporary file
-        if os.path.exists(temp_path):
+        if temp_path and os.path.exists(temp_path):
             os.unlink(temp_path)
     
     # Default response if anything fails
@@ -138,19 +153,50 @@ def extract_app_info(file_data, filename):
         'build_number': 'unknown',
         'filename': filename,
         'icon': load_default_icon(),
-        'upload_date': datetime.now().isoformat()
+        'upload_date': utc_now()
     }
 
+def extract_provisioning_profile(ipa, plist_path):
+    """
+    Read the embedded provisioning profile of the app bundle containing plist_path
+    
+    Args:
+        ipa (ZipFile): The opened IPA
+        plist_path (str): Path of the app's Info.plist inside the IPA
+        
+    Returns:
+        dict or None: As returned by parse_mobileprovision, or None if the app
+                      has no readable profile
+    """
+    # Import here to keep app startup fast
+    from utils.provisioning import parse_mobileprovision
+    
+    profile_path = posixpath.join(posixpath.dirname(plist_path), 'embedded.mobileprovision')
+    try:
+        with ipa.open(profile_path) as profile_file:
+            return parse_mobileprovision(profile_file.read())
+    except (KeyError, ValueError):
+        return None
+
 def extract_minimal_app_info(file_data, filename, build_id):
-    """Extract minimal app information from IPA file data for builds"""
-    # Create a temporary file to work with the data
-    with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-        temp_file.write(file_data)
-        temp_path = temp_file.name
+    """
+    Extract minimal app information from IPA file data for builds
+    
+    file_data may be bytes or a seekable file object, as for extract_app_info.
+    """
+    # Import here to keep app startup fast
+    import plistlib
+    
+    temp_path = None
+    if isinstance(file_data, (bytes, bytearray)):
+        # Create a temporary file to work with the data
+        with tempfile.NamedTemporaryFile(delete=False) as temp_file:
+            temp_file.write(file_data)
+            temp_path = temp_file.name
     
     try:
         # Extract info from IPA file
-        with zipfile.ZipFile(temp_path, 'r') as ipa:
+        with zipfile.ZipFile(temp_path or file_data, 'r') as ipa:
             # Find Info.plist path
             plist_path = None
             for f in ipa.namelist():
@@ -171,7 +217,7 @@ def extract_minimal_app_info(file_data, filename, build_id):
         pass
     finally:
         # Clean up temporary file
-        if os.path.exists(temp_path):
+        if temp_path and os.path.exists(temp_path):
             os.unlink(temp_path)
     
     # Default response if anything fails
@@ -187,7 +233,8 @@ def format_datetime(dt_string, format_type='standard'):
     Format a datetime string in a readable format
     
     Args:
-        dt_string (str): ISO format datetime string
+        dt_string (datetime or str): A stored UTC datetime, or a legacy ISO
+            string in server local time
         format_type (str): 'standard' for DD-MMM-YYYY, 'timeago' for relative time
         
     Returns:
@@ -195,17 +242,16 @@ def format_datetime(dt_string, format_type='standard'):
     """
     if not dt_string:
         return "Unknown"
-        
-    try:
-        dt = datetime.fromisoformat(dt_string)
-    except (ValueError, TypeError):
+    
+    dt = parse_timestamp(dt_string)
+    if dt is None:
         return dt_string
+    now = utc_now()
         
     if format_type == 'standard':
         return dt.strftime('%d-%b-%Y')  # DD-MMM-YYYY
         
     elif format_type == 'timeago':
-        now = datetime.now()
         diff = now - dt
         
         seconds = diff.total_seconds()
@@ -231,4 +277,35 @@ def format_datetime(dt_string, format_type='standard'):
             years = int(seconds // 31536000)
             return f"{years} year{'s' if years != 1 else ''} ago"
     
-    return dt_string  # Default fallback 
\ No newline at end of file
+    return dt_string  # Default fallback 
+def render_install_manifest(app, download_url):
+    """
+    Render the OTA install manifest (plist) for an app
+    
+    Args:
+        app (dict): App document with bundle_id, version and name
+        download_url (str): Absolute URL of the IPA
+        
+    Returns:
+        tuple: (plist bytes, etag)
+    """
+    manifest = {
+        'items': [{
+            'assets': [{
+                'kind': 'software-package',
+                'url': download_url
+            }],
+            'metadata': {
+                'bundle-identifier': app.get('bundle_id', 'com.example.app'),
+                'bundle-version': app.get('version', '1.0'),
+                'kind': 'software',
+                'title': app.get('name', 'App')
+            }
+        }]
+    }
+    
+    # Import here to keep app startup fast
+    import plistlib
+    
+    data = plistlib.dumps(manifest)
+    return data, hashlib.sha256(data).hexdigest()[:32]
@@ -0,0 +1,228 @@
+"""
+Local cache of source repositories for GitHub builds.
+
+Each repository URL gets a bare mirror under GIT_MIRROR_DIR. A build fetches
+only the branch it needs into the mirror (after the first build, that is just
+the commits and objects added since) and then makes a shallow working copy
+from the mirror, instead of cloning the whole repository over the network.
+
+Mirrors are locked per repository while they are fetched or copied, so
+concurrent builds of the same repository (in threads or processes on the same
+host) don't fetch into it at the same time. When the cache grows past
+GIT_MIRROR_MAX_BYTES or GIT_MIRROR_MAX_COUNT mirrors, the least recently used
+mirrors are removed.
+
+Any URL git understands works, including file:// URLs of local repositories.
+"""
+
+import os
+import fcntl
+import shutil
+import hashlib
+import logging
+import tempfile
+import subprocess
+from contextlib import contextmanager
+
+# Directory holding the mirrors
+GIT_MIRROR_DIR = os.environ.get('GIT_MIRROR_DIR') or os.path.join(tempfile.gettempdir(), 'app-dist-git-mirrors')
+
+# Disk budget for all mirrors; least recently used mirrors are removed beyond it
+GIT_MIRROR_MAX_BYTES = int(os.environ.get('GIT_MIRROR_MAX_BYTES', str(10 * 1024 ** 3)))
+
+# Most mirrors kept, whatever their size (0 for no limit)
+GIT_MIRROR_MAX_COUNT = int(os.environ.get('GIT_MIRROR_MAX_COUNT', '0'))
+
+# Commits fetched per branch into a mirror (0 fetches the whole history)
+GIT_FETCH_DEPTH = int(os.environ.get('GIT_FETCH_DEPTH', '50'))
+
+# Commits in a build's working copy
+GIT_WORKTREE_DEPTH = int(os.environ.get('GIT_WORKTREE_DEPTH', '1'))
+
+# Seconds a single git command may take
+GIT_TIMEOUT_SECONDS = int(os.environ.get('GIT_TIMEOUT_SECONDS', '1800'))
+
+class GitError(Exception):
+    """A git command failed or timed out"""
+
+def _git(args, cwd=None):
+    """Run a git command and return its stdout"""
+    try:
+        result = subprocess.run(['git'] + args, cwd=cwd, capture_output=True, text=True,
+                                timeout=GIT_TIMEOUT_SECONDS)
+    except subprocess.TimeoutExpired:
+        raise GitError(f"git {args[0]} timed out after {GIT_TIMEOUT_SECONDS}s")
+    if result.returncode != 0:
+        raise GitError(result.stderr.strip() or f"git {args[0]} failed")
+    return result.stdout
+
+def mirror_path(repo_url, cache_dir=None):
+    """
+    Get the directory of a repository's mirror
+
+    URLs that only differ by a trailing slash or .git share a mirror.
+    """
+    normalized = repo_url.strip().rstrip('/')
+    if normalized.endswith('.git'):
+        normalized = normalized[:-4]
+    key = hashlib.sha256(normalized.encode('utf-8')).hexdigest()[:24]
+    return os.path.join(cache_dir or GIT_MIRROR_DIR, f"{key}.git")
+
+@contextmanager
+def _mirror_lock(path, blocking=True):
+    """
+    Hold a mirror's exclusive lock (a flock on a file next to the mirror)
+
+    Yields:
+        bool: False if blocking is off and another build holds the lock
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.lock', 'a') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def update_mirror(repo_url, branch, cache_dir=None, depth=None):
+    """
+    Fetch a branch into the repository's mirror, creating the mirror if needed
+
+    The caller must hold the mirror's lock.
+
+    Args:
+        repo_url (str): Source repository URL
+        branch (str): Branch to fetch
+        cache_dir (str, optional): Directory of the mirrors (defaults to GIT_MIRROR_DIR)
+        depth (int, optional): Commits to fetch (defaults to GIT_FETCH_DEPTH, 0 for all)
+
+    Raises:
+        GitError: If git failed
+
+    Returns:
+        str: The mirror's path
+    """
+    path = mirror_path(repo_url, cache_dir)
+    depth = GIT_FETCH_DEPTH if depth is None else depth
+
+    if not os.path.isdir(os.path.join(path, 'objects')):
+        shutil.rmtree(path, ignore_errors=True)
+        _git(['init', '--bare', '--quiet', path])
+
+    args = ['fetch', '--quiet', '--no-tags', '--force']
+    if depth > 0:
+        args.append(f'--depth={depth}')
+    _git(args + [repo_url, f'+refs/heads/{branch}:refs/heads/{branch}'], cwd=path)
+
+    # Marks the mirror as recently used
+    os.utime(path)
+    return path
+
+def checkout(repo_url, branch, dest, cache_dir=None, depth=None):
+    """
+    Make a shallow working copy of a branch through the local mirror
+
+    Args:
+        repo_url (str): Source repository URL
+        branch (str): Branch to check out
+        dest (str): Empty or missing directory for the working copy
+        cache_dir (str, optional): Directory of the mirrors (defaults to GIT_MIRROR_DIR)
+        depth (int, optional): Commits in the working copy (defaults to GIT_WORKTREE_DEPTH, 0 for all)
+
+    Returns:
+        tuple: (success, commit checked out or error message)
+    """
+    path = mirror_path(repo_url, cache_dir)
+    depth = GIT_WORKTREE_DEPTH if depth is None else depth
+
+    try:
+        with _mirror_lock(path):
+            update_mirror(repo_url, branch, cache_dir)
+
+            # A file:// URL makes git copy objects over its transport, which honors --depth
+            args = ['clone', '--quiet', '--single-branch', '--branch', branch]
+            if depth > 0:
+                args.append(f'--depth={depth}')
+            _git(args + ['file://' + os.path.abspath(path), dest])
+
+        commit = _git(['rev-parse', 'HEAD'], cwd=dest).strip()
+    except GitError as e:
+        return False, str(e)
+
+    try:
+        evict_mirrors(cache_dir, keep=path)
+    except Exception as e:
+        logging.error(f"Error evicting git mirrors: {str(e)}")
+    return True, commit
+
+def _directory_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+def get_mirrors(cache_dir=None):
+    """
+    List the cached mirrors, least recently used first
+
+    Returns:
+        list: Dicts with path, size (bytes) and last_used (timestamp)
+    """
+    cache_dir = cache_dir or GIT_MIRROR_DIR
+    if not os.path.isdir(cache_dir):
+        return []
+
+    mirrors = []
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if name.endswith('.git') and os.path.isdir(path):
+            mirrors.append({'path': path, 'size': _directory_size(path), 'last_used': os.path.getmtime(path)})
+    return sorted(mirrors, key=lambda mirror: mirror['last_used'])
+
+def evict_mirrors(cache_dir=None, max_bytes=None, keep=None, max_count=None):
+    """
+    Remove least recently used mirrors until the cache fits its disk budget and mirror count
+
+    Mirrors in use by another build are skipped.
+
+    Args:
+        cache_dir (str, optional): Directory of the mirrors (defaults to GIT_MIRROR_DIR)
+        max_bytes (int, optional): Disk budget (defaults to GIT_MIRROR_MAX_BYTES)
+        keep (str, optional): Path of a mirror that is never removed
+        max_count (int, optional): Most mirrors kept, 0 for no limit (defaults to GIT_MIRROR_MAX_COUNT)
+
+    Returns:
+        list: Paths of the removed mirrors
+    """
+    max_bytes = GIT_MIRROR_MAX_BYTES if max_bytes is None else max_bytes
+    max_count = GIT_MIRROR_MAX_COUNT if max_count is None else max_count
+    mirrors = get_mirrors(cache_dir)
+    total = sum(mirror['size'] for mirror in mirrors)
+    count = len(mirrors)
+
+    removed = []
+    for mirror in mirrors:
+        if total <= max_bytes and (not max_count or count <= max_count):
+            break
+        if mirror['path'] == keep:
+            continue
+        with _mirror_lock(mirror['path'], blocking=False) as locked:
+            if not locked:
+                continue
+            shutil.rmtree(mirror['path'], ignore_errors=True)
+        total -= mirror['size']
+        count -= 1
+        removed.append(mirror['path'])
+
+    if removed:
+        logging.info(f"Removed {len(removed)} git mirrors to stay under {max_bytes} bytes"
+                     f"{f' and {max_count} mirrors' if max_count else ''}")
+    return removed
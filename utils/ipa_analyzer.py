@@ -0,0 +1,81 @@
+import os
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from utils.file_utils import extract_app_info, extract_minimal_app_info
+
+# Worker processes used for IPA analysis (defaults to the number of CPU cores)
+IPA_ANALYZER_PROCESSES = int(os.environ.get('IPA_ANALYZER_PROCESSES', '0')) or os.cpu_count() or 1
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _analyze(path, filename, build_id=None):
+    """Runs in a worker process: read the IPA from disk and extract its info"""
+    with open(path, 'rb') as ipa_file:
+        if build_id is not None:
+            return extract_minimal_app_info(ipa_file, filename, build_id)
+        return extract_app_info(ipa_file, filename)
+
+def get_executor(processes=None):
+    """
+    Get the shared process pool, starting it on first use
+
+    Worker processes are spawned rather than forked: the jobs process has job
+    threads, pymongo monitor threads and logging locks, and a fork taken while
+    another thread holds a lock can deadlock the child. Workers only import
+    the extractors in utils.file_utils.
+
+    Args:
+        processes (int, optional): Pool size (defaults to IPA_ANALYZER_PROCESSES)
+
+    Returns:
+        ProcessPoolExecutor: The pool
+    """
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=processes or IPA_ANALYZER_PROCESSES,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _executor
+
+def shutdown():
+    """Stop the process pool (a new one is started on the next analysis)"""
+    global _executor
+
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
+
+def analyze_ipa(path, filename, build_id=None):
+    """
+    Extract app information from an IPA on disk in a worker process
+
+    Only the path crosses the process boundary; the worker reads the file
+    itself, so the IPA bytes are never pickled.
+
+    Args:
+        path (str): Path of the IPA file
+        filename (str): Original filename (used for defaults)
+        build_id (str, optional): Extract the minimal build info instead of full app info
+
+    Returns:
+        dict: As returned by extract_app_info or extract_minimal_app_info
+    """
+    global _executor
+
+    try:
+        return get_executor().submit(_analyze, path, filename, build_id).result()
+    except BrokenProcessPool:
+        # A worker died (e.g. killed for memory); start a fresh pool and retry once
+        logging.warning("IPA analyzer pool broke, restarting it")
+        with _executor_lock:
+            _executor = None
+        return get_executor().submit(_analyze, path, filename, build_id).result()
@@ -0,0 +1,193 @@
+from datetime import datetime, timezone
+
+# OIDs (DER-encoded contents) used in the CMS envelope of a .mobileprovision
+OID_SIGNED_DATA = bytes.fromhex('2a864886f70d010702')  # 1.2.840.113549.1.7.2
+OID_DATA = bytes.fromhex('2a864886f70d010701')  # 1.2.840.113549.1.7.1
+
+TAG_OCTET_STRING = 0x04
+TAG_OID = 0x06
+TAG_SEQUENCE = 0x30
+TAG_CONTEXT_0 = 0xa0
+
+def _read_element(data, offset):
+    """
+    Read one BER/DER element
+
+    Args:
+        data (bytes): Encoded data
+        offset (int): Offset of the element's tag
+
+    Returns:
+        tuple: (tag, content start, content end, element end); the content end
+               is None for indefinite-length elements, whose children must be
+               read until the end-of-contents marker
+    """
+    if offset + 2 > len(data):
+        raise ValueError("Truncated ASN.1 element")
+
+    tag = data[offset]
+    if tag & 0x1f == 0x1f:
+        raise ValueError("High tag numbers are not supported")
+
+    length = data[offset + 1]
+    offset += 2
+
+    if length == 0x80:
+        # Indefinite length (BER); only valid for constructed elements
+        return tag, offset, None, None
+
+    if length & 0x80:
+        count = length & 0x7f
+        if count == 0 or count > 4 or offset + count > len(data):
+            raise ValueError("Invalid ASN.1 length")
+        length = int.from_bytes(data[offset:offset + count], 'big')
+        offset += count
+
+    end = offset + length
+    if end > len(data):
+        raise ValueError("Truncated ASN.1 element")
+    return tag, offset, end, end
+
+def _children(data, start, end):
+    """
+    Read the child elements of a constructed element
+
+    Returns:
+        list: (tag, content start, content end) tuples
+    """
+    children = []
+    offset = start
+    while offset < end:
+        tag, content_start, content_end, element_end = _read_element(data, offset)
+        if content_end is None:
+            # Indefinite length: it ends at its end-of-contents marker
+            content_end = _skip_to_end_of_contents(data, content_start)
+            element_end = content_end + 2
+        children.append((tag, content_start, content_end))
+        offset = element_end
+    return children
+
+def _skip_to_end_of_contents(data, start):
+    """Find the offset of the end-of-contents marker closing an indefinite-length element"""
+    offset = start
+    while data[offset:offset + 2] != b'\x00\x00':
+        _, content_start, content_end, element_end = _read_element(data, offset)
+        if content_end is None:
+            element_end = _skip_to_end_of_contents(data, content_start) + 2
+        offset = element_end
+        if offset >= len(data):
+            raise ValueError("Unterminated indefinite-length element")
+    return offset
+
+def _octet_string(data, tag, start, end):
+    """Get the value of an OCTET STRING, joining the pieces of a constructed (BER) one"""
+    if tag == TAG_OCTET_STRING:
+        return data[start:end]
+    if tag == TAG_OCTET_STRING | 0x20:
+        return b''.join(_octet_string(data, *child) for child in _children(data, start, end))
+    raise ValueError("Expected an OCTET STRING")
+
+def extract_profile_plist(data):
+    """
+    Get the plist payload out of a .mobileprovision CMS (PKCS#7 SignedData) envelope
+
+    The signature isn't verified; the profile is only read to show what it allows.
+
+    Args:
+        data (bytes): Content of embedded.mobileprovision
+
+    Returns:
+        bytes: The XML plist
+    """
+    tag, start, end, _ = _read_element(data, 0)
+    if end is None:
+        end = _skip_to_end_of_contents(data, start)
+    if tag != TAG_SEQUENCE:
+        raise ValueError("Not a CMS ContentInfo")
+
+    # ContentInfo ::= SEQUENCE { contentType OID, [0] EXPLICIT SignedData }
+    content_info = _children(data, start, end)
+    if len(content_info) < 2 or content_info[0][0] != TAG_OID or data[content_info[0][1]:content_info[0][2]] != OID_SIGNED_DATA:
+        raise ValueError("Not CMS SignedData")
+
+    signed_data_wrapper = _children(data, content_info[1][1], content_info[1][2])
+    if not signed_data_wrapper or signed_data_wrapper[0][0] != TAG_SEQUENCE:
+        raise ValueError("Malformed SignedData")
+
+    # SignedData ::= SEQUENCE { version, digestAlgorithms, encapContentInfo, ... }
+    signed_data = _children(data, signed_data_wrapper[0][1], signed_data_wrapper[0][2])
+    if len(signed_data) < 3 or signed_data[2][0] != TAG_SEQUENCE:
+        raise ValueError("Malformed SignedData")
+
+    # EncapsulatedContentInfo ::= SEQUENCE { eContentType OID, [0] EXPLICIT OCTET STRING }
+    encap = _children(data, signed_data[2][1], signed_data[2][2])
+    if len(encap) < 2 or data[encap[0][1]:encap[0][2]] != OID_DATA or encap[1][0] != TAG_CONTEXT_0:
+        raise ValueError("Profile has no embedded content")
+
+    content = _children(data, encap[1][1], encap[1][2])
+    if not content:
+        raise ValueError("Profile has no embedded content")
+    return _octet_string(data, *content[0])
+
+def _utc(value):
+    """Convert a plist date to a naive UTC datetime"""
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def parse_mobileprovision(data):
+    """
+    Parse an embedded.mobileprovision file
+
+    Args:
+        data (bytes): Content of the profile
+
+    Raises:
+        ValueError: If the data isn't a readable provisioning profile
+
+    Returns:
+        dict: name, uuid, team_id, team_name, profile_type, creation_date,
+              expiration_date, all_devices, devices (upper-cased UDIDs) and
+              entitlements (list of {'key', 'value'}, since entitlement names
+              contain dots)
+    """
+    # Import here to keep app startup fast
+    import plistlib
+
+    plist_data = extract_profile_plist(data)
+    try:
+        profile = plistlib.loads(plist_data)
+    except Exception as e:
+        raise ValueError(f"Invalid provisioning profile plist: {str(e)}")
+
+    entitlements = profile.get('Entitlements', {})
+    devices = profile.get('ProvisionedDevices') or []
+    all_devices = bool(profile.get('ProvisionsAllDevices'))
+
+    if all_devices:
+        profile_type = 'enterprise'
+    elif devices:
+        profile_type = 'development' if entitlements.get('get-task-allow') else 'ad-hoc'
+    else:
+        profile_type = 'app-store'
+
+    team_ids = profile.get('TeamIdentifier') or []
+
+    return {
+        'name': profile.get('Name'),
+        'uuid': profile.get('UUID'),
+        'team_id': team_ids[0] if team_ids else None,
+        'team_name': profile.get('TeamName'),
+        'profile_type': profile_type,
+        'creation_date': _utc(profile.get('CreationDate')),
+        'expiration_date': _utc(profile.get('ExpirationDate')),
+        'all_devices': all_devices,
+        'devices': sorted({udid.strip().upper() for udid in devices if isinstance(udid, str)}),
+        'entitlements': [{'key': key, 'value': value} for key, value in sorted(entitlements.items())]
+    }
+
+def normalize_udid(udid):
+    """Normalize a device UDID for comparison with a profile's device list"""
+    return (udid or '').strip().upper()
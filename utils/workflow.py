@@ -0,0 +1,175 @@
+"""
+GitHub Actions workflow pushed to build repositories.
+
+The workflow is the same for every build: it is rendered from a template once
+per process, with deployment settings only (runner, Xcode version), and
+validated once per template version. What differs between builds (build ID,
+app name, configuration, team) goes into a small JSON config file that the
+workflow reads when it runs.
+
+With BUILD_WORKFLOW_REF set, build repositories don't get a copy of the
+workflow at all but a few lines calling it as a reusable workflow (the
+template declares workflow_call, so the rendered file can be committed to a
+shared repository as is).
+
+Templates use Jinja with [[ ]] for values, [% %] for statements and [# #] for
+comments, so GitHub's ${{ }} expressions and shell code need no escaping;
+shell tests in templates must use [ ] rather than [[ ]]. The `yaml` filter
+quotes a value as a YAML scalar.
+"""
+
+import os
+import json
+import hashlib
+import functools
+
+# Workflow template rendered for build repositories
+BUILD_WORKFLOW_TEMPLATE = os.environ.get('BUILD_WORKFLOW_TEMPLATE') or os.path.join(
+    os.path.dirname(__file__), 'workflow_templates', 'ios_build.yml')
+
+# Reusable workflow called by build repositories instead of a copy of the workflow,
+# e.g. my-org/build-workflows/.github/workflows/ios_build.yml@v1
+BUILD_WORKFLOW_REF = os.environ.get('BUILD_WORKFLOW_REF', '')
+
+# Runner and Xcode version of the build job
+BUILD_RUNNER = os.environ.get('BUILD_RUNNER', 'macos-latest')
+BUILD_XCODE_VERSION = os.environ.get('BUILD_XCODE_VERSION', 'latest-stable')
+
+# Paths of the workflow and the build config in build repositories
+WORKFLOW_PATH = '.github/workflows/build.yml'
+BUILD_CONFIG_PATH = '.github/build-config.json'
+
+CALLER_TEMPLATE = os.path.join(os.path.dirname(__file__), 'workflow_templates', 'caller.yml')
+
+@functools.lru_cache(maxsize=None)
+def compile_template(path):
+    """
+    Load and compile a workflow template (once per process and path)
+
+    Args:
+        path (str): Path of the template file
+
+    Returns:
+        jinja2.Template: The compiled template
+    """
+    # Import here to keep app startup fast
+    from jinja2 import Environment, StrictUndefined
+
+    environment = Environment(
+        variable_start_string='[[', variable_end_string=']]',
+        block_start_string='[%', block_end_string='%]',
+        comment_start_string='[#', comment_end_string='#]',
+        undefined=StrictUndefined,
+        keep_trailing_newline=True,
+        autoescape=False
+    )
+    environment.filters['yaml'] = json.dumps  # A JSON string is a valid YAML double-quoted scalar
+
+    with open(path, 'r') as f:
+        return environment.from_string(f.read())
+
+@functools.lru_cache(maxsize=None)
+def validate_workflow(content):
+    """
+    Check that rendered workflow YAML is a dispatchable GitHub Actions workflow
+
+    Results are cached, so each template version is only parsed once.
+
+    Args:
+        content (str): Workflow YAML
+
+    Raises:
+        ValueError: If the workflow is invalid
+    """
+    # Import here to keep app startup fast
+    import yaml
+
+    try:
+        workflow = yaml.safe_load(content)
+    except yaml.YAMLError as e:
+        raise ValueError(f"Workflow is not valid YAML: {str(e)}")
+
+    if not isinstance(workflow, dict):
+        raise ValueError("Workflow must be a mapping")
+
+    # YAML 1.1 reads the `on` key as a boolean
+    triggers = workflow.get('on', workflow.get(True))
+    if isinstance(triggers, str):
+        triggers = [triggers]
+    if not triggers or 'workflow_dispatch' not in triggers:
+        raise ValueError("Workflow must be triggered by workflow_dispatch")
+
+    jobs = workflow.get('jobs')
+    if not isinstance(jobs, dict) or not jobs:
+        raise ValueError("Workflow has no jobs")
+    for name, job in jobs.items():
+        if not isinstance(job, dict) or not (job.get('uses') or (job.get('runs-on') and job.get('steps'))):
+            raise ValueError(f"Job {name} needs runs-on and steps, or uses")
+
+@functools.lru_cache(maxsize=None)
+def get_workflow():
+    """
+    Render and validate the workflow pushed to build repositories
+
+    Returns:
+        tuple: (version, content) where version identifies the rendered workflow
+
+    Raises:
+        ValueError: If the rendered workflow is invalid
+    """
+    if BUILD_WORKFLOW_REF:
+        content = compile_template(CALLER_TEMPLATE).render(workflow_ref=BUILD_WORKFLOW_REF)
+    else:
+        content = compile_template(BUILD_WORKFLOW_TEMPLATE).render(
+            runs_on=BUILD_RUNNER,
+            xcode_version=BUILD_XCODE_VERSION,
+            config_path=BUILD_CONFIG_PATH
+        )
+
+    validate_workflow(content)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()[:12], content
+
+def render_build_config(build_id, app_name, build_config, team_id, version=None):
+    """
+    Render the config file the workflow reads for one build
+
+    Args:
+        build_id (str): The build ID
+        app_name (str): The name of the app
+        build_config (str): The build configuration (Debug/Release)
+        team_id (str): Apple Developer Team ID
+        version (str, optional): Version of the workflow that reads the config
+
+    Returns:
+        str: JSON config
+    """
+    # Values end up in $GITHUB_ENV, one per line
+    app_name = ' '.join(app_name.split())
+    config = {
+        'build_id': build_id,
+        'app_name': app_name,
+        'safe_app_name': app_name.replace(' ', '_').replace("'", '').replace('"', '').replace('/', '_'),
+        'build_config': build_config,
+        'team_id': team_id or '',
+        'workflow_version': version
+    }
+    return json.dumps(config, indent=2) + '\n'
+
+def get_build_files(build_id, app_name, build_config, team_id):
+    """
+    Get the workflow files to add to a build repository
+
+    Args:
+        build_id (str): The build ID
+        app_name (str): The name of the app
+        build_config (str): The build configuration (Debug/Release)
+        team_id (str): Apple Developer Team ID
+
+    Returns:
+        dict: Path in the repository -> file content
+    """
+    version, workflow = get_workflow()
+    return {
+        WORKFLOW_PATH: workflow,
+        BUILD_CONFIG_PATH: render_build_config(build_id, app_name, build_config, team_id, version)
+    }
@@ -0,0 +1,78 @@
+import struct
+import zipfile
+
+# ZIP members whose compressed data is at least this large are stored as
+# separate blobs; smaller members stay in the surrounding segments
+MIN_DELTA_MEMBER_SIZE = 16 * 1024
+
+LOCAL_HEADER_SIGNATURE = b'PK\x03\x04'
+LOCAL_HEADER_SIZE = 30
+
+def split_zip(fileobj, min_member_size=MIN_DELTA_MEMBER_SIZE):
+    """
+    Split a ZIP file into segments that can be stored and shared separately
+
+    The compressed data of each large member becomes its own segment. The bytes
+    around them (local headers, small members, central directory) become
+    'raw' segments. Concatenating all segments in order gives back the
+    original file byte for byte. Member data is never decompressed or
+    recompressed, so code signatures stay valid.
+
+    Args:
+        fileobj: Seekable binary file object with the ZIP
+        min_member_size (int): Smallest compressed size stored as its own segment
+
+    Raises:
+        zipfile.BadZipFile: If the file isn't a readable ZIP
+
+    Returns:
+        list: (kind, offset, length) tuples in file order, kind being 'raw' or 'member'
+    """
+    fileobj.seek(0, 2)
+    file_size = fileobj.tell()
+
+    members = []
+    with zipfile.ZipFile(fileobj) as archive:
+        for info in archive.infolist():
+            if info.compress_size < min_member_size:
+                continue
+
+            fileobj.seek(info.header_offset)
+            header = fileobj.read(LOCAL_HEADER_SIZE)
+            if len(header) != LOCAL_HEADER_SIZE or header[:4] != LOCAL_HEADER_SIGNATURE:
+                raise zipfile.BadZipFile(f"Bad local header for {info.filename}")
+            name_length, extra_length = struct.unpack('<HH', header[26:30])
+            data_start = info.header_offset + LOCAL_HEADER_SIZE + name_length + extra_length
+            members.append((data_start, info.compress_size))
+
+    segments = []
+    position = 0
+    for data_start, length in sorted(members):
+        if data_start < position or data_start + length > file_size:
+            # Overlapping or truncated entries can't be split safely
+            raise zipfile.BadZipFile("ZIP members overlap")
+        if data_start > position:
+            segments.append(('raw', position, data_start - position))
+        segments.append(('member', data_start, length))
+        position = data_start + length
+
+    if position < file_size:
+        segments.append(('raw', position, file_size - position))
+
+    return segments
+
+def iter_segment(fileobj, offset, length, chunk_size=1024 * 1024):
+    """
+    Read one segment in chunks
+
+    Yields:
+        bytes: Up to chunk_size bytes of the segment
+    """
+    fileobj.seek(offset)
+    remaining = length
+    while remaining > 0:
+        chunk = fileobj.read(min(chunk_size, remaining))
+        if not chunk:
+            raise EOFError("File ended inside a segment")
+        remaining -= len(chunk)
+        yield chunk
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# Background worker process
+#
+# Runs the jobs queued by the web app: IPA and build ingestion, GitHub build
+# orchestration and monitoring, fork cleanup, comment notification fan-out and
+# the periodic sweeps (abandoned builds, expired notifications). Jobs live in
+# the `jobs` collection, so any number of worker processes can run side by
+# side; each claimed job is leased to one worker and handed out again if that
+# worker dies. Web processes don't need BACKGROUND_ROLES when a worker runs.
+#
+# Stop with SIGTERM or Ctrl-C: running jobs get --grace seconds to finish.
+#
+# Usage:
+#   python3 ./worker.py [--workers 4] [--type run_build --type monitor_build] [--no-scheduler] [--grace 60]
+
+import argparse
+import logging
+import signal
+import sys
+import threading
+
+import database as db
+import jobs
+import models  # Registers the job handlers and periodic jobs
+
+def main(args):
+    """Start the workers and wait for a stop signal"""
+    unknown = [job_type for job_type in (args.type or []) if job_type not in jobs.get_job_types()]
+    if unknown:
+        print(f"Error: unknown job type(s): {', '.join(unknown)}")
+        sys.exit(1)
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+
+    db.bootstrap()
+    count = jobs.start_workers(args.workers, args.type)
+    if not args.no_scheduler:
+        jobs.start_scheduler()
+
+    print(f"Started {count} workers for {', '.join(args.type) if args.type else 'all job types'}"
+          f"{'' if args.no_scheduler else ' and the scheduler'}")
+
+    while not stop.wait(1):
+        pass
+
+    print("Stopping, waiting for running jobs...")
+    if not jobs.stop_workers(args.grace):
+        print("Some jobs are still running; they will be picked up again once their lease expires")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run background jobs')
+    parser.add_argument('--workers', type=int, default=jobs.JOB_WORKERS, help='Number of worker threads')
+    parser.add_argument('--type', action='append', help='Only run jobs of this type (can be repeated)')
+    parser.add_argument('--no-scheduler', action='store_true',
+                        help="Don't queue periodic jobs or recover expired leases in this process")
+    parser.add_argument('--grace', type=float, default=60, help='Seconds running jobs get to finish on shutdown')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+
+    try:
+        main(args)
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        sys.exit(1)